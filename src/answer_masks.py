@@ -0,0 +1,74 @@
+"""Answers stored as bitmasks of the bubbles that were filled in.
+
+Bit `i` of an answer's mask is set if choice `i` (`A` is 0) was filled in, so
+"A" is `0b1`, "[A|C]" is `0b101` and an empty answer is 0. Answers are only
+turned into text when they are exported, so the formatting options can change
+without reading the pages again.
+"""
+
+import typing as tp
+
+import numpy as np
+
+import alphabet
+
+# The most choices a question can have. The last bit is kept for `OTHER`.
+MAX_CHOICES = 7
+# The mask of answer text that isn't any formatted answer, ie text in a CSV file
+# that wasn't written by this program. Only `parse_answers` gives this.
+OTHER = 0x80
+
+
+def _format(mask: int, multi_answers_as_f: bool) -> str:
+    letters = [
+        alphabet.letters[choice] for choice in range(MAX_CHOICES)
+        if mask & (1 << choice)
+    ]
+    if len(letters) <= 1:
+        return "".join(letters)
+    if multi_answers_as_f:
+        return "F"
+    return f"[{'|'.join(letters)}]"
+
+
+# The text of every mask, indexed by `[multi_answers_as_f][mask]`.
+_FORMATTED = [[_format(mask, multi_answers_as_f) for mask in range(OTHER)]
+              for multi_answers_as_f in (False, True)]
+
+# The mask of every answer text that `format_answers` can give. Where one text
+# could mean more than one mask ("F" is also what multiple answers become), the
+# single letter wins.
+_PARSED = {text: mask for mask, text in enumerate(_FORMATTED[False])}
+_PARSED.update({
+    text: mask
+    for mask, text in enumerate(_FORMATTED[True]) if text not in _PARSED
+})
+
+
+def from_filled(questions: np.ndarray, choices: np.ndarray,
+                num_questions: int) -> np.ndarray:
+    """Build the masks of `num_questions` answers from the question and choice
+    index of every filled bubble."""
+    if choices.size and choices.max() >= MAX_CHOICES:
+        raise ValueError(
+            f"Questions can't have more than {MAX_CHOICES} choices.")
+    masks = np.zeros(num_questions, np.uint8)
+    np.bitwise_or.at(masks, questions,
+                     np.left_shift(1, choices).astype(np.uint8))
+    return masks
+
+
+def format_answers(masks: tp.Iterable[int],
+                   multi_answers_as_f: bool) -> tp.List[str]:
+    """Format answers as text, ie "A", "" when nothing was filled in, and
+    "[A|C]" (or "F" if `multi_answers_as_f`) when more than one was."""
+    formatted = _FORMATTED[multi_answers_as_f]
+    return [formatted[mask] for mask in np.asarray(masks).tolist()]
+
+
+def parse_answers(answers: tp.Iterable[str]) -> np.ndarray:
+    """Get the masks of formatted answers. Any text that `format_answers` can't
+    give is `OTHER`, so two `OTHER` answers can only be compared by their text.
+    """
+    return np.array([_PARSED.get(answer, OTHER) for answer in answers],
+                    np.uint8)
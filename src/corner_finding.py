@@ -1,3 +1,7 @@
+import collections
+import enum
+import json
+import math
 import typing
 
 import numpy as np
@@ -9,6 +13,29 @@ import math_utils
 import pathlib
 
 
+# How far from square the corners of the marks can be when searching for them in
+# a shrunk image, as a fraction of a right angle.
+COARSE_ANGLE_TOLERANCE = 0.4
+# Contours that can't be corner marks. The marks cover roughly 0.02-0.09% of
+# the page and are about as tall as they are wide. They also fill at least 80%
+# of their convex hull, but so do the bubbles, so checking solidity costs more
+# than it saves and is left off.
+DEFAULT_CONTOUR_FILTER = image_utils.ContourFilter(min_area=1e-4,
+                                                   max_area=5e-3,
+                                                   max_aspect_ratio=2,
+                                                   drop_nested=True)
+# Slack, in radians, added to the angle tolerance when checking all the shapes
+# at once. The batched angles differ very slightly from `calc_corner_angles`,
+# and this makes sure that never rejects a shape that the full check accepts.
+_BATCH_ANGLE_SLACK = 1e-3
+# How far, in grid units, the corner marks are looked for around where they
+# were on recent pages. The marks are two units across, which leaves a couple of
+# units for the page to shift in the scanner.
+PRIOR_SEARCH_UNITS = 4
+# How many recent pages the expected corner positions are taken from.
+DEFAULT_PRIOR_PAGES = 8
+
+
 class WrongShapeError(ValueError):
     pass
 
@@ -27,13 +54,16 @@ class LMark():
         unit_length: The estimated grid square unit length that the mark is
             built with.
     """
-    def __init__(self, polygon: geometry_utils.Polygon):
+    def __init__(self,
+                 polygon: geometry_utils.Polygon,
+                 angle_tolerance: float = 0.15):
         """Create a new LMark. If the points don't form a valid LMark, raises a
-        WrongShapeError."""
+        WrongShapeError. `angle_tolerance` is how far each corner can be from
+        square, as a fraction of a right angle."""
         if len(polygon) != 6:
             raise WrongShapeError("Incorrect number of points.")
 
-        if not geometry_utils.all_approx_square(polygon):
+        if not geometry_utils.all_approx_square(polygon, angle_tolerance):
             raise WrongShapeError("Corners are not square.")
 
         clockwise_polygon = geometry_utils.polygon_to_clockwise(polygon)
@@ -70,7 +100,8 @@ class SquareMark:
     """
     def __init__(self,
                  polygon: geometry_utils.Polygon,
-                 target_size: typing.Optional[float] = None):
+                 target_size: typing.Optional[float] = None,
+                 angle_tolerance: float = 0.15):
         """Create a new Square. If the points don't form a valid square, raises
         a WrongShapeError.
 
@@ -80,11 +111,13 @@ class SquareMark:
                 rest of the polygon may be reversed to clockwise.
             target_size: If provided, will check against this size when checking
                 side lengths. Otherwise, it will just make sure they are equal.
+            angle_tolerance: How far each corner can be from square, as a
+                fraction of a right angle.
         """
         if len(polygon) != 4:
             raise WrongShapeError("Incorrect number of points.")
 
-        if not geometry_utils.all_approx_square(polygon):
+        if not geometry_utils.all_approx_square(polygon, angle_tolerance):
             raise WrongShapeError("Corners are not square.")
 
         side_lengths = geometry_utils.calc_side_lengths(polygon)
@@ -102,34 +135,213 @@ class SquareMark:
         self.unit_length = math_utils.mean(side_lengths)
 
 
-def find_corner_marks(image: np.ndarray,
-                      save_path: typing.Optional[pathlib.PurePath] = None
-                      ) -> geometry_utils.Polygon:
+class CornerSearchMethod(enum.Enum):
+    """How the corner marks of a page were found."""
+    PRIOR = "prior"
+    COARSE = "coarse"
+    FULL = "full"
+    # Searching the whole page at full resolution without the contour filter,
+    # for pages where the filter dropped the marks.
+    UNFILTERED = "unfiltered"
+
 
-    all_polygons: typing.List[
-        geometry_utils.Polygon] = image_utils.find_polygons(
-            image, save_path=save_path)
+class CornerLayout():
+    """Where the corners of the grid are on a page, relative to the size of the
+    page, so that it can be compared between pages read at different sizes.
 
+    Members:
+        corners: The `(x, y)` of each grid corner, in CW order starting with the
+            top left, as fractions of the page's width and height.
+        unit_length: The grid unit length of the L mark, as a fraction of the
+            page's width.
+    """
+    corners: np.ndarray
+    unit_length: float
+
+    def __init__(self, corners: np.ndarray, unit_length: float):
+        self.corners = np.asarray(corners, float).reshape(4, 2)
+        self.unit_length = float(unit_length)
+
+    @classmethod
+    def from_page(cls, corners: geometry_utils.Polygon, unit_length: float,
+                  image: np.ndarray) -> "CornerLayout":
+        height, width = image_utils.get_dimensions(image)
+        return cls(
+            np.array([[p.x / width, p.y / height] for p in corners], float),
+            unit_length / width)
+
+    def to_page(
+            self, image: np.ndarray
+    ) -> typing.Tuple[geometry_utils.Polygon, float]:
+        """Get the corners and unit length in the pixel coordinates of
+        `image`."""
+        height, width = image_utils.get_dimensions(image)
+        corners = [
+            geometry_utils.Point(x * width, y * height)
+            for x, y in self.corners.tolist()
+        ]
+        return corners, self.unit_length * width
+
+
+class CornerPriors():
+    """Remembers where the corners were on the last few pages where they were
+    found, to predict where they will be on the next one. Pages fed through the
+    same scanner land in nearly the same place every time."""
+    def __init__(self,
+                 initial: typing.Optional[CornerLayout] = None,
+                 max_pages: int = DEFAULT_PRIOR_PAGES):
+        """`initial` is used as the prediction until a page is recorded, for
+        example one loaded with `load_scanner_profile`."""
+        self._initial = initial
+        self._recent: typing.Deque[CornerLayout] = collections.deque(
+            maxlen=max_pages)
+
+    def record(self, layout: CornerLayout):
+        self._recent.append(layout)
+
+    def predict(self) -> typing.Optional[CornerLayout]:
+        """Get the expected corner layout of the next page: the median of the
+        recent pages, so one page that was scanned askew doesn't throw the
+        prediction off."""
+        if not self._recent:
+            return self._initial
+        return CornerLayout(
+            np.median([layout.corners for layout in self._recent], axis=0),
+            float(np.median([layout.unit_length
+                             for layout in self._recent])))
+
+
+def load_scanner_profile(
+        path: pathlib.Path) -> typing.Optional[CornerLayout]:
+    """Load the corner layout saved by `save_scanner_profile`. Returns None if
+    there is no profile at `path` yet."""
+    try:
+        with open(path, "r") as profile_file:
+            profile = json.load(profile_file)
+    except FileNotFoundError:
+        return None
+    return CornerLayout(profile["corners"], profile["unit_length"])
+
+
+def save_scanner_profile(path: pathlib.Path, layout: CornerLayout):
+    with open(path, "w") as profile_file:
+        json.dump(
+            {
+                "corners": layout.corners.tolist(),
+                "unit_length": layout.unit_length
+            },
+            profile_file,
+            indent=2)
+
+
+class CornerSearchResult(typing.NamedTuple):
+    """The corners of the grid on a page and how they were found."""
+    corners: geometry_utils.Polygon
+    layout: CornerLayout
+    method: CornerSearchMethod
+
+
+class _CornerMarks(typing.NamedTuple):
+    """An L mark, the square marks found where the other three corners of the
+    grid should be, and the basis established by the L."""
+    l_mark: LMark
+    top_right_squares: typing.List[SquareMark]
+    bottom_right_squares: typing.List[SquareMark]
+    bottom_left_squares: typing.List[SquareMark]
+    basis_transformer: geometry_utils.ChangeOfBasisTransformer
+
+
+def _stack_polygons(contours: typing.List[np.ndarray],
+                    num_vertexes: int) -> np.ndarray:
+    """Stack the simplified contours that have `num_vertexes` vertexes into one
+    `(n, num_vertexes, 2)` array, in order. Each polygon is turned clockwise,
+    like `geometry_utils.approx_poly`."""
     # Even though the LMark and SquareMark classes check length, it's faster to
     # filter out the shapes of incorrect length despite the increased time
     # complexity.
-    hexagons: typing.List[geometry_utils.Polygon] = []
-    quadrilaterals: typing.List[geometry_utils.Polygon] = []
-    for poly in all_polygons:
-        if len(poly) == 6:
-            hexagons.append(poly)
-        elif len(poly) == 4:
-            quadrilaterals.append(poly)
-
+    matching = [
+        contour.reshape(-1, 2) for contour in contours
+        if len(contour) == num_vertexes
+    ]
+    if not matching:
+        return np.zeros((0, num_vertexes, 2), np.int32)
+    polygons = np.stack(matching)
+    counterclockwise = geometry_utils.calc_signed_area_array(polygons) < 0
+    polygons[counterclockwise] = polygons[counterclockwise, ::-1]
+    return polygons
+
+
+def _to_polygon(vertexes: np.ndarray) -> geometry_utils.Polygon:
+    return [geometry_utils.Point(x, y) for x, y in vertexes]
+
+
+def _find_approx_square(polygons: np.ndarray,
+                        angle_tolerance: float) -> np.ndarray:
+    """Get the indexes of the polygons whose corners could all be square. This
+    is a quick first pass: the shapes it keeps still have to be checked by
+    `LMark` or `SquareMark`."""
+    angles = geometry_utils.calc_corner_angles_array(polygons)
+    max_error = (angle_tolerance * math.pi / 2) + _BATCH_ANGLE_SLACK
+    return np.flatnonzero(
+        np.all(np.abs(angles - (math.pi / 2)) <= max_error, axis=1))
+
+
+class _CentroidIndex():
+    """A spatial index over the (guessed) centroids of a set of polygons, so
+    that the ones in an area can be found without checking every polygon.
+    Centroids are sorted by x, so a lookup is a binary search and a scan of
+    the matching column."""
+    def __init__(self, polygons: np.ndarray):
+        # Same as `geometry_utils.guess_centroid`
+        centroids = (polygons.max(axis=1) + polygons.min(axis=1)) / 2
+        self._order = np.argsort(centroids[:, 0], kind="stable")
+        self._xs = centroids[self._order, 0]
+        self._ys = centroids[self._order, 1]
+
+    def find_within(self, polygon: geometry_utils.Polygon,
+                    margin: float) -> np.ndarray:
+        """Get the indexes of the centroids inside the bounding box of
+        `polygon`, grown by `margin` on every side."""
+        xs = [p.x for p in polygon]
+        ys = [p.y for p in polygon]
+        start = np.searchsorted(self._xs, min(xs) - margin, side="left")
+        end = np.searchsorted(self._xs, max(xs) + margin, side="right")
+        column = np.arange(start, end)
+        in_rows = (self._ys[column] >= min(ys) - margin) & (
+            self._ys[column] <= max(ys) + margin)
+        return self._order[column[in_rows]]
+
+
+def _match_corner_marks(
+        hexagons: np.ndarray,
+        quadrilaterals: np.ndarray,
+        image: np.ndarray,
+        save_path: typing.Optional[pathlib.PurePath] = None,
+        angle_tolerance: float = 0.15) -> typing.Iterator[_CornerMarks]:
+    """Find every L mark in `hexagons` that has all three square marks in
+    `quadrilaterals` where they are expected, in order. Lazy, so taking just
+    the first match skips checking the rest.
+
+    The shapes are given as stacked arrays (see `_stack_polygons`). All of
+    them are checked for square corners at once, and the squares are indexed
+    by where they are so that each L only checks the squares near where its
+    other marks should be.
+    """
     if save_path:
-        image_utils.draw_polygons(image, hexagons, save_path / "all_hexagons.jpg")
-        image_utils.draw_polygons(image, quadrilaterals, save_path / "all_quadrilaterals.jpg")
+        image_utils.draw_polygons(image, [_to_polygon(h) for h in hexagons],
+                                  save_path / "all_hexagons.jpg")
+        image_utils.draw_polygons(image,
+                                  [_to_polygon(q) for q in quadrilaterals],
+                                  save_path / "all_quadrilaterals.jpg")
+
+    square_indexes = _find_approx_square(quadrilaterals, angle_tolerance)
+    square_index = _CentroidIndex(quadrilaterals[square_indexes])
 
-    for i in range(len(hexagons)):
-        hexagon = hexagons[i]
+    for i in _find_approx_square(hexagons, angle_tolerance):
+        hexagon = _to_polygon(hexagons[i])
 
         try:
-            l_mark = LMark(hexagon)
+            l_mark = LMark(hexagon, angle_tolerance)
         except WrongShapeError:
             continue
 
@@ -153,6 +365,23 @@ def find_corner_marks(image: np.ndarray,
         bottom_left_squares = []
         bottom_right_squares = []
 
+        # Boxes within which corner centroids can be found
+        corner_tolerance_polys_new_basis = [
+            [
+                geometry_utils.Point(x + x_tolerance, y - y_tolerance),
+                geometry_utils.Point(x + x_tolerance, y + y_tolerance),
+                geometry_utils.Point(x - x_tolerance, y + y_tolerance),
+                geometry_utils.Point(x - x_tolerance, y - y_tolerance)
+            ] for [x, y] in [
+                [nominal_to_right_side, 0.5],
+                [nominal_to_right_side, nominal_to_bottom],
+                [0.5, nominal_to_bottom]
+            ]
+        ]
+        corner_tolerance_polys = [
+            basis_transformer.poly_from_basis(p) for p in corner_tolerance_polys_new_basis
+        ]
+
         if save_path:
             # Purely for diagnostic output - save the grid tolerance boxes to a file. This is
             # complicated, but useful for debugging and only is enabled when requested.
@@ -163,22 +392,7 @@ def find_corner_marks(image: np.ndarray,
                 geometry_utils.Point(nominal_to_right_side, nominal_to_bottom),
                 geometry_utils.Point(0.0, nominal_to_bottom)
             ]
-            # Boxes within which corner centroids can be found
-            corner_tolerance_polys_new_basis = [
-                [
-                    geometry_utils.Point(x + x_tolerance, y - y_tolerance),
-                    geometry_utils.Point(x + x_tolerance, y + y_tolerance),
-                    geometry_utils.Point(x - x_tolerance, y + y_tolerance),
-                    geometry_utils.Point(x - x_tolerance, y - y_tolerance)
-                ] for [x, y] in [
-                    [nominal_to_right_side, 0.5],
-                    [nominal_to_right_side, nominal_to_bottom],
-                    [0.5, nominal_to_bottom]
-                ]
-            ]
-            polys = [basis_transformer.poly_from_basis(nominal_poly_new_basis), hexagon] + [
-                basis_transformer.poly_from_basis(p) for p in corner_tolerance_polys_new_basis
-            ]
+            polys = [basis_transformer.poly_from_basis(nominal_poly_new_basis), hexagon] + corner_tolerance_polys
             image_utils.draw_polygons(
                 image,
                 polys,
@@ -186,9 +400,19 @@ def find_corner_marks(image: np.ndarray,
                 thickness=2
             )
 
-        for quadrilateral in quadrilaterals:
+        # Only the squares that are near one of the corner tolerance boxes can
+        # be in it. Checking them in their original order keeps the same
+        # squares first in each list as checking every square would.
+        nearby_squares: typing.Set[int] = set()
+        for tolerance_poly in corner_tolerance_polys:
+            nearby_squares.update(
+                square_index.find_within(tolerance_poly, margin=1).tolist())
+
+        for j in sorted(nearby_squares):
+            quadrilateral = _to_polygon(quadrilaterals[square_indexes[j]])
             try:
-                square = SquareMark(quadrilateral, l_mark.unit_length)
+                square = SquareMark(quadrilateral, l_mark.unit_length,
+                                    angle_tolerance)
             except WrongShapeError:
                 continue
             centroid = geometry_utils.guess_centroid(square.polygon)
@@ -214,24 +438,211 @@ def find_corner_marks(image: np.ndarray,
                 bottom_right_squares) == 0:
             continue
 
-        # TODO: When multiple, either progressively decrease tolerance or
-        # choose closest to centroid
+        yield _CornerMarks(l_mark, top_right_squares, bottom_right_squares,
+                           bottom_left_squares, basis_transformer)
+
+
+def _get_window(polygon: geometry_utils.Polygon, scale: float,
+                margin: float) -> typing.Tuple[int, int, int, int]:
+    """Get the `(left, top, right, bottom)` bounds of the polygon, scaled by
+    `scale` and padded by `margin` on every side."""
+    xs = [p.x * scale for p in polygon]
+    ys = [p.y * scale for p in polygon]
+    return (math.floor(min(xs) - margin), math.floor(min(ys) - margin),
+            math.ceil(max(xs) + margin) + 1, math.ceil(max(ys) + margin) + 1)
+
+
+def _find_contours_in_window(
+        image: np.ndarray, window: typing.Tuple[int, int, int, int]
+) -> typing.List[np.ndarray]:
+    """Find the simplified contours in `image[top:bottom, left:right]`, in the
+    coordinates of the whole image. The window is clipped to the image."""
+    left, top, right, bottom = window
+    height, width = image_utils.get_dimensions(image)
+    left, top = max(left, 0), max(top, 0)
+    right, bottom = min(right, width), min(bottom, height)
+    if right <= left or bottom <= top:
+        return []
+    return image_utils.find_simplified_contours(image[top:bottom, left:right],
+                                                offset=(left, top))
+
+
+def _find_marks_coarse_to_fine(
+        image: np.ndarray,
+        factor: int,
+        save_path: typing.Optional[pathlib.PurePath] = None,
+        contour_filter: typing.Optional[image_utils.ContourFilter] = None,
+        contours_dropped: typing.Optional[typing.Counter[str]] = None
+) -> typing.Optional[_CornerMarks]:
+    """Find the corner marks on a copy of the image shrunk by `factor`, then
+    find them again at full resolution only in small windows around where they
+    were found.
+
+    The contours of the page are only traced in full inside the shrunk image,
+    which has `factor ** 2` fewer pixels. Returns `None` if either search fails.
+    """
+    coarse_image = image_utils.shrink(image, factor)
+    # The marks are only a few pixels across when shrunk, so their corners
+    # can be much further from square. That also lets through other shapes, so
+    # each candidate is checked again at full resolution until one holds up.
+    contours = image_utils.find_simplified_contours(
+        coarse_image,
+        save_path=save_path,
+        contour_filter=contour_filter,
+        contours_dropped=contours_dropped)
+    candidates = _match_corner_marks(_stack_polygons(contours, 6),
+                                     _stack_polygons(contours, 4),
+                                     coarse_image,
+                                     angle_tolerance=COARSE_ANGLE_TOLERANCE)
+    for candidate in candidates:
+        # The shrunk marks can be off by a few pixels at full resolution, so
+        # look a full grid unit around them.
+        margin = (candidate.l_mark.unit_length + 2) * factor
+        hexagons = _stack_polygons(
+            _find_contours_in_window(
+                image, _get_window(candidate.l_mark.polygon, factor, margin)),
+            6)
+        square_contours: typing.List[np.ndarray] = []
+        for square in (candidate.top_right_squares +
+                       candidate.bottom_right_squares +
+                       candidate.bottom_left_squares):
+            square_contours += _find_contours_in_window(
+                image, _get_window(square.polygon, factor, margin))
+        marks = next(
+            _match_corner_marks(hexagons, _stack_polygons(square_contours, 4),
+                                image, save_path), None)
+        if marks is not None:
+            return marks
+    return None
+
+
+def _find_marks_near_prior(
+        image: np.ndarray,
+        prior: CornerLayout,
+        save_path: typing.Optional[pathlib.PurePath] = None
+) -> typing.Optional[_CornerMarks]:
+    """Find the corner marks only in small windows around where `prior` says
+    they should be. Returns `None` if they aren't all there."""
+    corners, unit_length = prior.to_page(image)
+    margin = unit_length * PRIOR_SEARCH_UNITS
+    hexagons = _stack_polygons(
+        _find_contours_in_window(image, _get_window([corners[0]], 1, margin)),
+        6)
+    square_contours: typing.List[np.ndarray] = []
+    for corner in corners[1:]:
+        square_contours += _find_contours_in_window(
+            image, _get_window([corner], 1, margin))
+    return next(
+        _match_corner_marks(hexagons, _stack_polygons(square_contours, 4),
+                            image, save_path), None)
+
+
+def _find_marks(
+        image: np.ndarray,
+        save_path: typing.Optional[pathlib.PurePath] = None,
+        contour_filter: typing.Optional[image_utils.ContourFilter] = None,
+        contours_dropped: typing.Optional[typing.Counter[str]] = None
+) -> typing.Optional[_CornerMarks]:
+    """Find the corner marks anywhere in the image at full resolution. Returns
+    `None` if they aren't there."""
+    contours = image_utils.find_simplified_contours(
+        image,
+        save_path=save_path,
+        contour_filter=contour_filter,
+        contours_dropped=contours_dropped)
+    return next(
+        _match_corner_marks(_stack_polygons(contours, 6),
+                            _stack_polygons(contours, 4), image, save_path),
+        None)
+
+
+def locate_corner_marks(
+        image: np.ndarray,
+        save_path: typing.Optional[pathlib.PurePath] = None,
+        coarse_factor: typing.Optional[int] = None,
+        contour_filter: typing.Optional[
+            image_utils.ContourFilter] = DEFAULT_CONTOUR_FILTER,
+        prior: typing.Optional[CornerLayout] = None,
+        contours_dropped: typing.Optional[typing.Counter[str]] = None
+) -> CornerSearchResult:
+    """Find the corners of the grid, in CW order starting with the top left,
+    along with how they were found.
+
+    If `prior` is given, the marks are first looked for only near where it
+    says they should be.
+
+    If `coarse_factor` is more than 1, the marks are then looked for on the
+    image shrunk by that factor and refined at full resolution near where they
+    were found. If that doesn't find them, falls back to searching the whole
+    image at full resolution.
+
+    Only the contours that pass `contour_filter` are considered when searching
+    the whole image. If it is None, every contour is. If the marks aren't found
+    among the contours that pass, every contour is tried as a last resort, as
+    the marks on sheets that only fill a small part of the image (like phone
+    photos) are smaller than the filter expects. The number of contours
+    dropped by each check of the filter is added to `contours_dropped`, if it
+    is given, even if the corners aren't found.
+
+    Raises a `CornerFindingError` if the corners can't be found.
+    """
+    marks = None
+    method = CornerSearchMethod.PRIOR
+    if prior is not None:
+        marks = _find_marks_near_prior(image, prior, save_path)
+    if marks is None and coarse_factor is not None and coarse_factor > 1:
+        method = CornerSearchMethod.COARSE
+        marks = _find_marks_coarse_to_fine(image, coarse_factor, save_path,
+                                           contour_filter, contours_dropped)
+    if marks is None:
+        method = CornerSearchMethod.FULL
+        marks = _find_marks(image, save_path, contour_filter,
+                            contours_dropped)
+    if marks is None and contour_filter is not None:
+        method = CornerSearchMethod.UNFILTERED
+        marks = _find_marks(image, save_path)
+    if marks is None:
+        raise CornerFindingError("Couldn't find document corners.")
+
+    basis_transformer = marks.basis_transformer
+    top_left_corner = marks.l_mark.polygon[0]
+    # TODO: When multiple, either progressively decrease tolerance or
+    # choose closest to centroid
+    top_right_corner = geometry_utils.get_corner_wrt_basis(
+        marks.top_right_squares[0].polygon, geometry_utils.Corner.TR,
+        basis_transformer)
+    bottom_right_corner = geometry_utils.get_corner_wrt_basis(
+        marks.bottom_right_squares[0].polygon, geometry_utils.Corner.BR,
+        basis_transformer)
+    bottom_left_corner = geometry_utils.get_corner_wrt_basis(
+        marks.bottom_left_squares[0].polygon, geometry_utils.Corner.BL,
+        basis_transformer)
+
+    grid_corners = [
+        top_left_corner,     top_right_corner,
+        bottom_right_corner, bottom_left_corner
+    ]
 
-        top_left_corner = l_mark.polygon[0]
-        top_right_corner = geometry_utils.get_corner_wrt_basis(
-            top_right_squares[0].polygon, geometry_utils.Corner.TR, basis_transformer)
-        bottom_right_corner = geometry_utils.get_corner_wrt_basis(
-            bottom_right_squares[0].polygon, geometry_utils.Corner.BR, basis_transformer)
-        bottom_left_corner = geometry_utils.get_corner_wrt_basis(
-            bottom_left_squares[0].polygon, geometry_utils.Corner.BL, basis_transformer)
+    if save_path:
+        image_utils.draw_polygons(image, [grid_corners], save_path / "grid_limits.jpg")
 
-        grid_corners = [
-            top_left_corner,     top_right_corner,
-            bottom_right_corner, bottom_left_corner
-        ]   
+    return CornerSearchResult(
+        grid_corners,
+        CornerLayout.from_page(grid_corners, marks.l_mark.unit_length, image),
+        method)
 
-        if save_path:
-            image_utils.draw_polygons(image, [grid_corners], save_path / "grid_limits.jpg")
 
-        return grid_corners
-    raise CornerFindingError("Couldn't find document corners.")
+def find_corner_marks(
+        image: np.ndarray,
+        save_path: typing.Optional[pathlib.PurePath] = None,
+        coarse_factor: typing.Optional[int] = None,
+        contour_filter: typing.Optional[
+            image_utils.ContourFilter] = DEFAULT_CONTOUR_FILTER
+) -> geometry_utils.Polygon:
+    """Find the corners of the grid, in CW order starting with the top left.
+    See `locate_corner_marks`.
+
+    Raises a `CornerFindingError` if the corners can't be found.
+    """
+    return locate_corner_marks(image, save_path, coarse_factor,
+                               contour_filter).corners
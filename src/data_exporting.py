@@ -1,14 +1,22 @@
 """"""
 import csv
-import operator
+import functools
+import heapq
+import itertools
 import os
 import pathlib
+import sys
 import typing as tp
 from datetime import datetime
 
+import numpy as np
+
 import list_utils
 from grid_info import Field, RealOrVirtualField, VirtualField
 
+if tp.TYPE_CHECKING:
+    import pandas
+
 # If you change these, also update the manual!
 COLUMN_NAMES: tp.Dict[RealOrVirtualField, str] = {
     Field.LAST_NAME: "Last Name",
@@ -24,58 +32,264 @@ COLUMN_NAMES: tp.Dict[RealOrVirtualField, str] = {
 
 KEY_NOT_FOUND_MESSAGE = "NO KEY FOUND"
 
+# The most rows that are read into memory at once when finishing, sorting or
+# transforming a saved sheet.
+DEFAULT_CHUNK_ROWS = 4096
+# The number of rows written by a `SheetWriter` between flushes of its file.
+DEFAULT_FLUSH_INTERVAL = 16
+# Added to the name of a sheet file while it is being written.
+PARTIAL_SUFFIX = ".partial"
+
 
 def format_timestamp_for_file(timestamp: tp.Optional[datetime]) -> str:
     return timestamp.isoformat(sep="_").replace(":", "-") + "__" if timestamp else ""
 
 
+def get_output_path(path: pathlib.PurePath, filebasename: str,
+                    timestamp: tp.Optional[datetime]) -> pathlib.PurePath:
+    return path / f"{format_timestamp_for_file(timestamp)}{filebasename}.csv"
+
+
+def get_column_names(columns: tp.List[RealOrVirtualField],
+                     num_questions: int) -> tp.List[str]:
+    """Get the column names of a sheet: the names of the fields followed by
+    "Q1" through "QN"."""
+    return [COLUMN_NAMES[column] for column in columns
+            ] + [f"Q{i + 1}" for i in range(num_questions)]
+
+
+def get_sort_indexes(column_names: tp.List[str]) -> tp.Optional[tp.List[int]]:
+    """Get the indexes of the columns to sort rows by: last, first and middle
+    name, or the test form code if there are no names. Returns None if there
+    are neither."""
+    try:
+        return [
+            list_utils.find_index(column_names, COLUMN_NAMES[field])
+            for field in (Field.LAST_NAME, Field.FIRST_NAME, Field.MIDDLE_NAME)
+        ]
+    except StopIteration:
+        try:
+            return [
+                list_utils.find_index(column_names,
+                                      COLUMN_NAMES[Field.TEST_FORM_CODE])
+            ]
+        except StopIteration:
+            return None
+
+
 def make_dir_if_not_exists(path: pathlib.Path):
     if not os.path.exists(str(path)):
         os.makedirs(str(path))
 
 
-def validate_order_map(order_map: tp.Dict[str, tp.List[int]],
+def validate_order_map(order_map: tp.Dict[str, np.ndarray],
                        num_questions: int):
-    """Validate the given order map and throw ValueError if the map is invalid."""
-    for [form_code, map_list] in order_map.items():
-        if (min(map_list) != 1 or max(map_list) != num_questions
-                or len(set(map_list)) != num_questions):
+    """Validate the given order map and throw ValueError if the map is invalid.
+
+    Each entry must contain one of each (zero-based) question index from 0 to
+    its length, and must not be longer than `num_questions`."""
+    for [form_code, order] in order_map.items():
+        if (len(order) == 0 or len(order) > num_questions
+                or not np.array_equal(np.sort(order), np.arange(len(order)))):
             raise ValueError(
-                f"Arrangement file entry for '{form_code}' is invalid. All arrangement file entries must contain one of each index from 1 to the number of questions."
+                f"Arrangement file entry for '{form_code}' is invalid. All arrangement file entries must contain one of each index from 1 to their number of questions, which can't be more than the number of questions on the sheet."
             )
 
+
+def load_arrangement_map(arrangement_file: pathlib.Path,
+                         num_questions: int) -> tp.Dict[str, np.ndarray]:
+    """Load and validate an arrangement map file. Returns a dict of the form
+    codes to the (zero-based) old index of each question in the new order,
+    ie the question that should be at index `i` is at `order_map[code][i]`.
+
+    Raises ValueError if the file is invalid. The map is only read again if the
+    file changes, so the arrays are read-only."""
+    stat = os.stat(str(arrangement_file))
+    return dict(
+        _load_arrangement_map(str(arrangement_file), stat.st_mtime_ns,
+                              stat.st_size, num_questions))
+
+
+@functools.lru_cache(maxsize=8)
+def _load_arrangement_map(path: str, mtime_ns: int, size: int,
+                          num_questions: int) -> tp.Dict[str, np.ndarray]:
+    order_map: tp.Dict[str, np.ndarray] = {}
+    with open(path, 'r', newline='') as file:
+        reader = csv.reader(file)
+        names = list_utils.strip_all(next(reader))
+        form_code_index = list_utils.find_index(
+            names, COLUMN_NAMES[Field.TEST_FORM_CODE])
+        first_answer_index = list_utils.find_index(names, "Q1")
+        for form in reader:
+            stripped_form = list_utils.strip_all(form)
+            form_code = stripped_form[form_code_index]
+            try:
+                order = np.array(
+                    [int(n) for n in stripped_form[first_answer_index:]],
+                    int) - 1
+            except ValueError:
+                raise ValueError(
+                    f"Arrangement file entry for '{form_code}' is invalid. All entries must be question numbers."
+                )
+            order.setflags(write=False)
+            order_map[form_code] = order
+    validate_order_map(order_map, num_questions)
+    return order_map
+
+
 def save_csv(data: tp.List[tp.List[str]], path: pathlib.PurePath):
     with open(path, "w", newline="") as f:
         writer = csv.writer(f)
         writer.writerows(data)
 
+class SheetArrays(tp.NamedTuple):
+    """The arrays behind an `OutputSheet`, without copying them.
+
+    Members:
+        fields: The field values of each row, indexed by `[row][field column]`.
+        answer_codes: The answers of each row as indexes into `vocabulary`.
+            Answers past a row's length are 0.
+        row_lengths: The number of cells (fields and answers) in each row.
+        vocabulary: The text of each answer code. Code 0 is always "".
+    """
+    fields: np.ndarray
+    answer_codes: np.ndarray
+    row_lengths: np.ndarray
+    vocabulary: tp.List[str]
+
+
 class OutputSheet():
     """A lightweight matrix of data to be exported. Faster than a dataframe but
-    can be easily converted to one when the need arises."""
+    can be easily converted to one when the need arises.
+
+    The data is stored by column: the field values in an array of (interned)
+    strings and the answers in a matrix of small integer codes, which index the
+    answer texts in a shared vocabulary. Rows can have different numbers of
+    answers, so the length of each row is stored separately. Added rows are
+    collected in lists and only moved into the arrays when they are next used.
+    """
     # Must be structured as: field_a, field_b, ..., Q1, Q2, Q3, ...
-    data: tp.List[tp.List[str]]
     field_columns: tp.List[RealOrVirtualField]
     num_questions: int
     row_count: int
     first_question_column_index: int
     form_code_column_index: tp.Optional[int]
+    vocabulary: tp.List[str]
+    _header: tp.List[str]
+    _fields: np.ndarray
+    _answer_codes: np.ndarray
+    _row_lengths: np.ndarray
+    _codes_by_text: tp.Dict[str, int]
+    _pending_fields: tp.List[tp.List[str]]
+    _pending_codes: tp.List[tp.List[int]]
 
     def __init__(self, columns: tp.List[RealOrVirtualField], num_questions: int):
         self.field_columns = columns
         self.num_questions = num_questions
-        field_column_names = [COLUMN_NAMES[column] for column in columns]
-        answer_columns = [f"Q{i + 1}" for i in range(self.num_questions)]
-        self.first_question_column_index = len(field_column_names)
+        self.first_question_column_index = len(columns)
         self.form_code_column_index = self.field_columns.index(
             Field.TEST_FORM_CODE) if (Field.TEST_FORM_CODE in self.field_columns) else None
-        self.data = [field_column_names + answer_columns]
+        self._header = get_column_names(columns, num_questions)
+        self.vocabulary = [""]
+        self._codes_by_text = {"": 0}
+        self._fields = np.zeros((0, len(columns)), object)
+        self._answer_codes = np.zeros((0, num_questions), np.uint16)
+        self._row_lengths = np.zeros(0, int)
+        self._pending_fields = []
+        self._pending_codes = []
         self.row_count = 0
 
+    @property
+    def data(self) -> tp.List[tp.List[str]]:
+        """The sheet as a list of rows of text, with the column names as the
+        first row. This is a copy; changing it doesn't change the sheet."""
+        fields, codes, lengths, vocabulary = self.to_numpy()
+        answers = np.array(vocabulary, object)[codes]
+        cells = np.concatenate([fields, answers], axis=1).tolist()
+        return [list(self._header)] + [
+            row[:length] for row, length in zip(cells, lengths.tolist())
+        ]
+
+    def to_numpy(self) -> SheetArrays:
+        """Get the arrays behind the sheet (see `SheetArrays`). These are views,
+        so they are only valid until the sheet is next changed."""
+        self._flush()
+        return SheetArrays(self._fields, self._answer_codes, self._row_lengths,
+                           self.vocabulary)
+
+    def to_pandas(self) -> "pandas.DataFrame":
+        """Get the sheet as a pandas DataFrame, with the answers as categorical
+        columns of the answer codes. Answers past the end of a row are missing.
+
+        pandas is not a dependency of this program, so it must be installed
+        separately to use this."""
+        import pandas
+        fields, codes, lengths, vocabulary = self.to_numpy()
+        num_fields = len(self.field_columns)
+        frame = pandas.DataFrame(
+            {
+                name: fields[:, i]
+                for i, name in enumerate(self._header[:num_fields])
+            },
+            copy=False)
+        # -1 is a missing value for `Categorical.from_codes`.
+        answer_lengths = lengths - num_fields
+        for i in range(codes.shape[1]):
+            column_codes = np.where(i < answer_lengths, codes[:, i], -1)
+            frame[f"Q{i + 1}"] = pandas.Categorical.from_codes(
+                column_codes, vocabulary)
+        return frame
+
+    def _flush(self):
+        """Move the rows added since the last flush into the arrays."""
+        if not self._pending_fields:
+            return
+        num_answers = np.array([len(codes) for codes in self._pending_codes],
+                               int)
+        self._widen(int(num_answers.max()))
+        codes = np.zeros((num_answers.size, self._answer_codes.shape[1]),
+                         self._answer_codes.dtype)
+        # Boolean indexing fills the cells in row-major order, so the flattened
+        # answers land at the start of each row.
+        codes[np.arange(codes.shape[1]) < num_answers[:, np.newaxis]] = [
+            code for row in self._pending_codes for code in row
+        ]
+        fields = np.empty((len(self._pending_fields), len(self.field_columns)),
+                          object)
+        fields[:] = self._pending_fields
+        self._fields = np.concatenate([self._fields, fields])
+        self._answer_codes = np.concatenate([self._answer_codes, codes])
+        self._row_lengths = np.concatenate(
+            [self._row_lengths, num_answers + len(self.field_columns)])
+        self._pending_fields = []
+        self._pending_codes = []
+
+    def _widen(self, num_answers: int):
+        """Make room for up to `num_answers` answers in every row."""
+        rows, width = self._answer_codes.shape
+        if num_answers > width:
+            self._answer_codes = np.concatenate([
+                self._answer_codes,
+                np.zeros((rows, num_answers - width), self._answer_codes.dtype)
+            ], axis=1)
+
+    def _encode(self, texts: tp.Iterable[str]) -> tp.List[int]:
+        """Get the answer codes of `texts`, adding any new ones to the
+        vocabulary."""
+        codes_by_text = self._codes_by_text
+        for text in texts:
+            if text not in codes_by_text:
+                codes_by_text[text] = len(self.vocabulary)
+                self.vocabulary.append(text)
+                if len(self.vocabulary) == np.iinfo(np.uint16).max + 2:
+                    self._answer_codes = self._answer_codes.astype(np.uint32)
+        return [codes_by_text[text] for text in texts]
+
     def save(self, path: pathlib.PurePath, filebasename: str, sort: bool,
              timestamp: tp.Optional[datetime], transpose: bool = False) -> pathlib.PurePath:
         if sort:
             self.sortByName()
-        output_path = path / f"{format_timestamp_for_file(timestamp)}{filebasename}.csv"
+        output_path = get_output_path(path, filebasename, timestamp)
         data = self.data
         if(transpose):
             data = list_utils.transpose(data)
@@ -83,48 +297,95 @@ class OutputSheet():
         return output_path
 
     def delete_field_column(self, column: RealOrVirtualField):
+        self._flush()
         deleted_column_index = self.field_columns.index(column)
         self.field_columns.pop(deleted_column_index)
-        self.data = [
-            list_utils.remove_index(row, deleted_column_index)
-            for row in self.data
-        ]
+        self._header.pop(deleted_column_index)
+        self._fields = np.delete(self._fields, deleted_column_index, axis=1)
+        lengths = self._row_lengths
+        lengths[lengths > deleted_column_index] -= 1
+
+    def set_field(self, row: int, column: RealOrVirtualField, value: str):
+        """Change the value of a field in the row at index `row`, where the
+        first row after the column names is 0."""
+        if not 0 <= row < self.row_count:
+            raise IndexError("Row index out of range.")
+        self._flush()
+        self._fields[row, self.field_columns.index(column)] = sys.intern(value)
+
+    def _get_column(self, index: int) -> np.ndarray:
+        """Get the values of the column at `index` in the column names, as
+        text."""
+        self._flush()
+        num_fields = len(self.field_columns)
+        if index < num_fields:
+            return self._fields[:, index]
+        return np.array(self.vocabulary,
+                        object)[self._answer_codes[:, index - num_fields]]
 
     def sortByName(self):
-        data = self.data[1:]
-        col_names = self.data[0]
-        try:
-            primary_index = list_utils.find_index(
-                col_names, COLUMN_NAMES[Field.LAST_NAME])
-            secondary_index = list_utils.find_index(
-                col_names, COLUMN_NAMES[Field.FIRST_NAME])
-            tertiary_index = list_utils.find_index(
-                col_names, COLUMN_NAMES[Field.MIDDLE_NAME])
-        except StopIteration:
-            try:
-                primary_index = list_utils.find_index(
-                    col_names, COLUMN_NAMES[Field.TEST_FORM_CODE])
-                secondary_index = None
-                tertiary_index = None
-            except StopIteration:
-                return
-        if tertiary_index is not None:
-            data = sorted(data, key=operator.itemgetter(tertiary_index))
-        if secondary_index is not None:
-            data = sorted(data, key=operator.itemgetter(secondary_index))
-        data = sorted(data, key=operator.itemgetter(primary_index))
-        self.data = [col_names] + data
+        """Sort the rows by last, first and then middle name, or by test form
+        code if there are no names. Rows with the same names keep their order."""
+        sort_indexes = get_sort_indexes(self._header)
+        if sort_indexes is None:
+            return
+        # Each column is replaced with the rank of its text, so that all of them
+        # can be sorted at once. `np.lexsort` is stable and sorts by the last
+        # key first.
+        ranks = [
+            np.unique(self._get_column(index), return_inverse=True)[1]
+            for index in reversed(sort_indexes)
+        ]
+        order = np.lexsort(ranks) if self.row_count > 0 else np.zeros(0, int)
+        self._take_rows(order)
+
+    def _take_rows(self, order: np.ndarray):
+        """Rearrange the rows so that row `i` is the row that was at
+        `order[i]`."""
+        self._fields = self._fields[order]
+        self._answer_codes = self._answer_codes[order]
+        self._row_lengths = self._row_lengths[order]
 
     def add(self, fields: tp.Dict[RealOrVirtualField, str],
             answers: tp.List[str]):
         row: tp.List[str] = []
         for column in self.field_columns:
             try:
-                row.append(fields[column].strip())
+                row.append(fields[column])
             except KeyError:
                 row.append('')
-        self.data.append(row + list_utils.strip_all(answers))
-        self.row_count = len(self.data) - 1
+        self._add_cells(row, answers)
+
+    def _add_cells(self, fields: tp.List[str], answers: tp.List[str]):
+        """Add a row from the text of its field columns and its answers."""
+        self._pending_fields.append(
+            [sys.intern(value.strip()) for value in fields])
+        self._pending_codes.append(self._encode(list_utils.strip_all(answers)))
+        self.row_count += 1
+
+    def add_rows(self, fields: np.ndarray, answer_texts: tp.List[str],
+                 answers: np.ndarray, answer_counts: np.ndarray):
+        """Add many rows at once. `fields` has the text of each field column in
+        every row, and row `i` has the first `answer_counts[i]` answers in row
+        `i` of `answers`, which are indexes into `answer_texts`."""
+        self._flush()
+        row_count = len(answer_counts)
+        new_fields = np.array([[sys.intern(value.strip()) for value in row]
+                               for row in np.asarray(fields).tolist()],
+                              object).reshape(row_count,
+                                              len(self.field_columns))
+        text_codes = np.array(self._encode(list_utils.strip_all(answer_texts)),
+                              int)
+        self._widen(answers.shape[1])
+        codes = np.zeros((row_count, self._answer_codes.shape[1]),
+                         self._answer_codes.dtype)
+        codes[:, :answers.shape[1]] = text_codes[answers]
+        codes[np.arange(codes.shape[1]) >= answer_counts[:, np.newaxis]] = 0
+        self._fields = np.concatenate([self._fields, new_fields])
+        self._answer_codes = np.concatenate([self._answer_codes, codes])
+        self._row_lengths = np.concatenate(
+            [self._row_lengths, answer_counts + len(self.field_columns)])
+        self.row_count += row_count
 
     def add_file(self, csvfile: pathlib.Path):
         with open(str(csvfile), 'r', newline='') as file:
@@ -148,73 +409,284 @@ class OutputSheet():
                 answers = row[self.first_question_column_index:]
                 self.add(fields, answers)
 
-    def clean_up(self, replace_empty_with: str = ""):
+    def get_cleaned_length(self) -> int:
+        """Get the length that `clean_up` makes every row: the length of the
+        column names, less the fewest trailing blank cells of any row."""
+        fields, codes, lengths, _ = self.to_numpy()
+        filled = np.concatenate([fields != "", codes != 0], axis=1)
+        filled &= np.arange(filled.shape[1]) < lengths[:, np.newaxis]
+        last_filled = np.where(filled.any(axis=1),
+                               filled.shape[1] - np.argmax(filled[:, ::-1], axis=1),
+                               0)
+        return len(self._header) - min((lengths - last_filled).tolist())
+
+    def clean_up(self,
+                 replace_empty_with: str = "",
+                 length: tp.Optional[int] = None):
         """Removes the extra headings from the heading row and replaces blank
         cells with `replace_empty_with`. Pads any short rows with that value to
-        make all rows the same length. """
+        make all rows the same length.
+
+        The length is `get_cleaned_length()` unless `length` is given, ie when
+        the sheet is part of a bigger one."""
+        num_fields = len(self.field_columns)
+        _, codes, lengths, _ = self.to_numpy()
         # Finds the length of the longest row by subtracting the minimum number of trailing empty elements
-        longest_length = len(self.data[0]) - min([
-            list_utils.count_trailing_empty_elements(row)
-            for row in self.data[1:]
-        ])
-        self.data[0] = self.data[0][:longest_length]
-        for i, row in enumerate(self.data):
-            cleaned_row = row[:self.first_question_column_index] + [
-                item if (item != "") else replace_empty_with
-                for item in row[self.first_question_column_index:]
-            ]
-            difference = longest_length - len(cleaned_row)
-            if (difference < 0):
-                cleaned_row = cleaned_row[:longest_length]
-            elif (difference > 0):
-                cleaned_row += [replace_empty_with] * difference
-            self.data[i] = cleaned_row
+        longest_length = length if length is not None else self.get_cleaned_length()
+        self._header = self._header[:longest_length]
+
+        num_answers = longest_length - num_fields
+        replacement = self._encode([replace_empty_with])[0]
+        self._widen(num_answers)
+        codes = self._answer_codes[:, :max(num_answers, 0)]
+        blank = (codes == 0) | (np.arange(codes.shape[1]) >=
+                                (lengths - num_fields)[:, np.newaxis])
+        codes[blank] = replacement
+        self._answer_codes[:, max(num_answers, 0):] = 0
+        self._row_lengths[:] = longest_length
 
     def reorder(self, arrangement_file: pathlib.Path):
-        """Reorder the sheet based on an arrangement map file.
+        """Reorder the sheet based on an arrangement map file (see
+        `load_arrangement_map`).
 
-        Raises TypeError if invalid arrangement file.
+        Raises ValueError if invalid arrangement file.
 
         Results will have empty form code index."""
-        # TODO: Validate arrangement file.
-        # order_map will be a dict matching form code keys to a list where the
-        # new index of question `i` in `key` is `order_map[key][i]`
-        order_map: tp.Dict[str, tp.List[int]] = {}
-        validate_order_map(order_map, self.num_questions)
-
-        with open(str(arrangement_file), 'r', newline='') as file:
-            reader = csv.reader(file)
-            names = list_utils.strip_all(next(reader))
-            form_code_index = list_utils.find_index(
-                names, COLUMN_NAMES[Field.TEST_FORM_CODE])
-            first_answer_index = list_utils.find_index(names, "Q1")
-            for form in reader:
-                stripped_form = list_utils.strip_all(form)
-                form_code = stripped_form[form_code_index]
-                to_order_zero_ind = [
-                    int(n) - 1 for n in stripped_form[first_answer_index:]
-                ]
-                order_map[form_code] = to_order_zero_ind
+        order_map = load_arrangement_map(arrangement_file, self.num_questions)
 
         sheet_form_code_index = list_utils.find_index(
-            self.data[0], COLUMN_NAMES[Field.TEST_FORM_CODE])
-        sheet_first_answer_index = list_utils.find_index(self.data[0], "Q1")
-        rearranged = [self.data[0]]
+            self._header, COLUMN_NAMES[Field.TEST_FORM_CODE])
+        sheet_first_answer_index = list_utils.find_index(self._header, "Q1")
+        num_fields = len(self.field_columns)
+        if (sheet_form_code_index >= num_fields
+                or sheet_first_answer_index != num_fields):
+            raise ValueError(
+                "Sheet must have its test form code before its answers.")
 
-        for row in self.data[1:]:
-            original_form_code = row[sheet_form_code_index]
+        self._flush()
+        form_codes = self._fields[:, sheet_form_code_index]
+        _, first_rows, form_code_indexes = np.unique(form_codes,
+                                                     return_index=True,
+                                                     return_inverse=True)
+        # Check the form codes in the order of the rows they first appear in,
+        # so the error is about the first row that can't be rearranged.
+        for first_row in np.sort(first_rows).tolist():
+            original_form_code = form_codes[first_row]
             try:
                 order_map[original_form_code]
             except KeyError:
                 raise ValueError(
                     f"Arrangement file is missing entry for key '{original_form_code}'."
                 )
-            else:
-                row_reordered = row[:sheet_first_answer_index] + [
-                    row[ind + sheet_first_answer_index]
-                    for ind in order_map[original_form_code]
-                ]
-                row_reordered[sheet_form_code_index] = ""
-                rearranged.append(row_reordered)
-
-        self.data = rearranged
+
+        if self.row_count == 0:
+            return
+        longest_order = max(len(order) for order in order_map.values())
+        self._widen(longest_order)
+        codes = self._answer_codes
+        rearranged = np.zeros_like(codes)
+        lengths = self._row_lengths
+        for i, first_row in enumerate(first_rows.tolist()):
+            rows = np.flatnonzero(form_code_indexes == i)
+            order = order_map[form_codes[first_row]]
+            if order.size > (lengths[rows] - num_fields).min():
+                raise IndexError(
+                    f"Arrangement file entry for '{form_codes[first_row]}' refers to a question that isn't on the sheet."
+                )
+            rearranged[rows, :order.size] = codes[rows[:, np.newaxis], order]
+            lengths[rows] = num_fields + order.size
+        codes[:] = rearranged
+        self._fields[:, sheet_form_code_index] = ""
+
+
+def read_column_names(path: pathlib.PurePath) -> tp.List[str]:
+    """Read the column names of a saved sheet."""
+    with open(str(path), 'r', newline='') as file:
+        return next(csv.reader(file))
+
+
+def read_sheet_chunks(path: pathlib.PurePath,
+                      columns: tp.List[RealOrVirtualField],
+                      num_questions: int,
+                      chunk_rows: int = DEFAULT_CHUNK_ROWS
+                      ) -> tp.Iterator[OutputSheet]:
+    """Read a saved sheet with the given field columns back, as sheets of up to
+    `chunk_rows` rows each. The column names of every chunk are the ones in the
+    file."""
+    num_fields = len(columns)
+    with open(str(path), 'r', newline='') as file:
+        reader = csv.reader(file)
+        column_names = next(reader)
+        while True:
+            rows = list(itertools.islice(reader, chunk_rows))
+            if not rows:
+                return
+            sheet = OutputSheet(list(columns), num_questions)
+            sheet._header = list(column_names)
+            for row in rows:
+                sheet._add_cells(row[:num_fields], row[num_fields:])
+            yield sheet
+
+
+def read_sheet(path: pathlib.PurePath, columns: tp.List[RealOrVirtualField],
+               num_questions: int) -> OutputSheet:
+    """Read a whole saved sheet with the given field columns back."""
+    chunks = list(read_sheet_chunks(path, columns, num_questions, sys.maxsize))
+    return chunks[0] if chunks else OutputSheet(list(columns), num_questions)
+
+
+class SheetWriter():
+    """Writes the rows of a sheet to a CSV file as they are added, so they don't
+    have to be kept in memory and aren't lost if the program stops.
+
+    Rows are written to a file with `PARTIAL_SUFFIX` added to its name, which is
+    flushed every `flush_interval` rows. `finish` cleans up and sorts that file
+    a chunk at a time and only then replaces the output file with it, so the
+    output file is never partly written.
+
+    If `append`, rows are instead added straight to the end of the output file,
+    which is only given the column names if it doesn't exist yet. This is for
+    files that keep growing across runs, so they can't be cleaned up or sorted.
+    """
+    path: pathlib.PurePath
+    partial_path: pathlib.PurePath
+    field_columns: tp.List[RealOrVirtualField]
+    num_questions: int
+    column_names: tp.List[str]
+    row_count: int
+    flush_interval: int
+    append: bool
+    _file: tp.TextIO
+    _writer: tp.Any
+
+    def __init__(self,
+                 path: pathlib.PurePath,
+                 columns: tp.List[RealOrVirtualField],
+                 num_questions: int,
+                 column_names: tp.Optional[tp.List[str]] = None,
+                 flush_interval: int = DEFAULT_FLUSH_INTERVAL,
+                 append: bool = False):
+        self.path = path
+        self.partial_path = path if append else path.with_name(path.name +
+                                                                PARTIAL_SUFFIX)
+        self.field_columns = columns
+        self.num_questions = num_questions
+        self.column_names = column_names if column_names is not None else get_column_names(
+            columns, num_questions)
+        self.row_count = 0
+        self.flush_interval = flush_interval
+        self.append = append
+        if append and os.path.exists(str(path)) and os.path.getsize(
+                str(path)) > 0:
+            if read_column_names(path) != self.column_names:
+                raise ValueError(
+                    f"'{path}' can't be added to, as it has other columns.")
+            self._file = open(str(path), "a", newline="")
+            self._writer = csv.writer(self._file)
+            return
+        self._file = open(str(self.partial_path), "w", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.column_names)
+        self._file.flush()
+
+    def add(self, fields: tp.Dict[RealOrVirtualField, str],
+            answers: tp.List[str]):
+        """Write a row, like `OutputSheet.add`."""
+        row = [fields.get(column, "").strip() for column in self.field_columns]
+        self._write_rows([row + list_utils.strip_all(answers)])
+
+    def add_sheet(self, sheet: OutputSheet):
+        """Write every row of a sheet with the same columns."""
+        self._write_rows(sheet.data[1:])
+
+    def _write_rows(self, rows: tp.List[tp.List[str]]):
+        self._writer.writerows(rows)
+        flushes = (self.row_count + len(rows)) // self.flush_interval
+        if flushes > self.row_count // self.flush_interval:
+            self._file.flush()
+        self.row_count += len(rows)
+
+    def discard(self):
+        """Stop writing and delete the partial file, if it is still there. If
+        appending, the rows already added are kept."""
+        self._file.close()
+        if not self.append and os.path.exists(str(self.partial_path)):
+            os.remove(str(self.partial_path))
+
+    def finish(self,
+               sort: bool,
+               replace_empty_with: tp.Optional[str] = None,
+               chunk_rows: int = DEFAULT_CHUNK_ROWS) -> pathlib.PurePath:
+        """Stop writing and replace the output file with the rows written.
+
+        If `replace_empty_with` is given, the rows are cleaned up as by
+        `OutputSheet.clean_up`. If `sort`, they are sorted as by
+        `OutputSheet.sortByName`: each chunk is sorted on its own and the
+        chunks are then merged. Returns the path of the output file.
+
+        If appending, the rows can't be cleaned up or sorted, so this only
+        stops writing."""
+        self._file.close()
+        if self.append:
+            if replace_empty_with is not None or sort:
+                raise ValueError("Rows that were appended can't be cleaned up "
+                                 "or sorted.")
+            return self.path
+        if replace_empty_with is None and not sort:
+            os.replace(str(self.partial_path), str(self.path))
+            return self.path
+
+        def read_chunks() -> tp.Iterator[OutputSheet]:
+            return read_sheet_chunks(self.partial_path, self.field_columns,
+                                     self.num_questions, chunk_rows)
+
+        column_names = self.column_names
+        length: tp.Optional[int] = None
+        if replace_empty_with is not None:
+            if self.row_count == 0:
+                raise ValueError("There are no rows to clean up.")
+            length = max(chunk.get_cleaned_length() for chunk in read_chunks())
+            column_names = column_names[:length]
+        sort_indexes = get_sort_indexes(column_names) if sort else None
+
+        finished_path = self.path.with_name(self.path.name + ".finished")
+        run_paths: tp.List[str] = []
+        try:
+            with open(str(finished_path), "w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(column_names)
+                for chunk in read_chunks():
+                    if replace_empty_with is not None:
+                        chunk.clean_up(replace_empty_with, length)
+                    if sort_indexes is None:
+                        writer.writerows(chunk.data[1:])
+                        continue
+                    chunk.sortByName()
+                    run_path = f"{self.partial_path}.{len(run_paths)}"
+                    run_paths.append(run_path)
+                    save_csv(chunk.data[1:], pathlib.PurePath(run_path))
+                if sort_indexes is not None:
+                    _merge_sorted_runs(run_paths, sort_indexes, writer)
+            os.replace(str(finished_path), str(self.path))
+        finally:
+            for run_path in run_paths:
+                os.remove(run_path)
+            if os.path.exists(str(finished_path)):
+                os.remove(str(finished_path))
+        os.remove(str(self.partial_path))
+        return self.path
+
+
+def _merge_sorted_runs(run_paths: tp.List[str], sort_indexes: tp.List[int],
+                       writer: tp.Any):
+    """Merge CSV files of rows that are each sorted by the columns at
+    `sort_indexes` into `writer`. Rows with the same values keep the order of
+    the files they are in."""
+    files = [open(run_path, "r", newline="") for run_path in run_paths]
+    try:
+        writer.writerows(
+            heapq.merge(*[csv.reader(file) for file in files],
+                        key=lambda row: [row[i] for i in sort_indexes]))
+    finally:
+        for file in files:
+            file.close()
@@ -0,0 +1,155 @@
+"""A compact store of the fill percent of every bubble on every page of a batch,
+so that the batch can be read again with other settings, keys or arrangement
+maps without looking at its images (see `rescore`).
+
+A store is a folder with the fill percents of each page as one row of a
+float16 array, saved as `.npy` files that are memory-mapped instead of loaded,
+and a JSON file with the name of each page. Half precision is plenty, as fill
+percents are between 0 and 1 and the threshold between filled and empty
+bubbles sits in the middle of the largest gap between them.
+"""
+
+import json
+import os
+import pathlib
+import typing as tp
+
+import numpy as np
+
+import grid_info as grid_i
+import page_processing
+
+# Change this whenever the files in a store change, so that older stores are
+# not misread.
+STORE_VERSION = 1
+FILLS_FILE = "fills.npy"
+REJECTED_FILE = "rejected.npy"
+# Written last, once every page has been stored, so a store without it was left
+# part way by a run that stopped.
+PAGES_FILE = "pages.json"
+
+
+class FillStore():
+    """The fill percents of a batch of pages.
+
+    Members:
+        directory: The folder the store is kept in.
+        form_variant: The form variant the pages were read as.
+        image_names: The file name of each page, in the order they were read.
+        fills: The fill percent of every bubble on each page, indexed by
+            `[page][bubble]` in the order of `grid_info.get_compiled_layout`.
+            Memory-mapped from the store.
+        rejected: Whether each page was rejected, in which case its fills are
+            all 0.
+    """
+    directory: pathlib.Path
+    form_variant: grid_i.FormVariant
+    image_names: tp.List[str]
+    fills: np.ndarray
+    rejected: np.ndarray
+
+    def __init__(self, directory: pathlib.Path,
+                 form_variant: grid_i.FormVariant, image_names: tp.List[str],
+                 fills: np.ndarray, rejected: np.ndarray):
+        self.directory = directory
+        self.form_variant = form_variant
+        self.image_names = image_names
+        self.fills = fills
+        self.rejected = rejected
+
+    @property
+    def page_count(self) -> int:
+        return len(self.image_names)
+
+    def read_pages(self, threshold: tp.Optional[float] = None
+                   ) -> tp.Iterator[page_processing.PageResult]:
+        """Read every page again from its fill percents, in the order they were
+        first read. If `threshold` is None, each page's threshold is calculated
+        from its fill percents like when it was first read."""
+        for index, image_name in enumerate(self.image_names):
+            if self.rejected[index]:
+                yield page_processing.PageResult(image_name, rejected=True)
+            else:
+                yield page_processing.read_fill_percents(
+                    self.fills[index], image_name, self.form_variant,
+                    threshold)
+
+
+class FillStoreWriter():
+    """Writes the fill percents of a batch to a new store in `directory` as the
+    pages are read. Anything stored there before is replaced.
+
+    The fills are written to a memory-mapped file sized for `image_names`, so
+    storing a page only copies its row into the page cache of the OS.
+    """
+    store: FillStore
+
+    def __init__(self, directory: pathlib.Path,
+                 form_variant: grid_i.FormVariant,
+                 image_names: tp.List[str]):
+        os.makedirs(str(directory), exist_ok=True)
+        # Until the new store is finished, the folder must not look like a
+        # finished one.
+        try:
+            os.remove(str(directory / PAGES_FILE))
+        except FileNotFoundError:
+            pass
+        shape = (len(image_names),
+                 grid_i.get_compiled_layout(form_variant).num_bubbles)
+        self.store = FillStore(
+            directory, form_variant, image_names,
+            np.lib.format.open_memmap(str(directory / FILLS_FILE),
+                                      mode="w+",
+                                      dtype=np.float16,
+                                      shape=shape),
+            np.lib.format.open_memmap(str(directory / REJECTED_FILE),
+                                      mode="w+",
+                                      dtype=np.bool_,
+                                      shape=(len(image_names), )))
+
+    def add(self, index: int, page: page_processing.PageResult):
+        """Store the page read from the file at `index` of the batch."""
+        if page.rejected or page.fill_percents is None:
+            self.store.rejected[index] = True
+        else:
+            self.store.fills[index] = page.fill_percents
+
+    def finish(self) -> FillStore:
+        """Save every page to disk and mark the store as finished."""
+        self.store.fills.flush()
+        self.store.rejected.flush()
+        path = self.store.directory / PAGES_FILE
+        temporary_path = path.with_name(path.name + ".tmp")
+        with open(str(temporary_path), "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "version": STORE_VERSION,
+                    "form_variant": self.store.form_variant.name,
+                    "image_names": self.store.image_names
+                }, file)
+        os.replace(str(temporary_path), str(path))
+        return self.store
+
+
+def open_fill_store(directory: pathlib.Path) -> FillStore:
+    """Open a finished store for reading. Its fills are memory-mapped, so only
+    the pages that are read are loaded."""
+    try:
+        with open(str(directory / PAGES_FILE), encoding="utf-8") as file:
+            pages = json.load(file)
+    except FileNotFoundError:
+        raise ValueError(
+            f"'{directory}' is not a finished fill store. Read the sheets "
+            "with --fill-store to make one.")
+    if pages.get("version") != STORE_VERSION:
+        raise ValueError(f"The fill store in '{directory}' was made by another "
+                         "version of this program. Read the sheets again.")
+    form_variant = grid_i.FORM_VARIANTS[pages["form_variant"]]
+    image_names: tp.List[str] = pages["image_names"]
+    fills = np.load(str(directory / FILLS_FILE), mmap_mode="r")
+    rejected = np.load(str(directory / REJECTED_FILE), mmap_mode="r")
+    if fills.shape != (len(image_names),
+                       grid_i.get_compiled_layout(form_variant).num_bubbles
+                       ) or rejected.shape != (len(image_names), ):
+        raise ValueError(f"The fill store in '{directory}' is damaged.")
+    return FillStore(directory, form_variant, image_names, fills, rejected)
@@ -49,12 +49,17 @@ def polygon_to_contour(polygon: Polygon) -> np.ndarray:
     return np.array([[[point.x, point.y]] for point in polygon])
 
 
+def simplify_contour(contour: np.ndarray) -> np.ndarray:
+    """Approximate the simple polygon for the contour. Returns an OpenCV
+    contour in the same direction as the original."""
+    perimeter = cv2.arcLength(contour, True)
+    return cv2.approxPolyDP(contour, 0.05 * perimeter, True)
+
+
 def approx_poly(contour: np.ndarray) -> Polygon:
     """Approximate the simple polygon for the contour. Returns a polygon in
     clockwise order."""
-    perimeter = cv2.arcLength(contour, True)
-    simple = cv2.approxPolyDP(contour, 0.05 * perimeter, True)
-    polygon = contour_to_polygon(simple)
+    polygon = contour_to_polygon(simplify_contour(contour))
     return polygon_to_clockwise(polygon)
 
 
@@ -104,11 +109,44 @@ def calc_side_lengths(contour: Polygon) -> tp.List[float]:
     return result
 
 
-def all_approx_square(contour: Polygon) -> bool:
+def calc_signed_area_array(polygons: np.ndarray) -> np.ndarray:
+    """For an `(n, k, 2)` array of `n` polygons with `k` vertexes each, returns
+    the area of each polygon. Areas are positive for clockwise polygons, like
+    `cv2.contourArea(contour, True)`."""
+    xs = polygons[..., 0].astype(float)
+    ys = polygons[..., 1].astype(float)
+    return np.sum(xs * np.roll(ys, -1, axis=1) - np.roll(xs, -1, axis=1) * ys,
+                  axis=1) / 2
+
+
+def calc_side_lengths_array(polygons: np.ndarray) -> np.ndarray:
+    """For an `(n, k, 2)` array of polygons, returns an `(n, k)` array where
+    element `[j, i]` is the distance from point `i` to point `i+1` of polygon
+    `j`. See `calc_side_lengths`."""
+    points = polygons.astype(float)
+    return np.linalg.norm(np.roll(points, -1, axis=1) - points, axis=2)
+
+
+def calc_corner_angles_array(polygons: np.ndarray) -> np.ndarray:
+    """For an `(n, k, 2)` array of polygons, returns an `(n, k)` array where
+    element `[j, i]` is the angle between points `i-1`, `i`, and `i+1` of
+    polygon `j`. See `calc_corner_angles` - unlike it, the cosines are not
+    rounded, so the results can differ very slightly."""
+    points = polygons.astype(float)
+    to_previous = np.roll(points, 1, axis=1) - points
+    to_next = np.roll(points, -1, axis=1) - points
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cosines = np.sum(to_previous * to_next, axis=2) / (
+            np.linalg.norm(to_previous, axis=2) *
+            np.linalg.norm(to_next, axis=2))
+    return np.arccos(np.clip(cosines, -1, 1))
+
+
+def all_approx_square(contour: Polygon, tolerance: float = 0.15) -> bool:
     """Returns true if every angle in `contour` is approximately right
-    (90deg)."""
+    (90deg), within `tolerance` (see `math_utils.all_approx_equal`)."""
     angles = calc_corner_angles(contour)
-    return math_utils.all_approx_equal(angles, math.pi / 2)
+    return math_utils.all_approx_equal(angles, math.pi / 2, tolerance)
 
 
 def line_from_points(point_a: Point, point_b: Point) -> Line:
@@ -230,6 +268,16 @@ class ChangeOfBasisTransformer():
                            (point_vector - self._rotation_matrix))
         return Point(result[0][0], result[1][0])
 
+    def from_basis_array(self, points: np.ndarray) -> np.ndarray:
+        """Transform an array of points, where the last axis is (x, y), out of
+        the basis all at once."""
+        # Stacking the points as N 2x1 vectors (rather than one 2xN matrix)
+        # gives bit-for-bit the same results as `from_basis`.
+        point_vectors = np.reshape(points, (-1, 2, 1)).astype(float)
+        result = np.matmul(self._transformation_matrix_inv,
+                           (point_vectors - self._rotation_matrix))
+        return np.reshape(result, np.shape(points))
+
     def poly_to_basis(self, polygon: Polygon) -> Polygon:
         return [self.to_basis(point) for point in polygon]
 
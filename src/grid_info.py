@@ -1,12 +1,19 @@
 import enum
+import functools
 import typing as tp
 
+import numpy as np
+
 import alphabet
 from geometry_utils import Orientation
 
 KEY_STUDENT_ID = "9999999999"
 GRID_HORIZONTAL_CELLS = 36
 GRID_VERTICAL_CELLS = 48
+# The size, in pixels, of each grid cell when a page is rectified. This is just
+# under the cell size of a page at the default working size (about 58 pixels),
+# so pages read about the same rectified as they do in place.
+CANONICAL_CELL_SIZE = 56
 
 
 class Field(enum.Enum):
@@ -65,19 +72,117 @@ class GridGroupInfo():
 
 
 class FormVariant():
+    name: str
     fields: tp.Dict[Field, tp.Optional[GridGroupInfo]]
     questions: tp.List[GridGroupInfo]
     num_questions: int
+    canonical_cell_size: int
 
-    def __init__(self, fields: tp.Dict[Field, tp.Optional[GridGroupInfo]],
-                 questions: tp.List[GridGroupInfo]):
+    def __init__(self,
+                 name: str,
+                 fields: tp.Dict[Field, tp.Optional[GridGroupInfo]],
+                 questions: tp.List[GridGroupInfo],
+                 canonical_cell_size: int = CANONICAL_CELL_SIZE):
+        self.name = name
         self.fields = fields
         self.questions = questions
         self.num_questions = len(questions)
+        self.canonical_cell_size = canonical_cell_size
+
+    @property
+    def canonical_size(self) -> tp.Tuple[int, int]:
+        """The `(width, height)` in pixels of the grid when a page is
+        rectified."""
+        return (GRID_HORIZONTAL_CELLS * self.canonical_cell_size,
+                GRID_VERTICAL_CELLS * self.canonical_cell_size)
+
+
+class CompiledLayout():
+    """Every bubble on a form variant, flattened into arrays so that a page can
+    be read with array indexing instead of building field objects. The arrays
+    have one entry per bubble: first the fields (in `FormVariant.fields`
+    order, skipping fields that aren't on the form), then the questions.
+
+    Members:
+        across, down: The grid cell of each bubble.
+        group: Index of the field or question that each bubble belongs to.
+        field: Index of the bubble's field within its group, ie the letter of
+            a name or the digit of an ID.
+        bubble: Index of the bubble within its field.
+        field_keys: The fields on the form. Group `i` is `field_keys[i]`, and
+            question `q` is group `len(field_keys) + q`.
+        group_slices: The range of bubbles in each group.
+        group_shapes: The `(num_fields, field_length)` of each group.
+        group_types: The `FieldType` of each group.
+    """
+    across: np.ndarray
+    down: np.ndarray
+    group: np.ndarray
+    field: np.ndarray
+    bubble: np.ndarray
+    field_keys: tp.List[Field]
+    group_slices: tp.List[slice]
+    group_shapes: tp.List[tp.Tuple[int, int]]
+    group_types: tp.List[FieldType]
+
+    def __init__(self, form_variant: FormVariant):
+        self.field_keys = [
+            key for key, value in form_variant.fields.items()
+            if value is not None
+        ]
+        groups = [
+            tp.cast(GridGroupInfo, form_variant.fields[key])
+            for key in self.field_keys
+        ] + form_variant.questions
+        self.group_shapes = [(info.num_fields, info.field_length)
+                             for info in groups]
+        self.group_types = [info.fields_type for info in groups]
+
+        tables: tp.List[tp.List[np.ndarray]] = [[], [], [], [], []]
+        self.group_slices = []
+        start = 0
+        for i, info in enumerate(groups):
+            field, bubble = [
+                indexes.ravel() for indexes in np.indices(
+                    (info.num_fields, info.field_length))
+            ]
+            if info.field_orientation is Orientation.VERTICAL:
+                across = info.horizontal_start + field
+                down = info.vertical_start + bubble
+            else:
+                across = info.horizontal_start + bubble
+                down = info.vertical_start + field
+            for table, values in zip(
+                    tables,
+                [across, down, np.full(field.size, i), field, bubble]):
+                table.append(values)
+            self.group_slices.append(slice(start, start + field.size))
+            start += field.size
+        (self.across, self.down, self.group, self.field,
+         self.bubble) = [np.concatenate(table) for table in tables]
+
+    @property
+    def num_bubbles(self) -> int:
+        return self.across.size
+
+    def split(self, values: np.ndarray) -> tp.List[np.ndarray]:
+        """Split an array with one value per bubble into one 2D array per group,
+        indexed by `[field][bubble]`."""
+        return [
+            values[group_slice].reshape(shape)
+            for group_slice, shape in zip(self.group_slices, self.group_shapes)
+        ]
+
+
+@functools.lru_cache(maxsize=None)
+def get_compiled_layout(form_variant: FormVariant) -> CompiledLayout:
+    """Get the compiled layout of a form variant. Each variant is only compiled
+    once per process."""
+    return CompiledLayout(form_variant)
 
 
 form_75q = FormVariant(
-    {
+    "75q", {
         Field.LAST_NAME:
         GridGroupInfo(1, 3, 12, fields_type=FieldType.LETTER),
         Field.FIRST_NAME:
@@ -104,7 +209,7 @@ form_75q = FormVariant(
     ])
 
 form_150q = FormVariant(
-    {
+    "150q", {
         Field.STUDENT_ID:
         GridGroupInfo(25, 3, 10),
         Field.COURSE_ID:
@@ -124,6 +229,12 @@ form_150q = FormVariant(
         for i in range(150)
     ])
 
+# Every form variant, by name.
+FORM_VARIANTS: tp.Dict[str, FormVariant] = {
+    variant.name: variant
+    for variant in (form_75q, form_150q)
+}
+
 
 class dimensions:
     vertical_cells = 36
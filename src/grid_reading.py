@@ -1,8 +1,6 @@
 """Functions for establishing and reading the grid."""
 
-# pyright: reportIncompatibleMethodOverride=false
-
-import abc
+import functools
 import pathlib
 import typing as tp
 
@@ -11,6 +9,7 @@ import numpy as np
 from numpy import ma
 
 import alphabet
+import answer_masks
 import geometry_utils
 import grid_info
 import image_utils
@@ -31,26 +30,66 @@ Notes:
 """
 GRID_CELL_CROP_FRACTION = 0.25
 
+"""Pixels kept around the grid when cropping the page down to it. Must be larger
+than the reach of any per-pixel operation done on the crop (the 3 x 3 dilation),
+so that the pixels under every cell are the same as they would be on the full
+page."""
+GRID_REGION_MARGIN = 4
+
+"""How far, as a fraction of a grid cell, the top right corner can be from where
+the other three corners put it for a page to be rectified with all four corners.
+Further than that, the top right mark was most likely misread, so the page is
+rectified with just the other three like `Grid` does."""
+MAX_PERSPECTIVE_ERROR = 0.5
+
 # TODO: Import from geometry_utils when pyright#284 is fixed.
 Polygon = tp.List[geometry_utils.Point]
 
 
 class Grid:
+    """A grid of cells laid over a page image.
+
+    Members:
+        lattice: The image coordinates of every cell vertex, transformed from
+            the grid's basis once when the grid is created. `lattice[down][across]`
+            is the `(x, y)` of the top left vertex of that cell.
+        cell_ranges: The range of image coordinates that each cell touches.
+            `cell_ranges[down][across]` is `(min_x, max_x, min_y, max_y)`.
+        offset: The `(x, y)` image coordinates of the top left pixel of
+            `image`. The lattice and cell ranges are always in the coordinates
+            of the full page, even if `image` is only a crop of it.
+        image: The image the grid is laid over, or None if it was packed into
+            `packed_image` (see `get_image`).
+        image_shape: The `(height, width)` of the image.
+        packed_image: The image packed into bits (see
+            `image_utils.pack_black_and_white`), or None if it isn't pure black
+            and white. Fill percents are counted on this when possible, and
+            only this copy is kept to save memory.
+    """
     corners: Polygon
     horizontal_cells: int
     vertical_cells: int
-    image: np.ndarray
+    image: tp.Optional[np.ndarray]
+    image_shape: tp.Tuple[int, int]
     basis_transformer: geometry_utils.ChangeOfBasisTransformer
+    lattice: np.ndarray
+    cell_ranges: np.ndarray
+    offset: tp.Tuple[int, int]
+    packed_image: tp.Optional[np.ndarray]
 
     def __init__(self,
                  corners: geometry_utils.Polygon,
                  horizontal_cells: int,
                  vertical_cells: int,
                  image: np.ndarray,
-                 save_path: tp.Optional[pathlib.PurePath] = None):
+                 save_path: tp.Optional[pathlib.PurePath] = None,
+                 offset: tp.Tuple[int, int] = (0, 0)):
         """Initiate a new Grid. Corners should be clockwise starting from the
         top left - if not, the grid will have unexpected behavior.
 
+        `image` may be a crop of the page (see `get_grid_region`) whose top
+        left pixel is at `offset`; the corners are still in page coordinates.
+
         If `save_path` is provided, will save the resulting image to this location
         as "grid.jpg". Used for debugging purposes."""
         self.corners = corners
@@ -62,52 +101,78 @@ class Grid:
         self.horizontal_cell_size = 1 / self.horizontal_cells
         self.vertical_cell_size = 1 / self.vertical_cells
 
-        self.image = image
+        lattice_in_basis = np.stack(np.meshgrid(
+            np.arange(horizontal_cells + 1) * self.horizontal_cell_size,
+            np.arange(vertical_cells + 1) * self.vertical_cell_size),
+                                    axis=-1)
+        self.lattice = self.basis_transformer.from_basis_array(
+            lattice_in_basis)
+        # The vertices of every cell, clockwise from the top left.
+        cell_vertices = np.stack([
+            self.lattice[:-1, :-1], self.lattice[:-1, 1:],
+            self.lattice[1:, 1:], self.lattice[1:, :-1]
+        ],
+                                 axis=2)
+        # Cannot just use the top-left and bottom-right points - what if the
+        # grid is rotated 30 degrees? We want to use the absolute max and min
+        # coordinates.
+        self.cell_ranges = np.stack([
+            cell_vertices[..., 0].min(axis=2), cell_vertices[..., 0].max(
+                axis=2), cell_vertices[..., 1].min(axis=2),
+            cell_vertices[..., 1].max(axis=2)
+        ],
+                                    axis=-1)
+
+        self.offset = offset
+        self.image_shape = (image.shape[0], image.shape[1])
+        self.packed_image = image_utils.pack_black_and_white(image)
+        self.image = image if self.packed_image is None else None
 
         if save_path:
             image_utils.save_image(save_path / "grid.jpg", self.draw_grid())
 
-    def _get_cell_shape_in_basis(self, across: int,
-                                 down: int) -> geometry_utils.Polygon:
-        return [
-            geometry_utils.Point(across * self.horizontal_cell_size,
-                                 down * self.vertical_cell_size),
-            geometry_utils.Point((across + 1) * self.horizontal_cell_size,
-                                 down * self.vertical_cell_size),
-            geometry_utils.Point((across + 1) * self.horizontal_cell_size,
-                                 (down + 1) * self.vertical_cell_size),
-            geometry_utils.Point(across * self.horizontal_cell_size,
-                                 (down + 1) * self.vertical_cell_size),
-        ]
-
-
     def get_cell_range(self, across: int, down: int) -> tp.Tuple[tp.Tuple[float, float], tp.Tuple[float, float]]:
         """Get the range of x and y-dimensions that this cell touches, in the basis that the cell
         is given.
         
         Returns tuple of ((min_x, max_x), (min_y, max_y))"""
-        cell = self.get_cell_shape(across, down)
-        # Cannot just use the top-left and bottom-right points according to the polygon - what if
-        # the cell is rotated 30 degrees? We want to use the absolute max and min coordinates.
-        x_coords = [point.x for point in cell]
-        y_coords = [point.y for point in cell]
-        return (min(x_coords), max(x_coords)), (min(y_coords), max(y_coords))
+        min_x, max_x, min_y, max_y = self.cell_ranges[down, across]
+        return (min_x, max_x), (min_y, max_y)
 
     def get_cell_shape(self, across: int, down: int) -> geometry_utils.Polygon:
         """Get the shape of a cell using it's 0-based index. Returns the contour
         in CW direction starting with the top left cell."""
-        return self.basis_transformer.poly_from_basis(self._get_cell_shape_in_basis(across, down))
+        return [
+            geometry_utils.Point(*self.lattice[y, x])
+            for x, y in [(across, down), (across + 1, down),
+                         (across + 1, down + 1), (across, down + 1)]
+        ]
 
     def get_unmasked_cell_matrix(self, across: int, down: int) -> np.ndarray:
         """Get the matrix of pixels in the grid cell area. Note if the grid is rotated, this will
         include pixels outside the cell since the cell will be a diamond and this will be a
         rectangle."""
         ((min_x, max_x), (min_y, max_y)) = self.get_cell_range(across, down)
+        offset_x, offset_y = self.offset
         # Add 1 for inclusive indexing. Numpy will not accept even rounded floats as indexes.
-        return self.image[
-            int(round(min_y)):int(round(max_y + 1)),
-            int(round(min_x)):int(round(max_x + 1))
-]
+        rows = slice(int(round(min_y)) - offset_y, int(round(max_y + 1)) - offset_y)
+        columns = slice(int(round(min_x)) - offset_x, int(round(max_x + 1)) - offset_x)
+        if self.image is not None:
+            return self.image[rows, columns]
+        # Packing doesn't change the rows, so only the rows of the cell are
+        # unpacked. They are unpacked whole so the columns are sliced exactly
+        # like the image would be.
+        return image_utils.unpack_black_and_white(
+            tp.cast(np.ndarray, self.packed_image)[rows],
+            self.image_shape[1])[:, columns]
+
+    def get_image(self) -> np.ndarray:
+        """Get the image the grid is laid over, unpacking it if needed. Only
+        used for drawing."""
+        if self.image is not None:
+            return self.image
+        return image_utils.unpack_black_and_white(
+            tp.cast(np.ndarray, self.packed_image), self.image_shape[1])
 
     def get_cell_center(self, across: int, down: int) -> geometry_utils.Point:
         """Get the center point of the cell."""
@@ -136,193 +201,472 @@ class Grid:
         masked = ma.masked_array(unmasked, mask)
         return masked
 
+    def get_fill_percents(self, across: np.ndarray,
+                          down: np.ndarray) -> np.ndarray:
+        """Get the fill percent of many cells at once. `across` and `down` are
+        matching arrays of cell indexes.
+
+        Gives the same results as `get_fill_percent` on each cell's
+        `get_masked_cell_matrix`, but cells whose pixel windows are the same
+        size are gathered and summed in one operation using a shared circle
+        stencil instead of building a masked array for every cell. If the image
+        is black and white, this counts bits in the packed image instead of
+        adding up bytes.
+        """
+        across = np.asarray(across, int)
+        down = np.asarray(down, int)
+        ranges = self.cell_ranges[down, across]
+        # Same rounding (half to even) and inclusive end as the cell matrix
+        # slices. The offset is applied after rounding so a crop reads exactly
+        # the same pixels as the full page.
+        offset_x, offset_y = self.offset
+        x_starts = np.rint(ranges[:, 0]).astype(int) - offset_x
+        x_ends = np.rint(ranges[:, 1] + 1).astype(int) - offset_x
+        y_starts = np.rint(ranges[:, 2]).astype(int) - offset_y
+        y_ends = np.rint(ranges[:, 3] + 1).astype(int) - offset_y
+
+        results = np.zeros(across.size, float)
+        in_bounds = ((x_starts >= 0) & (y_starts >= 0) &
+                     (x_ends <= self.image_shape[1]) &
+                     (y_ends <= self.image_shape[0]))
+        # Cells that run off the image are rare; read them one at a time so
+        # they are cropped exactly like a single cell matrix would be.
+        for i in np.flatnonzero(~in_bounds):
+            results[i] = image_utils.get_fill_percent(
+                self.get_masked_cell_matrix(across[i], down[i]))
+        if self.packed_image is not None:
+            results[in_bounds] = _get_packed_windows_fill_percents(
+                self.packed_image, x_starts[in_bounds], x_ends[in_bounds],
+                y_starts[in_bounds], y_ends[in_bounds])
+        else:
+            results[in_bounds] = _get_windows_fill_percents(
+                tp.cast(np.ndarray, self.image), x_starts[in_bounds], x_ends[in_bounds],
+                y_starts[in_bounds], y_ends[in_bounds])
+        return results
+
+    def get_image_position(self, point: geometry_utils.Point) -> tp.Tuple[int, int]:
+        """Get the pixel of `image` that a point in page coordinates falls on,
+        for drawing."""
+        return (int(round(point.x)) - self.offset[0],
+                int(round(point.y)) - self.offset[1])
+
     def draw_grid(self):
         """Draws the grid on the image, returning a copy with red dots at grid
         points."""
-        image = image_utils.bw_to_bgr(self.image)
+        image = image_utils.bw_to_bgr(self.get_image())
         for x in range(self.horizontal_cells):
             for y in range(self.vertical_cells):
                 points = self.get_cell_shape(x, y)
                 for point in points:
-                    cv2.circle(image,
-                               (int(round(point.x)), int(round(point.y))), 2,
+                    cv2.circle(image, self.get_image_position(point), 2,
                                (0, 0, 255), -1)
                 center, radius = self.get_cell_circle(x, y)
-                cv2.circle(image, (int(round(center.x)), int(round(center.y))),
+                cv2.circle(image, self.get_image_position(center),
                            int(round(radius)), (255, 0, 0), 1)
         return image
 
 
-class _GridField(abc.ABC):
-    """A grid field is one set of grid cells that represents a value, ie a single
-    letter or number."""
-
-    horizontal_start_index: float
-    vertical_start_index: float
-    orientation: geometry_utils.Orientation
-    num_cells: int
-    grid: Grid
-
-    def __init__(self, grid: Grid, horizontal_start: int, vertical_start: int,
-                 orientation: geometry_utils.Orientation, num_cells: int):
-        self.vertical_start = vertical_start
-        self.horizontal_start = horizontal_start
-        self.orientation = orientation
-        self.num_cells = num_cells
-        self.grid = grid
-
-    @abc.abstractclassmethod
-    def read_value(self, threshold: float, fill_percents: tp.List[float]
-                   ) -> tp.Union[tp.List[str], tp.List[int]]:
-        ...
-
-    def _read_value_indexes(self, threshold: float,
-                            fill_percents: tp.List[float]) -> tp.List[int]:
-        filled = [
-            i for i in range(self.num_cells) if fill_percents[i] > threshold
-        ]
-        return filled
-
-    def get_cell_matrixes(self) -> tp.List[ma.MaskedArray]:
-        results: tp.List[ma.MaskedArray] = []
-        is_vertical = self.orientation is geometry_utils.Orientation.VERTICAL
-        for i in range(self.num_cells):
-            x = self.horizontal_start if is_vertical else self.horizontal_start + i
-            y = self.vertical_start if not is_vertical else self.vertical_start + i
-
-            # Have to crop the edges to avoid getting the borders of the write-in
-            # squares in the cells
-            matrix = self.grid.get_masked_cell_matrix(x, y)
+def get_grid_region(
+        corners: geometry_utils.Polygon,
+        image_shape: tp.Tuple[int, ...],
+        margin: int = GRID_REGION_MARGIN) -> tp.Tuple[slice, slice]:
+    """Get the region of the page that a grid laid over `corners` covers, plus
+    `margin` pixels on every side and clipped to the image. Returned as
+    `(rows, columns)` slices, so `image[region]` is a view of the region and
+    `(columns.start, rows.start)` is its offset."""
+    # The grid is a parallelogram spanned from the top left, bottom left and
+    # bottom right corners, so its top right vertex is not `corners[1]`.
+    transformer = geometry_utils.ChangeOfBasisTransformer(
+        corners[0], corners[3], corners[2])
+    vertices = transformer.from_basis_array(
+        np.array([[0, 0], [1, 0], [1, 1], [0, 1]], float))
+    min_x, min_y = np.floor(vertices.min(axis=0)).astype(int) - margin
+    max_x, max_y = np.ceil(vertices.max(axis=0)).astype(int) + margin
+    height, width = image_shape[:2]
+    return (slice(max(min_y, 0), min(max_y + 1, height)),
+            slice(max(min_x, 0), min(max_x + 1, width)))
+
+
+def get_canonical_corners(
+        form_variant: grid_info.FormVariant,
+        margin: int = GRID_REGION_MARGIN) -> geometry_utils.Polygon:
+    """Get the corners of the grid on a page rectified by `rectify_page`, in CW
+    order starting with the top left."""
+    width, height = form_variant.canonical_size
+    return [
+        geometry_utils.Point(margin, margin),
+        geometry_utils.Point(margin + width, margin),
+        geometry_utils.Point(margin + width, margin + height),
+        geometry_utils.Point(margin, margin + height)
+    ]
 
-            results.append(matrix)
-        return results
 
-    def get_all_fill_percents(self) -> tp.List[float]:
-        results = [
-            image_utils.get_fill_percent(square)
-            for square in self.get_cell_matrixes()
-        ]
+def rectify_page(
+        image: np.ndarray,
+        corners: geometry_utils.Polygon,
+        form_variant: grid_info.FormVariant,
+        save_path: tp.Optional[pathlib.PurePath] = None,
+        margin: int = GRID_REGION_MARGIN
+) -> tp.Tuple[np.ndarray, geometry_utils.Polygon]:
+    """Warp the grid on the page to the form variant's canonical raster, using
+    all four of its corners. Unlike the grid's own transform, which only uses
+    three corners, this also straightens out pages scanned at a slight
+    perspective. The raster keeps `margin` pixels around the grid.
+
+    Returns the raster and the corners of the grid on it.
+
+    If `save_path` is provided, will save the resulting image to this location
+    as "rectified.jpg". Used for debugging purposes.
+    """
+    canonical_corners = get_canonical_corners(form_variant, margin)
+    width, height = form_variant.canonical_size
+    source = np.array([[p.x, p.y] for p in corners], np.float32)
+    # The top right corner of the parallelogram spanned by the other three.
+    affine_top_right = source[0] + source[2] - source[3]
+    cell_size = (np.linalg.norm(source[2] - source[3]) /
+                 grid_info.GRID_HORIZONTAL_CELLS)
+    if np.linalg.norm(source[1] -
+                      affine_top_right) > MAX_PERSPECTIVE_ERROR * cell_size:
+        source[1] = affine_top_right
+    transform = cv2.getPerspectiveTransform(
+        source,
+        np.array([[p.x, p.y] for p in canonical_corners], np.float32))
+    # One extra pixel so the cells on the right and bottom edges fit; see
+    # `Grid.get_unmasked_cell_matrix`.
+    result = cv2.warpPerspective(image,
+                                 transform,
+                                 (width + 2 * margin + 1,
+                                  height + 2 * margin + 1),
+                                 flags=cv2.INTER_LINEAR,
+                                 borderMode=cv2.BORDER_REPLICATE)
+    if save_path:
+        image_utils.save_image(save_path / "rectified.jpg", result)
+    return result, canonical_corners
+
+
+@functools.lru_cache(maxsize=None)
+def _get_cell_stencil(height: int,
+                      width: int) -> tp.Tuple[np.ndarray, np.ndarray]:
+    """Get the row and column offsets of the pixels inside the cell circle for a
+    cell matrix of the given size. This is the unmasked area of
+    `Grid.get_masked_cell_matrix`."""
+    mask = np.ones((height, width), np.uint8)
+    unit_dimension = (height + width) / 2
+    center = (round(height / 2), round(width / 2))
+    circle_radius = (unit_dimension / 2) * (1 - (GRID_CELL_CROP_FRACTION / 2))
+    cv2.circle(mask, center, int(circle_radius), 0, -1)
+    rows, columns = np.nonzero(mask == 0)
+    return rows, columns
+
+
+def _get_windows_fill_percents(image: np.ndarray, x_starts: np.ndarray,
+                               x_ends: np.ndarray, y_starts: np.ndarray,
+                               y_ends: np.ndarray) -> np.ndarray:
+    """Get the fill percent inside the cell circle of each window
+    `image[y_start:y_end, x_start:x_end]`. Windows must lie inside the image."""
+    results = np.zeros(x_starts.size, float)
+    shapes = np.stack([y_ends - y_starts, x_ends - x_starts], axis=1)
+    for height, width in np.unique(shapes, axis=0):
+        group = np.flatnonzero((shapes[:, 0] == height) &
+                               (shapes[:, 1] == width))
+        rows, columns = _get_cell_stencil(int(height), int(width))
+        if rows.size == 0:
+            continue
+        # Gather just the pixels under the stencil, for every window at once,
+        # as offsets into the flattened image.
+        offsets = rows * image.shape[1] + columns
+        starts = y_starts[group] * image.shape[1] + x_starts[group]
+        pixels = np.take(image.ravel(), starts[:, np.newaxis] + offsets)
+        sums = pixels.sum(axis=1, dtype=np.int64)
+        results[group] = 1 - ((sums / rows.size) / 255)
+    return results
+
+
+# The number of set bits in every byte value.
+_BYTE_POPCOUNTS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, np.newaxis],
+                                axis=1).sum(axis=1, dtype=np.uint8)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_packed_cell_stencil(
+        height: int, width: int,
+        shift: int) -> tp.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Get `_get_cell_stencil` packed into bits, for a window that starts
+    `shift` bits into a byte of a packed image row.
+
+    Returns the row and byte column offsets of every byte that the stencil
+    touches, and the bit mask of the stencil pixels in each of those bytes."""
+    rows, columns = _get_cell_stencil(height, width)
+    bits = columns + shift
+    mask = np.zeros((height, (shift + width + 7) // 8), np.uint8)
+    np.bitwise_or.at(mask, (rows, bits // 8),
+                     (0x80 >> (bits % 8)).astype(np.uint8))
+    mask_rows, mask_columns = np.nonzero(mask)
+    return mask_rows, mask_columns, mask[mask_rows, mask_columns]
+
+
+def _get_packed_windows_fill_percents(packed_image: np.ndarray,
+                                      x_starts: np.ndarray,
+                                      x_ends: np.ndarray,
+                                      y_starts: np.ndarray,
+                                      y_ends: np.ndarray) -> np.ndarray:
+    """Same as `_get_windows_fill_percents`, for a black and white image packed
+    with `image_utils.pack_black_and_white`. Windows that start at a different
+    bit of a byte need a differently shifted stencil, so they are grouped by
+    that as well as by size."""
+    results = np.zeros(x_starts.size, float)
+    if x_starts.size == 0:
         return results
+    heights = y_ends - y_starts
+    widths = x_ends - x_starts
+    shifts = x_starts % 8
+    # One number per window rather than `np.unique` over rows, which is much
+    # slower for the number of windows on a page.
+    keys = (heights * (widths.max() + 1) + widths) * 8 + shifts
+    _, first_indexes, inverse = np.unique(keys,
+                                          return_index=True,
+                                          return_inverse=True)
+    groups = np.split(np.argsort(inverse, kind="stable"),
+                      np.cumsum(np.bincount(inverse))[:-1])
+    for first, group in zip(first_indexes.tolist(), groups):
+        height, width, shift = heights[first], widths[first], shifts[first]
+        num_pixels = _get_cell_stencil(int(height), int(width))[0].size
+        if num_pixels == 0:
+            continue
+        rows, byte_columns, masks = _get_packed_cell_stencil(
+            int(height), int(width), int(shift))
+        offsets = rows * packed_image.shape[1] + byte_columns
+        starts = (y_starts[group] * packed_image.shape[1] +
+                  x_starts[group] // 8)
+        packed = np.take(packed_image.ravel(), starts[:, np.newaxis] + offsets)
+        bit_counts = np.take(_BYTE_POPCOUNTS, packed & masks)
+        white_pixels = bit_counts.sum(axis=1,
+                                      dtype=np.uint32).astype(np.int64)
+        # Scaled back up to the sum of the pixel values, so that the result is
+        # exactly the same as adding up the bytes.
+        results[group] = 1 - (((white_pixels * 255) / num_pixels) / 255)
+    return results
+
+
+class PageReader():
+    """Reads the fields and answers of one page on demand, remembering every
+    value it has read.
+
+    Fill percents are only calculated for the fields and questions that are
+    asked for. The bubble fill threshold depends on every bubble on the page,
+    so unless a `threshold` is given, the first read calculates the whole page.
+    If `save_path` is provided, the threshold debugging data is saved there.
+
+    If the `fill_percents` of every bubble on the page are already known (in
+    the order of `grid_info.get_compiled_layout`), they are read instead of the
+    grid, which can then be None.
+    """
+    grid: tp.Optional[Grid]
+    form_variant: grid_info.FormVariant
+    layout: grid_info.CompiledLayout
+    save_path: tp.Optional[pathlib.PurePath]
+    _threshold: tp.Optional[float]
+    _group_fill_percents: tp.Dict[int, np.ndarray]
+    _group_values: tp.Dict[int, tp.List[tp.Union[tp.List[str],
+                                                 tp.List[int]]]]
 
-
-class NumberGridField(_GridField):
-    """A number grid field is one set of grid cells that represents a digit."""
-    def read_value(self, threshold: float,
-                   fill_percents: tp.List[float]) -> tp.List[int]:
-        return super()._read_value_indexes(threshold, fill_percents)
-
-
-class LetterGridField(_GridField):
-    """A number grid field is one set of grid cells that represents a letter."""
-    def read_value(self, threshold: float,
-                   fill_percents: tp.List[float]) -> tp.List[str]:
-        return [
-            alphabet.letters[i]
-            for i in super()._read_value_indexes(threshold, fill_percents)
-        ]
-
-
-class _GridFieldGroup(abc.ABC):
-    """A grid field group is a group of grid fields, ie a word. Do not use
-    directly."""
-
-    fields: tp.Sequence[_GridField]
-
-    @abc.abstractclassmethod
-    def __init__(self, grid: Grid, horizontal_start: int, vertical_start: int,
-                 num_fields: int, field_length: int,
-                 field_orientation: geometry_utils.Orientation):
-        ...
-
-    def read_value(self, threshold: float,
-                   fill_percents: tp.List[tp.List[float]]
-                   ) -> tp.List[tp.Union[tp.List[str], tp.List[int]]]:
-        """Calculate the field value using precalculated fill percents."""
-        return [
-            field.read_value(threshold, fill_percents[i])
-            for i, field in enumerate(self.fields)
-        ]
-
-    def get_all_fill_percents(self) -> tp.List[tp.List[float]]:
-        return [field.get_all_fill_percents() for field in self.fields]
-
-
-class NumberGridFieldGroup(_GridFieldGroup):
-    """A number grid field group is one group of fields that represents an
-    entire number."""
-    def __init__(self, grid: Grid, horizontal_start: int, vertical_start: int,
-                 num_fields: int, field_length: int,
-                 field_orientation: geometry_utils.Orientation):
-        fields_vertical = field_orientation is geometry_utils.Orientation.VERTICAL
-        self.fields = [
-            NumberGridField(
-                grid,
-                horizontal_start + i if fields_vertical else horizontal_start,
-                vertical_start + i if not fields_vertical else vertical_start,
-                field_orientation, field_length) for i in range(num_fields)
-        ]
-
-    def read_value(self, threshold: float,
-                   fill_percents: tp.List[tp.List[float]]
-                   ) -> tp.List[tp.List[int]]:
-        return tp.cast(tp.List[tp.List[int]],
-                       super().read_value(threshold, fill_percents))
-
-
-class LetterGridFieldGroup(_GridFieldGroup):
-    """A letter grid field group is one group of fields that represents an
-    entire string."""
-    def __init__(self, grid: Grid, horizontal_start: int, vertical_start: int,
-                 num_fields: int, field_length: int,
-                 field_orientation: geometry_utils.Orientation):
-        fields_vertical = field_orientation is geometry_utils.Orientation.VERTICAL
-        self.fields = [
-            LetterGridField(
-                grid,
-                horizontal_start + i if fields_vertical else horizontal_start,
-                vertical_start + i if not fields_vertical else vertical_start,
-                field_orientation, field_length) for i in range(num_fields)
+    def __init__(self,
+                 grid: tp.Optional[Grid],
+                 form_variant: grid_info.FormVariant,
+                 threshold: tp.Optional[float] = None,
+                 save_path: tp.Optional[pathlib.PurePath] = None,
+                 fill_percents: tp.Optional[np.ndarray] = None):
+        self.grid = grid
+        self.form_variant = form_variant
+        self.layout = grid_info.get_compiled_layout(form_variant)
+        self.save_path = save_path
+        self._threshold = threshold
+        self._group_fill_percents = {}
+        self._group_values = {}
+        if fill_percents is not None:
+            if len(fill_percents) != self.layout.num_bubbles:
+                raise ValueError(f"Expected {self.layout.num_bubbles} fill "
+                                 f"percents, got {len(fill_percents)}.")
+            self._group_fill_percents = dict(
+                enumerate(self.layout.split(np.asarray(fill_percents,
+                                                       float))))
+        elif grid is None:
+            raise ValueError("A grid or fill percents must be given.")
+
+    def _get_field_group(self, field: grid_info.Field) -> tp.Optional[int]:
+        if field not in self.layout.field_keys:
+            return None
+        return self.layout.field_keys.index(field)
+
+    def _get_question_group(self, question: int) -> int:
+        return len(self.layout.field_keys) + question
+
+    def get_fill_percents(self, groups: tp.Sequence[int]) -> tp.List[np.ndarray]:
+        """Get the fill percents of the given layout groups, each indexed by
+        `[field][bubble]`. Groups that haven't been read yet are all read with
+        one call to the fill engine."""
+        missing = [
+            group for group in dict.fromkeys(groups)
+            if group not in self._group_fill_percents
         ]
+        if missing:
+            slices = [self.layout.group_slices[group] for group in missing]
+            indexes = np.concatenate(
+                [np.arange(part.start, part.stop) for part in slices])
+            assert self.grid is not None
+            fill_percents = self.grid.get_fill_percents(
+                self.layout.across[indexes], self.layout.down[indexes])
+            boundaries = np.cumsum([part.stop - part.start
+                                    for part in slices])[:-1]
+            for group, values in zip(missing,
+                                     np.split(fill_percents, boundaries)):
+                self._group_fill_percents[group] = values.reshape(
+                    self.layout.group_shapes[group])
+        return [self._group_fill_percents[group] for group in groups]
+
+    def get_all_fill_percents(
+            self
+    ) -> tp.Tuple[tp.Dict[grid_info.Field, np.ndarray], tp.List[np.ndarray]]:
+        """Get the fill percents of every field and every question."""
+        group_fill_percents = self.get_fill_percents(
+            range(len(self.layout.group_slices)))
+        num_fields = len(self.layout.field_keys)
+        return (dict(
+            zip(self.layout.field_keys, group_fill_percents[:num_fields])),
+                group_fill_percents[num_fields:])
+
+    @property
+    def threshold(self) -> float:
+        if self._threshold is None:
+            field_fill_percents, answer_fill_percents = self.get_all_fill_percents(
+            )
+            self._threshold = calculate_bubble_fill_threshold(
+                field_fill_percents,
+                answer_fill_percents,
+                self.form_variant,
+                save_path=self.save_path)
+        return self._threshold
+
+    def _read_group(self, group: int
+                    ) -> tp.List[tp.Union[tp.List[str], tp.List[int]]]:
+        if group not in self._group_values:
+            [fill_percents] = self.get_fill_percents([group])
+            self._group_values[group] = read_group_value(
+                self.layout.group_types[group], self.threshold, fill_percents)
+        return self._group_values[group]
+
+    def read_field(
+            self, field: grid_info.Field
+    ) -> tp.Optional[tp.List[tp.Union[tp.List[str], tp.List[int]]]]:
+        """Read a field, or `None` if it isn't on this form variant."""
+        group = self._get_field_group(field)
+        return None if group is None else self._read_group(group)
+
+    def read_answer(
+            self,
+            question: int) -> tp.List[tp.Union[tp.List[str], tp.List[int]]]:
+        return self._read_group(self._get_question_group(question))
+
+    def read_answer_masks(self) -> np.ndarray:
+        """Read every answer on the page as a bitmask of the choices that were
+        filled in (see `answer_masks`)."""
+        num_fields = len(self.layout.field_keys)
+        groups = range(num_fields, len(self.layout.group_slices))
+        if any(self.layout.group_shapes[group][0] != 1 for group in groups):
+            raise ValueError("Questions must be a single field.")
+        fill_percents = np.concatenate(
+            [values.ravel() for values in self.get_fill_percents(groups)])
+        bubbles = slice(self.layout.group_slices[num_fields].start, None)
+        filled = fill_percents > self.threshold
+        return answer_masks.from_filled(
+            self.layout.group[bubbles][filled] - num_fields,
+            self.layout.bubble[bubbles][filled],
+            self.form_variant.num_questions)
+
+    def read_field_as_string(self,
+                             field: grid_info.Field) -> tp.Optional[str]:
+        field_group = self.read_field(field)
+        if field_group is not None:
+            return field_group_to_string(field_group)
+        else:
+            return None
 
-    def read_value(self, threshold: float,
-                   fill_percents: tp.List[tp.List[float]]
-                   ) -> tp.List[tp.List[str]]:
-        return tp.cast(tp.List[tp.List[str]],
-                       super().read_value(threshold, fill_percents))
-
+    def read_answer_as_string(self, question: int,
+                              multi_answers_as_f: bool) -> str:
+        answer = field_group_to_string(self.read_answer(question))
+        if not multi_answers_as_f or "|" not in answer:
+            return answer
+        else:
+            return "F"
 
-def get_group_from_info(info: grid_info.GridGroupInfo,
-                        grid: Grid) -> _GridFieldGroup:
-    if info.fields_type is grid_info.FieldType.LETTER:
-        return LetterGridFieldGroup(grid, info.horizontal_start,
-                                    info.vertical_start, info.num_fields,
-                                    info.field_length, info.field_orientation)
-    else:
-        return NumberGridFieldGroup(grid, info.horizontal_start,
-                                    info.vertical_start, info.num_fields,
-                                    info.field_length, info.field_orientation)
 
+def get_all_fill_percents(
+        grid: Grid, form_variant: grid_info.FormVariant
+) -> tp.Tuple[tp.Dict[grid_info.Field, np.ndarray], tp.List[np.ndarray]]:
+    """Calculate the fill percent of every bubble on the form in one pass.
 
-def read_field(field: grid_info.Field, grid: Grid, threshold: float,
-               form_variant: grid_info.FormVariant,
-               fill_percents: tp.List[tp.List[float]]
+    Returns the fill percents of each field and of each question, as 2D arrays
+    indexed by `[field][bubble]`.
+    """
+    return PageReader(grid, form_variant).get_all_fill_percents()
+
+
+def read_group_value(
+        fields_type: grid_info.FieldType, threshold: float,
+        fill_percents: np.ndarray
+) -> tp.List[tp.Union[tp.List[str], tp.List[int]]]:
+    """Read the filled bubbles of every field in a group, given the group's
+    fill percents indexed by `[field][bubble]`."""
+    fill_percents = np.asarray(fill_percents)
+    values: tp.List[tp.List[tp.Any]] = [[] for _ in range(len(fill_percents))]
+    fields, bubbles = np.nonzero(fill_percents > threshold)
+    is_letter = fields_type is grid_info.FieldType.LETTER
+    for field, bubble in zip(fields.tolist(), bubbles.tolist()):
+        values[field].append(alphabet.letters[bubble] if is_letter else bubble)
+    return values
+
+
+def read_field(field: grid_info.Field, threshold: float,
+               form_variant: grid_info.FormVariant, fill_percents: np.ndarray
                ) -> tp.Optional[tp.List[tp.Union[tp.List[str], tp.List[int]]]]:
-    """Shortcut to read a field given just the key for it and the grid object."""
+    """Shortcut to read a field given just the key for it and its fill
+    percents."""
     grid_group_info = form_variant.fields[field]
     if grid_group_info is not None:
-        return get_group_from_info(grid_group_info,
-                                   grid).read_value(threshold, fill_percents)
+        return read_group_value(grid_group_info.fields_type, threshold,
+                                fill_percents)
     else:
         return None
 
 
-def read_answer(question: int, grid: Grid, threshold: float,
-                form_variant: grid_info.FormVariant,
-                fill_percents: tp.List[tp.List[float]]
+def read_answer(question: int, threshold: float,
+                form_variant: grid_info.FormVariant, fill_percents: np.ndarray
                 ) -> tp.List[tp.Union[tp.List[str], tp.List[int]]]:
-    """Shortcut to read a field given just the key for it and the grid object."""
-    return get_group_from_info(form_variant.questions[question],
-                               grid).read_value(threshold, fill_percents)
+    """Shortcut to read an answer given just the question number and its fill
+    percents."""
+    return read_group_value(form_variant.questions[question].fields_type,
+                            threshold, fill_percents)
+
+
+def draw_bubbles(grid: Grid, form_variant: grid_info.FormVariant,
+                 threshold: float,
+                 field_fill_percents: tp.Dict[grid_info.Field, np.ndarray],
+                 answer_fill_percents: tp.List[np.ndarray]) -> np.ndarray:
+    """Draws every bubble on the form over the grid's image, returning a copy
+    with filled bubbles circled in green and empty ones in red."""
+    layout = grid_info.get_compiled_layout(form_variant)
+    fill_percents = np.concatenate([
+        field_fill_percents[key].ravel() for key in layout.field_keys
+    ] + [question.ravel() for question in answer_fill_percents])
+    image = image_utils.bw_to_bgr(grid.get_image())
+    for across, down, fill_percent in zip(layout.across.tolist(),
+                                          layout.down.tolist(),
+                                          fill_percents.tolist()):
+        center, radius = grid.get_cell_circle(across, down)
+        color = (0, 255, 0) if fill_percent > threshold else (0, 0, 255)
+        cv2.circle(image, grid.get_image_position(center),
+                   int(round(radius)), color, 2)
+    return image
 
 
 def field_group_to_string(
@@ -339,28 +683,26 @@ def field_group_to_string(
     return "".join(result_strings).strip()
 
 
-def read_field_as_string(field: grid_info.Field, grid: Grid, threshold: float,
+def read_field_as_string(field: grid_info.Field, threshold: float,
                          form_variant: grid_info.FormVariant,
-                         fill_percents: tp.List[tp.List[float]]
-                         ) -> tp.Optional[str]:
+                         fill_percents: np.ndarray) -> tp.Optional[str]:
     """Shortcut to read a field and format it as a string, given just the key and
-    the grid object. """
-    field_group = read_field(field, grid, threshold, form_variant,
-                             fill_percents)
+    its fill percents. """
+    field_group = read_field(field, threshold, form_variant, fill_percents)
     if field_group is not None:
         return field_group_to_string(field_group)
     else:
         return None
 
 
-def read_answer_as_string(question: int, grid: Grid, multi_answers_as_f: bool,
+def read_answer_as_string(question: int, multi_answers_as_f: bool,
                           threshold: float,
                           form_variant: grid_info.FormVariant,
-                          fill_percents: tp.List[tp.List[float]]) -> str:
+                          fill_percents: np.ndarray) -> str:
     """Shortcut to read a question's answer and format it as a string, given
-    just the question number and the grid object. """
+    just the question number and its fill percents. """
     answer = field_group_to_string(
-        read_answer(question, grid, threshold, form_variant, fill_percents))
+        read_answer(question, threshold, form_variant, fill_percents))
     if not multi_answers_as_f or "|" not in answer:
         return answer
     else:
@@ -368,8 +710,8 @@ def read_answer_as_string(question: int, grid: Grid, multi_answers_as_f: bool,
 
 
 def calculate_bubble_fill_threshold(
-        field_fill_percents: tp.Dict[grid_info.Field, tp.List[tp.List[float]]],
-        answer_fill_percents: tp.List[tp.List[tp.List[float]]],
+        field_fill_percents: tp.Dict[grid_info.Field, np.ndarray],
+        answer_fill_percents: tp.List[np.ndarray],
         form_variant: grid_info.FormVariant,
         save_path: tp.Optional[pathlib.PurePath] = None) -> float:
     """Dynamically calculate the threshold to use for determining if a bubble is
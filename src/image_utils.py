@@ -1,5 +1,6 @@
 """Image filtering and processing utilities."""
 
+import math
 import pathlib
 import typing as tp
 
@@ -64,21 +65,146 @@ def detect_edges(image: np.ndarray,
     return result
 
 
-def find_contours(edges: np.ndarray) -> np.ndarray:
-    """Find the contours in an edge-detected image."""
-    contours, _ = cv2.findContours(edges, cv2.RETR_TREE,
-                                   cv2.CHAIN_APPROX_SIMPLE)
+def find_contour_tree(
+        edges: np.ndarray, offset: tp.Tuple[int, int] = (0, 0)
+) -> tp.Tuple[tp.List[np.ndarray], np.ndarray]:
+    """Find the contours in an edge-detected image, along with their hierarchy
+    (see `cv2.findContours`). Every contour point is shifted by `offset`, given
+    as `(x, y)`."""
+    contours, hierarchy = cv2.findContours(edges,
+                                           cv2.RETR_TREE,
+                                           cv2.CHAIN_APPROX_SIMPLE,
+                                           offset=offset)
+    if hierarchy is None:
+        hierarchy = np.zeros((1, 0, 4), np.int32)
+    return list(contours), hierarchy
+
+
+def find_contours(edges: np.ndarray,
+                  offset: tp.Tuple[int, int] = (0, 0)) -> tp.List[np.ndarray]:
+    """Find the contours in an edge-detected image. Every contour point is
+    shifted by `offset`, given as `(x, y)`."""
+    contours, _ = find_contour_tree(edges, offset=offset)
     return contours
 
 
+# A contour inside another that covers at least this fraction of its area is
+# the inner side of the same edge.
+_SAME_EDGE_AREA_FRACTION = 0.8
+
+
+class ContourFilter():
+    """Limits on which contours are worth simplifying into polygons. They are
+    checked on the raw contours, cheapest first, so most contours are dropped
+    before any polygon work is done on them.
+
+    Members:
+        min_area: The smallest area to keep, as a fraction of the image's area.
+        max_area: The largest area to keep, as a fraction of the image's area.
+        max_aspect_ratio: The most that the longer side of a contour's bounding
+            box can be over the shorter side.
+        min_solidity: The smallest fraction of its convex hull that a contour
+            can fill.
+        drop_nested: If True, contours directly inside a contour that passes
+            the area and aspect ratio checks are dropped, like a letter written
+            inside a box.
+            Every closed edge is traced along both of its sides, so a contour
+            that covers nearly all of its parent is the inside of the same
+            edge and is kept.
+    """
+    min_area: float
+    max_area: float
+    max_aspect_ratio: float
+    min_solidity: float
+    drop_nested: bool
+
+    def __init__(self,
+                 min_area: float = 0,
+                 max_area: float = 1,
+                 max_aspect_ratio: float = math.inf,
+                 min_solidity: float = 0,
+                 drop_nested: bool = False):
+        self.min_area = min_area
+        self.max_area = max_area
+        self.max_aspect_ratio = max_aspect_ratio
+        self.min_solidity = min_solidity
+        self.drop_nested = drop_nested
+
+    def apply(self, contours: tp.List[np.ndarray], hierarchy: np.ndarray,
+              image_area: float
+              ) -> tp.Tuple[tp.List[np.ndarray], tp.Dict[str, int]]:
+        """Filter contours found by `find_contour_tree`. Returns the contours
+        that pass, in order, and the number dropped by each check."""
+        dropped = {"area": 0, "aspect_ratio": 0, "nested": 0, "solidity": 0}
+        if len(contours) == 0:
+            return [], dropped
+
+        # The area and bounding box of every contour are calculated at once by
+        # joining all of their points into one array.
+        lengths = np.array([len(contour) for contour in contours])
+        starts = np.cumsum(lengths) - lengths
+        points = np.concatenate(contours).reshape(-1, 2).astype(np.int64)
+        next_indexes = np.arange(1, len(points) + 1)
+        next_indexes[starts + lengths - 1] = starts
+        next_points = points[next_indexes]
+        cross_products = (points[:, 0] * next_points[:, 1] -
+                          next_points[:, 0] * points[:, 1])
+        areas = np.abs(np.add.reduceat(cross_products, starts)) / 2
+        sizes = (np.maximum.reduceat(points, starts) -
+                 np.minimum.reduceat(points, starts) + 1)
+
+        passes = ((areas >= self.min_area * image_area) &
+                  (areas <= self.max_area * image_area))
+        dropped["area"] = int(np.count_nonzero(~passes))
+        long_sides = sizes.max(axis=1)
+        short_sides = sizes.min(axis=1)
+        wrong_shape = passes & (long_sides > self.max_aspect_ratio * short_sides)
+        dropped["aspect_ratio"] = int(np.count_nonzero(wrong_shape))
+        passes &= ~wrong_shape
+        if self.drop_nested:
+            parents = hierarchy[0, :, 3]
+            nested = (passes & (parents >= 0) & passes[parents] &
+                      (areas < _SAME_EDGE_AREA_FRACTION * areas[parents]))
+            dropped["nested"] = int(np.count_nonzero(nested))
+            passes &= ~nested
+        # The convex hull is the slowest check, so it is only done on the
+        # contours that are left.
+        if self.min_solidity > 0:
+            for i in np.flatnonzero(passes).tolist():
+                hull_area = cv2.contourArea(cv2.convexHull(contours[i]))
+                if areas[i] < self.min_solidity * hull_area:
+                    passes[i] = False
+                    dropped["solidity"] += 1
+        return [contours[i] for i in np.flatnonzero(passes)], dropped
+
+
 def get_image(path: pathlib.PurePath,
               save_path: tp.Optional[pathlib.PurePath] = None) -> np.ndarray:
-    """Returns the cv2 image located at the given path.
+    """Returns the grayscale cv2 image located at the given path.
+
+    If `save_path` is provided, will save the resulting image to this location
+    as "original.jpg". Used for debugging purposes.
+    """
+    return decode_image(read_image_bytes(path), save_path=save_path)
+
+
+def read_image_bytes(path: pathlib.PurePath) -> bytes:
+    """Returns the raw (still encoded) contents of the image file."""
+    with open(str(path), "rb") as file:
+        return file.read()
+
+
+def decode_image(data: bytes,
+                 save_path: tp.Optional[pathlib.PurePath] = None
+                 ) -> np.ndarray:
+    """Decode the raw contents of an image file into a single-channel grayscale
+    cv2 image. Nothing downstream needs color, and decoding straight to
+    grayscale means every filter only has to touch one channel.
 
     If `save_path` is provided, will save the resulting image to this location
     as "original.jpg". Used for debugging purposes.
     """
-    result = cv2.imread(str(path))
+    result = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
     if save_path:
         save_image(save_path / "original.jpg", result)
     return result
@@ -90,16 +216,59 @@ def save_image(path: pathlib.PurePath, image: np.ndarray):
     cv2.imwrite(str(path), image)
 
 
+def find_simplified_contours(
+        image: np.ndarray,
+        save_path: tp.Optional[pathlib.PurePath] = None,
+        contour_filter: tp.Optional[ContourFilter] = None,
+        offset: tp.Tuple[int, int] = (0, 0),
+        contours_dropped: tp.Optional[tp.Counter[str]] = None
+) -> tp.List[np.ndarray]:
+    """Returns the contours found in the image, each approximated as a simple
+    polygon (see `geometry_utils.simplify_contour`). Every point is shifted by
+    `offset`, given as `(x, y)`.
+
+    If `contour_filter` is provided, only the contours that pass it are
+    approximated and returned. The number dropped by each of its checks is
+    added to `contours_dropped`, if it is given.
+
+    If `save_path` is provided, will save the number of contours dropped by
+    each check of the filter to this location as "contour_filter.txt". Used
+    for debugging purposes.
+    """
+    edges = detect_edges(image, save_path=save_path)
+    contours, hierarchy = find_contour_tree(edges, offset=offset)
+    if contour_filter is not None:
+        total = len(contours)
+        contours, dropped = contour_filter.apply(
+            contours, hierarchy, image.shape[0] * image.shape[1])
+        if contours_dropped is not None:
+            contours_dropped.update(dropped)
+        if save_path:
+            with open(str(save_path / "contour_filter.txt"), "w+") as file:
+                file.writelines([f"total: {total}\n"] + [
+                    f"dropped by {check}: {count}\n"
+                    for check, count in dropped.items()
+                ] + [f"kept: {len(contours)}\n"])
+    return [geometry_utils.simplify_contour(contour) for contour in contours]
+
+
 def find_polygons(image: np.ndarray,
                   save_path: tp.Optional[pathlib.PurePath] = None
                   ) -> tp.List[geometry_utils.Polygon]:
     """Returns a list of polygons found in the image."""
-    edges = detect_edges(image, save_path=save_path)
-    all_contours = find_contours(edges)
-    polygons = [
-        geometry_utils.approx_poly(contour) for contour in all_contours
+    return [
+        geometry_utils.polygon_to_clockwise(
+            geometry_utils.contour_to_polygon(contour))
+        for contour in find_simplified_contours(image, save_path=save_path)
     ]
-    return polygons
+
+
+def shrink(image: np.ndarray, factor: int) -> np.ndarray:
+    """Area-resample the image down to `1 / factor` of its size."""
+    return cv2.resize(image, (0, 0),
+                      fx=1 / factor,
+                      fy=1 / factor,
+                      interpolation=cv2.INTER_AREA)
 
 
 def get_dimensions(image: np.ndarray) -> tp.Tuple[int, int]:
@@ -109,12 +278,13 @@ def get_dimensions(image: np.ndarray) -> tp.Tuple[int, int]:
 
 def threshold(image: np.ndarray,
               save_path: tp.Optional[pathlib.PurePath] = None) -> np.ndarray:
-    """Convert an image to pure black and white pixels by thresholding.
+    """Convert an image to pure black and white pixels by thresholding. Color
+    images are converted to grayscale first.
 
     If `save_path` is provided, will save the resulting image to this location
     as "thresholded.jpg". Used for debugging purposes.
     """
-    gray_image = convert_to_grayscale(image)
+    gray_image = convert_to_grayscale(image) if len(image.shape) == 3 else image
     _, result = cv2.threshold(gray_image, 0, 255,
                               cv2.THRESH_BINARY | cv2.THRESH_OTSU)
     if save_path:
@@ -122,6 +292,33 @@ def threshold(image: np.ndarray,
     return result
 
 
+def normalize_resolution(image: np.ndarray,
+                         target_short_side: tp.Optional[int],
+                         save_path: tp.Optional[pathlib.PurePath] = None
+                         ) -> np.ndarray:
+    """Shrink the image so that its shorter side is `target_short_side` pixels.
+
+    Every later step scales with the number of pixels, so high resolution scans
+    are area-resampled down to a common working size first. Images that are
+    already at or below the target size, or when `target_short_side` is None,
+    are returned unchanged - upsampling would add no detail.
+
+    If `save_path` is provided, will save the resulting image to this location
+    as "normalized.jpg". Used for debugging purposes.
+    """
+    short_side = min(get_dimensions(image))
+    if target_short_side is None or short_side <= target_short_side:
+        return image
+    scale = target_short_side / short_side
+    result = cv2.resize(image, (0, 0),
+                        fx=scale,
+                        fy=scale,
+                        interpolation=cv2.INTER_AREA)
+    if save_path:
+        save_image(save_path / "normalized.jpg", result)
+    return result
+
+
 def prepare_scan_for_processing(image: np.ndarray,
                                 save_path: tp.Optional[pathlib.PurePath] = None
                                 ) -> np.ndarray:
@@ -143,6 +340,25 @@ def get_fill_percent(matrix: tp.Union[np.ndarray, ma.MaskedArray]) -> float:
         return 0
 
 
+def pack_black_and_white(image: np.ndarray) -> tp.Optional[np.ndarray]:
+    """Pack a black and white image into bits, 8 pixels to a byte, with white
+    pixels as set bits. Each row is packed separately (see `np.packbits`), so
+    pixel `(y, x)` is bit `7 - x % 8` of byte `(y, x // 8)`.
+
+    Returns None if the image has any pixels that aren't pure black or white,
+    since those can't be packed without changing them."""
+    if image.ndim != 2 or image.dtype != np.uint8 or cv2.countNonZero(
+            cv2.inRange(image, 1, 254)) > 0:
+        return None
+    return np.packbits(image, axis=1)
+
+
+def unpack_black_and_white(packed: np.ndarray, width: int) -> np.ndarray:
+    """Unpack rows packed by `pack_black_and_white` that were `width` pixels
+    wide back into a black and white image."""
+    return np.unpackbits(packed, axis=1, count=width) * np.uint8(255)
+
+
 def dilate(image: np.ndarray,
            save_path: tp.Optional[pathlib.PurePath] = None) -> np.ndarray:
     """Dilate the image.
@@ -1,14 +1,19 @@
 import argparse
+import multiprocessing
 import sys
 from datetime import datetime
 
+import corner_finding
 import file_handling
 from file_handling import parse_path_arg
 import grid_info as grid_i
+import page_processing
 from process_input import process_input
+import watch_folder
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
     parser = argparse.ArgumentParser(description='OpenMCR: An accurate and simple exam bubble sheet reading tool.\n'
                                                  'Reads sheets from input folder, process and saves result in output folder.',
                                      formatter_class=argparse.RawTextHelpFormatter)
@@ -25,6 +30,15 @@ if __name__ == '__main__':
     parser.add_argument('--formmap',
                         help='Form Arrangement Map CSV file path. If given, only one answer key may be provided.',
                         type=parse_path_arg)
+    parser.add_argument('--weights',
+                        help='CSV file path with the points each question is worth, with columns named Q1 to QN and\n'
+                             'optionally a Test Form Code column. By default, every question is worth 1 point.',
+                        type=parse_path_arg)
+    parser.add_argument('--stream-scores',
+                        action='store_true',
+                        help='Score each sheet as soon as it is read, using the keys from --anskeys, and write the scores\n'
+                             'as it goes. Falls back to scoring at the end if any keys are read from the sheets, or if\n'
+                             'every sheet left blank the last questions of a key.')
     parser.add_argument('--variant',
                         default='75',
                         choices=['75', '150'],
@@ -47,6 +61,72 @@ if __name__ == '__main__':
     parser.add_argument('--disable-timestamps',
                         action='store_true',
                         help='Disable timestamps in file names. Useful when consistent file names are required. Existing files will be overwritten without warning!')
+    parser.add_argument('-j', '--jobs',
+                        default=1,
+                        type=page_processing.parse_jobs_arg,
+                        help='Number of processes to read sheets with, or "auto" for one per CPU.\n'
+                             'Output is identical to reading one sheet at a time (default).')
+    parser.add_argument('--max-tasks-per-worker',
+                        default=page_processing.DEFAULT_MAX_TASKS_PER_WORKER,
+                        type=page_processing.parse_positive_int_arg,
+                        help='Number of sheets each process reads before being replaced with a fresh one.\n'
+                             f'Only used when --jobs is more than 1. Default is {page_processing.DEFAULT_MAX_TASKS_PER_WORKER}.')
+    parser.add_argument('--io-threads',
+                        default=page_processing.DEFAULT_IO_WORKERS,
+                        type=page_processing.parse_positive_int_arg,
+                        help='Number of threads reading image files ahead of processing.\n'
+                             f'Default is {page_processing.DEFAULT_IO_WORKERS}.')
+    parser.add_argument('--queue-size',
+                        type=page_processing.parse_positive_int_arg,
+                        help='Maximum number of sheets loaded but not yet processed at once.\n'
+                             'Default is twice the number of jobs plus the number of I/O threads.')
+    parser.add_argument('--working-size',
+                        default=page_processing.DEFAULT_WORKING_SIZE,
+                        type=page_processing.parse_working_size_arg,
+                        help='Shrink sheets so their shorter side is this many pixels before reading them.\n'
+                             'Smaller sheets are not changed. Use 0 to read sheets at their scanned resolution.\n'
+                             f'Default is {page_processing.DEFAULT_WORKING_SIZE}.')
+    parser.add_argument('--corner-search-factor',
+                        default=page_processing.DEFAULT_CORNER_SEARCH_FACTOR,
+                        type=page_processing.parse_positive_int_arg,
+                        help='Look for the corner marks on sheets shrunk by this factor first, then refine them at full size.\n'
+                             'Falls back to searching the whole sheet at full size if they are not found. Use 1 to always search at full size.\n'
+                             f'Default is {page_processing.DEFAULT_CORNER_SEARCH_FACTOR}.')
+    parser.add_argument('--no-contour-filter',
+                        action='store_true',
+                        help='Consider every shape on the sheet when looking for the corner marks, instead of\n'
+                             'skipping the ones that are the wrong size or shape or are inside other shapes.')
+    parser.add_argument('--rectify',
+                        action='store_true',
+                        help='Warp each sheet to a fixed size using all four corner marks before reading the bubbles.\n'
+                             'Reading then takes the same time at any scan resolution, and slightly skewed scans are straightened.')
+    parser.add_argument('--no-corner-priors',
+                        action='store_true',
+                        help='Search for the corner marks from scratch on every sheet, instead of first looking\n'
+                             'where they were on the last few sheets.')
+    parser.add_argument('--cache',
+                        action='store_true',
+                        help='Keep what was read from each sheet in a cache in your user folder, and take the sheets read by\n'
+                             'an earlier run from it instead of reading them again. The cache is never used in debug mode.')
+    parser.add_argument('--fill-store',
+                        type=parse_path_arg,
+                        help='Folder to save how filled in every bubble on every sheet is to. The sheets can then be\n'
+                             'scored again with other options, keys or arrangement maps by rescore.py without reading them.')
+    parser.add_argument('--watch',
+                        action='store_true',
+                        help='Keep watching the input folder and read new sheets as they are added, until stopped with Ctrl+C.\n'
+                             'Each sheet is added to the end of the results, rejected_files, keys and scores files in the\n'
+                             'output folder, which have no timestamps and are not sorted. Sheets already read are remembered\n'
+                             'in processed_files.jsonl there, so they are not read again when restarted.')
+    parser.add_argument('--settle-time',
+                        default=watch_folder.DEFAULT_SETTLE_TIME,
+                        type=watch_folder.parse_settle_time_arg,
+                        help='With --watch, read a new file once it has not changed for this many seconds.\n'
+                             f'Default is {watch_folder.DEFAULT_SETTLE_TIME}.')
+    parser.add_argument('--scanner-profile',
+                        type=parse_path_arg,
+                        help='JSON file with where the corner marks are on sheets from this scanner. If it exists,\n'
+                             'it is used to find the corners of the first sheets faster. It is updated with this batch, except with --watch.')
 
     # prints help and exits when called w/o arguments
     if len(sys.argv) == 1:
@@ -54,6 +134,21 @@ if __name__ == '__main__':
         sys.exit(1)
 
     args = parser.parse_args()
+    if args.watch:
+        # Watching adds each sheet to files without timestamps that are never
+        # finished, so it can't do what these change.
+        watch_conflicts = {
+            '--fill-store': args.fill_store is not None,
+            '--mcta': args.mcta,
+            '--sort': args.sort,
+            '--debug': args.debug,
+            '--disable-timestamps': args.disable_timestamps,
+            '--stream-scores': args.stream_scores,
+        }
+        conflicting_args = [name for name, given in watch_conflicts.items() if given]
+        if conflicting_args:
+            parser.error(f"{', '.join(conflicting_args)} can't be used with --watch. Watching never adds timestamps, "
+                         "and always scores each sheet as it is read when --anskeys is given.")
 
     image_paths = file_handling.filter_images(file_handling.list_file_paths(args.input_folder))
     output_folder = args.output_folder
@@ -61,12 +156,39 @@ if __name__ == '__main__':
     empty_answers_as_g = args.empty
     keys_file = args.anskeys
     arrangement_file = args.formmap
+    weights_file = args.weights
+    stream_scores = args.stream_scores
+    use_cache = args.cache
+    fill_store_folder = args.fill_store
     sort_results = args.sort
     output_mcta = args.mcta
     debug_mode_on = args.debug
     form_variant = grid_i.form_150q if args.variant == '150' else grid_i.form_75q
     files_timestamp = datetime.now().replace(microsecond=0) if not args.disable_timestamps else None
+    pipeline_options = page_processing.PipelineOptions(args.jobs,
+                                                       args.max_tasks_per_worker,
+                                                       args.io_threads,
+                                                       args.queue_size)
+    reading_options = page_processing.ReadingOptions(
+        args.working_size, args.corner_search_factor,
+        None if args.no_contour_filter else
+        corner_finding.DEFAULT_CONTOUR_FILTER, not args.no_corner_priors,
+        args.scanner_profile, args.rectify)
     print(arrangement_file)
+    if args.watch:
+        watch_folder.watch_folder(args.input_folder,
+                                  output_folder,
+                                  multi_answers_as_f,
+                                  empty_answers_as_g,
+                                  keys_file,
+                                  arrangement_file,
+                                  form_variant,
+                                  pipeline_options,
+                                  reading_options,
+                                  weights_file,
+                                  use_cache,
+                                  args.settle_time)
+        sys.exit(0)
     process_input(image_paths,
                   output_folder,
                   multi_answers_as_f,
@@ -78,4 +200,10 @@ if __name__ == '__main__':
                   debug_mode_on,
                   form_variant,
                   None,
-                  files_timestamp)
+                  files_timestamp,
+                  pipeline_options,
+                  reading_options,
+                  weights_file,
+                  stream_scores,
+                  use_cache,
+                  fill_store_folder)
@@ -0,0 +1,232 @@
+"""A cache on disk of what was read from each page, so that running the program
+again on a folder only reads the pages that were added or changed.
+
+Pages are looked up by a hash of the contents of their image file, together
+with everything else that changes what is read from them: the form variant,
+the reading options and the code that reads them (see `get_code_version`).
+Renaming or moving a file doesn't make it miss. Each page is saved as soon as
+it is read, so a run that stopped part way can be resumed without reading its
+pages again.
+"""
+
+import functools
+import hashlib
+import json
+import marshal
+import os
+import pathlib
+import sys
+import threading
+import typing as tp
+
+import numpy as np
+
+import alphabet
+import answer_masks
+import corner_finding
+import geometry_utils
+import grid_info as grid_i
+import grid_reading
+import image_utils
+import list_utils
+import math_utils
+import page_processing
+
+# The modules whose code changes what is read from a page, or how it is stored.
+# Pages read by any other version of them aren't used.
+READING_MODULES = [
+    alphabet, answer_masks, corner_finding, geometry_utils, grid_i,
+    grid_reading, image_utils, list_utils, math_utils, page_processing
+]
+# How many bytes the cache can take up before the pages used longest ago are
+# removed. Each page takes a few kilobytes.
+DEFAULT_MAX_CACHE_SIZE = 256 * 1024 * 1024
+_ENTRY_SUFFIX = ".npz"
+
+
+def get_default_cache_dir() -> pathlib.Path:
+    """Get the folder the cache is kept in: in the local app data folder on
+    Windows and in `~/.cache` (or `$XDG_CACHE_HOME`) elsewhere."""
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME")
+    return (pathlib.Path(base) if base else pathlib.Path.home() /
+            ".cache") / "open-mcr" / "pages"
+
+
+@functools.lru_cache(maxsize=None)
+def get_code_version() -> str:
+    """Get a hash of the code of `READING_MODULES` and of this module, which
+    changes whenever any of them is changed."""
+    digest = hashlib.sha256()
+    for module in READING_MODULES + [sys.modules[__name__]]:
+        try:
+            with open(str(module.__file__), "rb") as file:
+                digest.update(file.read())
+        except (OSError, TypeError):
+            # Frozen builds have the compiled code but not the source files.
+            digest.update(
+                marshal.dumps(module.__loader__.get_code(module.__name__)))
+    return digest.hexdigest()
+
+
+def get_options_key(form_variant: grid_i.FormVariant,
+                    reading_options: page_processing.ReadingOptions) -> str:
+    """Get the text that identifies everything besides the image that changes
+    what is read from a page.
+
+    The corner priors and scanner profile are left out, as they only change
+    where the corner marks are looked for first."""
+    contour_filter = reading_options.contour_filter
+    return json.dumps([
+        get_code_version(), form_variant.name, reading_options.working_size,
+        reading_options.corner_search_factor,
+        sorted(vars(contour_filter).items())
+        if contour_filter is not None else None, reading_options.rectify
+    ])
+
+
+class PageCache():
+    """Pages read before, stored in `directory` with one file per page.
+
+    Members:
+        directory: The folder the pages are stored in.
+        options_key: What the pages were read with (see `get_options_key`).
+            Pages read with other options are stored separately.
+        max_size: The most bytes the stored pages can take up after `evict`.
+        hits: The number of pages found in the cache so far.
+    """
+    directory: pathlib.Path
+    options_key: str
+    max_size: int
+    hits: int
+    _lock: threading.Lock
+
+    def __init__(self,
+                 directory: pathlib.Path,
+                 options_key: str,
+                 max_size: int = DEFAULT_MAX_CACHE_SIZE):
+        self.directory = directory
+        self.options_key = options_key
+        self.max_size = max_size
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    def get_key(self, data: bytes) -> str:
+        """Get the key of the page with the image file contents `data`."""
+        digest = hashlib.sha256(data)
+        digest.update(b"\0" + self.options_key.encode())
+        return digest.hexdigest()
+
+    def _get_path(self, key: str) -> pathlib.Path:
+        return self.directory / key[:2] / (key + _ENTRY_SUFFIX)
+
+    def get(self, key: str,
+            image_name: str) -> tp.Optional[page_processing.PageResult]:
+        """Get the stored result of the page with `key`, named `image_name`, or
+        None if it hasn't been read before. Safe to call from any thread."""
+        path = self._get_path(key)
+        try:
+            with np.load(str(path), allow_pickle=False) as entry:
+                result = _load_result(entry, image_name)
+            # Mark the page as recently used.
+            os.utime(str(path))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError):
+            # The file is damaged, so read the page again and replace it.
+            return None
+        with self._lock:
+            self.hits += 1
+        return result
+
+    def put(self, key: str, result: page_processing.PageResult):
+        """Store the result of the page with `key`. The file is written under
+        another name and then renamed, so a stored page is never partly
+        written."""
+        path = self._get_path(key)
+        os.makedirs(str(path.parent), exist_ok=True)
+        temporary_path = path.with_name(
+            f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(str(temporary_path), "wb") as file:
+            np.savez(file, **_dump_result(result))
+        os.replace(str(temporary_path), str(path))
+
+    def evict(self):
+        """Remove the pages used longest ago until the cache is no bigger than
+        `max_size`."""
+        entries: tp.List[tp.Tuple[float, int, str]] = []
+        try:
+            subdirectories = list(os.scandir(str(self.directory)))
+        except FileNotFoundError:
+            return
+        for subdirectory in subdirectories:
+            if not subdirectory.is_dir():
+                continue
+            for entry in os.scandir(subdirectory.path):
+                if entry.name.endswith(_ENTRY_SUFFIX):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, entry_path in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+
+
+def _dump_result(result: page_processing.PageResult
+                 ) -> tp.Dict[str, np.ndarray]:
+    layout = result.corner_layout
+    info = {
+        "rejected": result.rejected,
+        "is_key": result.is_key,
+        "field_data": {
+            field.name: value
+            for field, value in result.field_data.items()
+        },
+        "threshold": result.threshold,
+        "unit_length": layout.unit_length if layout is not None else None,
+        "corner_method": result.corner_method.name
+        if result.corner_method is not None else None,
+        "contours_dropped": result.contours_dropped
+    }
+    arrays = {
+        "info": np.array(json.dumps(info)),
+        "answer_masks": result.answer_masks
+    }
+    if result.fill_percents is not None:
+        arrays["fill_percents"] = result.fill_percents
+    if layout is not None:
+        arrays["corners"] = layout.corners
+    return arrays
+
+
+def _load_result(entry: tp.Mapping[str, np.ndarray],
+                 image_name: str) -> page_processing.PageResult:
+    info = json.loads(str(entry["info"]))
+    fields = {field.name: field for field in grid_i.Field}
+    field_data = {
+        fields[name]: value
+        for name, value in info["field_data"].items()
+    }
+    # The same image can be in another file now.
+    if grid_i.Field.IMAGE_FILE in field_data:
+        field_data[grid_i.Field.IMAGE_FILE] = image_name
+    return page_processing.PageResult(
+        image_name,
+        rejected=info["rejected"],
+        is_key=info["is_key"],
+        field_data=field_data,
+        answer_masks=entry["answer_masks"],
+        corner_layout=corner_finding.CornerLayout(entry["corners"],
+                                                  info["unit_length"])
+        if "corners" in entry else None,
+        corner_method=corner_finding.CornerSearchMethod[info["corner_method"]]
+        if info["corner_method"] is not None else None,
+        contours_dropped=info["contours_dropped"],
+        threshold=info["threshold"],
+        fill_percents=entry["fill_percents"]
+        if "fill_percents" in entry else None,
+        from_cache=True)
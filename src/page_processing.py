@@ -0,0 +1,772 @@
+"""Reading of individual pages, either one after another or in a pool of worker
+processes.
+
+Pages flow through three stages: a pool of I/O threads reads (and, when pages
+are read in this process, decodes) image files ahead of time, the computer
+vision stage reads the bubbles, and the caller collects the results in input
+order. Only a limited number of pages are held between the first and last stage
+at once, so memory use does not grow with the size of the batch.
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import multiprocessing
+import multiprocessing.pool
+import os
+import pathlib
+import queue
+import signal
+import threading
+import typing as tp
+
+import cv2
+import numpy as np
+
+import corner_finding
+import data_exporting
+import grid_info as grid_i
+import grid_reading as grid_r
+import image_utils
+
+if tp.TYPE_CHECKING:
+    import page_cache
+
+# How many pages a worker process reads before it is replaced with a fresh one.
+# Recycling workers keeps memory fragmentation and any leaks in native code from
+# building up over very large batches.
+DEFAULT_MAX_TASKS_PER_WORKER = 100
+# Reading files is mostly waiting on the disk (or network share), so a couple of
+# threads is enough to keep the processing stage busy.
+DEFAULT_IO_WORKERS = 2
+# The short side, in pixels, that pages are shrunk to before reading. This is
+# roughly a letter-size page at 300 DPI, which is plenty to read the bubbles.
+DEFAULT_WORKING_SIZE = 2500
+# How much pages are shrunk by to find the corner marks before they are found
+# again at full size. More than 3 makes the marks too small to recognize at
+# the default working size.
+DEFAULT_CORNER_SEARCH_FACTOR = 3
+
+
+class PageResult():
+    """The outcome of reading a single page.
+
+    Members:
+        image_name: The file name of the source image.
+        rejected: True if the page could not be read (ie, no corners found).
+        is_key: True if the page is an answer key.
+        field_data: The values read from the fields on the page.
+        answer_masks: The answer read for each question, as a bitmask of the
+            choices that were filled in (see `answer_masks`).
+        corner_layout: Where the grid corners were found on the page, if they
+            were.
+        corner_method: How the grid corners were found, if they were.
+        contours_dropped: The number of contours dropped by each check of the
+            contour filter while looking for the grid corners (see
+            `image_utils.ContourFilter.apply`). Empty if the filter wasn't used.
+        threshold: The fill percent above which bubbles count as filled in, if
+            the page was read.
+        fill_percents: The fill percent of every bubble on the page, in the
+            order of `grid_info.get_compiled_layout`, if the page was read.
+        from_cache: True if the page was read before and its result was taken
+            from a `page_cache.PageCache`.
+    """
+    image_name: str
+    rejected: bool
+    is_key: bool
+    field_data: tp.Dict[grid_i.RealOrVirtualField, str]
+    answer_masks: np.ndarray
+    corner_layout: tp.Optional[corner_finding.CornerLayout]
+    corner_method: tp.Optional[corner_finding.CornerSearchMethod]
+    contours_dropped: tp.Dict[str, int]
+    threshold: tp.Optional[float]
+    fill_percents: tp.Optional[np.ndarray]
+    from_cache: bool
+
+    def __init__(self,
+                 image_name: str,
+                 rejected: bool = False,
+                 is_key: bool = False,
+                 field_data: tp.Optional[tp.Dict[grid_i.RealOrVirtualField,
+                                                 str]] = None,
+                 answer_masks: tp.Optional[np.ndarray] = None,
+                 corner_layout: tp.Optional[
+                     corner_finding.CornerLayout] = None,
+                 corner_method: tp.Optional[
+                     corner_finding.CornerSearchMethod] = None,
+                 contours_dropped: tp.Optional[tp.Dict[str, int]] = None,
+                 threshold: tp.Optional[float] = None,
+                 fill_percents: tp.Optional[np.ndarray] = None,
+                 from_cache: bool = False):
+        self.image_name = image_name
+        self.rejected = rejected
+        self.is_key = is_key
+        self.field_data = field_data if field_data is not None else {}
+        self.answer_masks = (answer_masks if answer_masks is not None else
+                             np.zeros(0, np.uint8))
+        self.corner_layout = corner_layout
+        self.corner_method = corner_method
+        self.contours_dropped = (contours_dropped
+                                 if contours_dropped is not None else {})
+        self.threshold = threshold
+        self.fill_percents = fill_percents
+        self.from_cache = from_cache
+
+
+class PipelineOptions():
+    """Settings for how the pages of a batch are distributed over threads and
+    processes.
+
+    Members:
+        jobs: The number of worker processes to read pages with. If 1, pages
+            are read one after another in the calling process.
+        max_tasks_per_worker: The number of pages a worker reads before it is
+            replaced. If None, workers live for the whole batch.
+        io_workers: The number of threads that read image files ahead of the
+            processing stage.
+        queue_size: The most pages that can be loaded but not yet processed at
+            once. Reading ahead pauses when this many are waiting.
+    """
+    jobs: int
+    max_tasks_per_worker: tp.Optional[int]
+    io_workers: int
+    queue_size: int
+
+    def __init__(self,
+                 jobs: int = 1,
+                 max_tasks_per_worker: tp.Optional[
+                     int] = DEFAULT_MAX_TASKS_PER_WORKER,
+                 io_workers: int = DEFAULT_IO_WORKERS,
+                 queue_size: tp.Optional[int] = None):
+        if io_workers < 1:
+            raise ValueError("There must be at least one I/O worker.")
+        if queue_size is not None and queue_size < 1:
+            raise ValueError("The queue must hold at least one page.")
+        self.jobs = jobs
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.io_workers = io_workers
+        # By default, keep enough pages loaded that every worker has its next
+        # page ready when it finishes the current one.
+        self.queue_size = queue_size if queue_size is not None else (
+            2 * jobs + io_workers)
+
+
+class ReadingOptions():
+    """Settings that change how each page is read.
+
+    Members:
+        working_size: The length in pixels that the shorter side of each page is
+            shrunk to before reading. If None, pages are read at their scanned
+            resolution.
+        corner_search_factor: How much pages are shrunk by to look for the
+            corner marks before they are found again at full size. If None,
+            the corner marks are only looked for at full size.
+        contour_filter: Limits on which contours are considered when looking
+            for the corner marks. If None, every contour is.
+        use_corner_priors: If True, the corner marks are first looked for
+            near where they were on the last few pages.
+        scanner_profile: A file with the corner positions of an earlier batch
+            from the same scanner (see `corner_finding.load_scanner_profile`),
+            used as the expected positions until a page has been read. Only
+            used if `use_corner_priors` is True.
+        rectify: If True, the grid is warped to the form variant's canonical
+            raster using all four corners before the bubbles are read, instead
+            of being read in place.
+    """
+    working_size: tp.Optional[int]
+    corner_search_factor: tp.Optional[int]
+    contour_filter: tp.Optional[image_utils.ContourFilter]
+    use_corner_priors: bool
+    scanner_profile: tp.Optional[pathlib.Path]
+    rectify: bool
+
+    def __init__(self,
+                 working_size: tp.Optional[int] = DEFAULT_WORKING_SIZE,
+                 corner_search_factor: tp.Optional[
+                     int] = DEFAULT_CORNER_SEARCH_FACTOR,
+                 contour_filter: tp.Optional[image_utils.ContourFilter] = (
+                     corner_finding.DEFAULT_CONTOUR_FILTER),
+                 use_corner_priors: bool = True,
+                 scanner_profile: tp.Optional[pathlib.Path] = None,
+                 rectify: bool = False):
+        if working_size is not None and working_size < 1:
+            raise ValueError("The working size must be a positive number of pixels.")
+        if corner_search_factor is not None and corner_search_factor < 1:
+            raise ValueError("The corner search factor must be at least 1.")
+        self.working_size = working_size
+        self.corner_search_factor = corner_search_factor
+        self.contour_filter = contour_filter
+        self.use_corner_priors = use_corner_priors
+        self.scanner_profile = scanner_profile
+        self.rectify = rectify
+
+    def make_corner_priors(self) -> tp.Optional[corner_finding.CornerPriors]:
+        """Start tracking the corner positions for a new batch of pages, or
+        None if they shouldn't be."""
+        if not self.use_corner_priors:
+            return None
+        return corner_finding.CornerPriors(
+            corner_finding.load_scanner_profile(self.scanner_profile)
+            if self.scanner_profile is not None else None)
+
+
+def parse_jobs_arg(jobs_arg: str) -> int:
+    """Parse a `--jobs` argument, which is either a positive number or `auto`
+    to use one worker per CPU."""
+    if jobs_arg.strip().lower() == "auto":
+        return os.cpu_count() or 1
+    try:
+        jobs = int(jobs_arg)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"'{jobs_arg}' is not a number or 'auto'.")
+    if jobs < 1:
+        raise argparse.ArgumentTypeError("Must use at least one job.")
+    return jobs
+
+
+def _parse_int_arg(arg: str, minimum: int) -> int:
+    try:
+        value = int(arg)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{arg}' is not a whole number.")
+    if value < minimum:
+        raise argparse.ArgumentTypeError(f"Must be at least {minimum}.")
+    return value
+
+
+def parse_positive_int_arg(arg: str) -> int:
+    """Parse an argument that must be a whole number of at least 1, so that
+    it is rejected before any sheet is read."""
+    return _parse_int_arg(arg, 1)
+
+
+def parse_non_negative_int_arg(arg: str) -> int:
+    """Parse an argument that must be a whole number of at least 0."""
+    return _parse_int_arg(arg, 0)
+
+
+def parse_working_size_arg(working_size_arg: str) -> tp.Optional[int]:
+    """Parse a `--working-size` argument, which is either a positive number of
+    pixels or 0 to read pages at their scanned resolution (None)."""
+    try:
+        working_size = int(working_size_arg)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"'{working_size_arg}' is not a whole number.")
+    if working_size < 0:
+        raise argparse.ArgumentTypeError(
+            "Must be a positive number of pixels, or 0.")
+    return working_size if working_size > 0 else None
+
+
+def process_page(image_path: pathlib.Path,
+                 form_variant: grid_i.FormVariant,
+                 debug_path: tp.Optional[pathlib.Path] = None,
+                 reading_options: tp.Optional[ReadingOptions] = None,
+                 corner_priors: tp.Optional[corner_finding.CornerPriors] = None
+                 ) -> PageResult:
+    """Read a single scanned page from a file.
+
+    If `debug_path` is provided, debugging images and data for the page will be
+    saved in that folder.
+    """
+    if debug_path is not None:
+        data_exporting.make_dir_if_not_exists(debug_path)
+    image = image_utils.get_image(image_path, save_path=debug_path)
+    return read_page(image, image_path.name, form_variant, debug_path,
+                     reading_options, corner_priors)
+
+
+def read_page(image: np.ndarray,
+              image_name: str,
+              form_variant: grid_i.FormVariant,
+              debug_path: tp.Optional[pathlib.Path] = None,
+              reading_options: tp.Optional[ReadingOptions] = None,
+              corner_priors: tp.Optional[corner_finding.CornerPriors] = None
+              ) -> PageResult:
+    """Read a single scanned page that has already been loaded.
+
+    If `debug_path` is provided, debugging images and data for the page will be
+    saved in that folder.
+
+    If `corner_priors` is provided, the corner marks are first looked for near
+    where it expects them, and where they were found is recorded in it.
+    """
+    reading_options = (reading_options
+                       if reading_options is not None else ReadingOptions())
+
+    # Everything from here on, including the corner coordinates and the grid,
+    # works in the normalized image's pixel space.
+    normalized_image = image_utils.normalize_resolution(
+        image, reading_options.working_size, save_path=debug_path)
+    prepared_image = image_utils.prepare_scan_for_processing(
+        normalized_image, save_path=debug_path)
+
+    contours_dropped: tp.Counter[str] = collections.Counter()
+    try:
+        corner_search = corner_finding.locate_corner_marks(
+            prepared_image,
+            save_path=debug_path,
+            coarse_factor=reading_options.corner_search_factor,
+            contour_filter=reading_options.contour_filter,
+            prior=corner_priors.predict()
+            if corner_priors is not None else None,
+            contours_dropped=contours_dropped)
+    except corner_finding.CornerFindingError:
+        return PageResult(image_name,
+                          rejected=True,
+                          contours_dropped=dict(contours_dropped))
+    corners = corner_search.corners
+    if corner_priors is not None:
+        corner_priors.record(corner_search.layout)
+
+    if reading_options.rectify:
+        # Warping blurs the edges of the black and white page, so it is
+        # thresholded again before it is dilated like any other page.
+        rectified_image, corners = grid_r.rectify_page(prepared_image,
+                                                       corners,
+                                                       form_variant,
+                                                       save_path=debug_path)
+        grid_image = image_utils.threshold(rectified_image)
+        del rectified_image
+        offset = (0, 0)
+    else:
+        # Nothing outside of the grid is read, so only the region it covers is
+        # processed from here on. The grid keeps working in page coordinates
+        # and is told where the crop sits.
+        rows, columns = grid_r.get_grid_region(corners, prepared_image.shape)
+        grid_image = prepared_image[rows, columns]
+        offset = (columns.start, rows.start)
+
+    # Dilates the image - removes black pixels from edges, which preserves
+    # solid shapes while destroying nonsolid ones. By doing this after noise
+    # removal and thresholding, it eliminates irregular things like W and M
+    morphed_image = image_utils.dilate(grid_image, save_path=debug_path)
+
+    # Establish a grid
+    grid = grid_r.Grid(corners,
+                       grid_i.GRID_HORIZONTAL_CELLS,
+                       grid_i.GRID_VERTICAL_CELLS,
+                       morphed_image,
+                       save_path=debug_path,
+                       offset=offset)
+    # The grid keeps a packed copy of the page when it can, so the unpacked
+    # ones are let go of rather than kept until the page is read.
+    del normalized_image, prepared_image, grid_image, morphed_image
+
+    # Fields and answers are read off the grid as they are needed. The fill
+    # threshold is calculated from every bubble on the page on the first read.
+    reader = grid_r.PageReader(grid, form_variant, save_path=debug_path)
+    if debug_path:
+        image_utils.save_image(
+            debug_path / "bubbles.jpg",
+            grid_r.draw_bubbles(grid, form_variant, reader.threshold,
+                                *reader.get_all_fill_percents()))
+
+    result = _read_fields_and_answers(reader, image_name, form_variant)
+    result.corner_layout = corner_search.layout
+    result.corner_method = corner_search.method
+    result.contours_dropped = dict(contours_dropped)
+    return result
+
+
+def read_fill_percents(fill_percents: np.ndarray,
+                       image_name: str,
+                       form_variant: grid_i.FormVariant,
+                       threshold: tp.Optional[float] = None) -> PageResult:
+    """Read a page again from the fill percents of every bubble on it (see
+    `PageResult.fill_percents`), without its image.
+
+    If `threshold` is None, it is calculated from the fill percents like when
+    the page was first read.
+    """
+    reader = grid_r.PageReader(None,
+                               form_variant,
+                               threshold,
+                               fill_percents=fill_percents)
+    return _read_fields_and_answers(reader, image_name, form_variant)
+
+
+def _read_fields_and_answers(reader: grid_r.PageReader, image_name: str,
+                             form_variant: grid_i.FormVariant) -> PageResult:
+    field_data: tp.Dict[grid_i.RealOrVirtualField, str] = {
+        grid_i.Field.IMAGE_FILE: image_name,
+    }
+
+    # Read the Student ID first. If it indicates this exam is a key, treat it
+    # as such and only read the form code and answers.
+    student_id = reader.read_field_as_string(grid_i.Field.STUDENT_ID)
+    is_key = student_id == grid_i.KEY_STUDENT_ID
+    fields = [grid_i.Field.TEST_FORM_CODE] if is_key else list(
+        form_variant.fields.keys())
+    for field in fields:
+        field_value = reader.read_field_as_string(field)
+        if field_value is not None:
+            field_data[field] = field_value
+        elif is_key:
+            field_data[field] = ""
+
+    # Get the answers for questions. They are only formatted as text when
+    # they are exported.
+    answers = reader.read_answer_masks()
+
+    # The threshold has already read every bubble, so these are kept to read
+    # the page differently later without having to look at it again.
+    fill_percents = np.concatenate([
+        values.ravel() for values in reader.get_fill_percents(
+            range(len(reader.layout.group_slices)))
+    ])
+
+    return PageResult(image_name,
+                      is_key=is_key,
+                      field_data=field_data,
+                      answer_masks=answers,
+                      threshold=reader.threshold,
+                      fill_percents=fill_percents)
+
+
+# Settings shared by every page in a batch. These are sent to each worker once
+# when it starts instead of with every page.
+_WorkerSettings = tp.Tuple[grid_i.FormVariant, tp.Optional[pathlib.Path],
+                          ReadingOptions]
+_worker_settings: tp.Optional[_WorkerSettings] = None
+# Where the corners were on the pages this worker has read.
+_worker_corner_priors: tp.Optional[corner_finding.CornerPriors] = None
+
+
+def _init_worker(settings: _WorkerSettings):
+    """Store the batch settings and warm up the worker process.
+
+    OpenCV initializes much of its internal state lazily, so a tiny synthetic
+    page is run through the same operations the real pages use, and the layout
+    of every form variant is compiled. This way the first real page a worker
+    gets isn't slower than the rest.
+    """
+    global _worker_settings, _worker_corner_priors
+    _worker_settings = settings
+    _worker_corner_priors = settings[2].make_corner_priors()
+    # Ctrl+C is sent to the workers too, but stopping them is up to the
+    # process that started them.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Each page already gets its own process, so OpenCV's own thread pool would
+    # only oversubscribe the CPUs.
+    cv2.setNumThreads(1)
+    for form_variant in grid_i.FORM_VARIANTS.values():
+        grid_i.get_compiled_layout(form_variant)
+    warm_up = np.full((64, 64), 255, np.uint8)
+    cv2.rectangle(warm_up, (16, 16), (48, 48), 0, -1)
+    prepared = image_utils.prepare_scan_for_processing(warm_up)
+    image_utils.find_polygons(prepared)
+    image_utils.dilate(prepared)
+
+
+def _get_debug_path(debug_dir: tp.Optional[pathlib.Path],
+                    image_path: pathlib.Path) -> tp.Optional[pathlib.Path]:
+    if debug_dir is None:
+        return None
+    debug_path = debug_dir / image_path.stem
+    data_exporting.make_dir_if_not_exists(debug_path)
+    return debug_path
+
+
+def _process_page_task(task: tp.Tuple[int, str, bytes]
+                       ) -> tp.Tuple[int, PageResult]:
+    index, image_name, data = task
+    assert _worker_settings is not None, "Worker was not initialized."
+    form_variant, debug_dir, reading_options = _worker_settings
+    debug_path = _get_debug_path(debug_dir, pathlib.Path(image_name))
+    image = image_utils.decode_image(data, save_path=debug_path)
+    return index, read_page(image, image_name, form_variant, debug_path,
+                            reading_options, _worker_corner_priors)
+
+
+def _read_page_data_task(task: tp.Tuple[int, str, bytes, str]
+                         ) -> tp.Tuple[int, PageResult]:
+    index, image_name, data, form_variant_name = task
+    assert _worker_settings is not None, "Worker was not initialized."
+    return index, _read_page_data(data, image_name,
+                                  grid_i.FORM_VARIANTS[form_variant_name],
+                                  _worker_settings[2], _worker_corner_priors)
+
+
+def _read_page_data(data: bytes, image_name: str,
+                    form_variant: grid_i.FormVariant,
+                    reading_options: ReadingOptions,
+                    corner_priors: tp.Optional[corner_finding.CornerPriors]
+                    ) -> PageResult:
+    image = image_utils.decode_image(data)
+    if image is None:
+        # The data wasn't an image at all.
+        return PageResult(image_name, rejected=True)
+    return read_page(image, image_name, form_variant, None, reading_options,
+                     corner_priors)
+
+
+def _get_file_size(path: pathlib.Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+_T = tp.TypeVar("_T")
+
+
+def _read_ahead(tasks: tp.Iterable[tp.Tuple[int, pathlib.Path]],
+                load: tp.Callable[[pathlib.Path], _T], io_workers: int,
+                slots: threading.Semaphore, stopped: threading.Event
+                ) -> tp.Iterator[tp.Tuple[int, pathlib.Path, _T]]:
+    """Load pages in a pool of threads, yielding them in the order of `tasks`.
+
+    One of `slots` is taken for every page that is loaded. Whoever consumes the
+    pages must release it once the page has been processed; until then, no more
+    than the initial number of slots worth of pages are read ahead. Stops early
+    once `stopped` is set.
+    """
+    with concurrent.futures.ThreadPoolExecutor(io_workers) as executor:
+        pending: tp.Deque[tp.Tuple[int, pathlib.Path,
+                                   concurrent.futures.Future[_T]]] = (
+                                       collections.deque())
+
+        def take_first() -> tp.Tuple[int, pathlib.Path, _T]:
+            index, path, future = pending.popleft()
+            return index, path, future.result()
+
+        for index, path in tasks:
+            # Only block waiting for a free slot if nothing is ready to hand
+            # over, otherwise hand over the oldest page to make room.
+            while not slots.acquire(blocking=not pending):
+                yield take_first()
+            if stopped.is_set():
+                return
+            pending.append((index, path, executor.submit(load, path)))
+            while pending and pending[0][2].done():
+                yield take_first()
+        while pending:
+            yield take_first()
+
+
+def create_pool(form_variant: grid_i.FormVariant,
+                debug_dir: tp.Optional[pathlib.Path] = None,
+                options: tp.Optional[PipelineOptions] = None,
+                reading_options: tp.Optional[ReadingOptions] = None,
+                processes: tp.Optional[int] = None
+                ) -> multiprocessing.pool.Pool:
+    """Start `options.jobs` worker processes (or `processes`, if given) to read
+    pages with the given settings, for `process_pages`. A pool can be used for
+    several calls so that its workers are only started and warmed up once."""
+    options = options if options is not None else PipelineOptions()
+    reading_options = (reading_options
+                       if reading_options is not None else ReadingOptions())
+    # Spawn (rather than fork) so that workers behave the same on every
+    # platform.
+    context = multiprocessing.get_context("spawn")
+    return context.Pool(
+        processes=processes if processes is not None else options.jobs,
+        initializer=_init_worker,
+        initargs=((form_variant, debug_dir, reading_options), ),
+        maxtasksperchild=options.max_tasks_per_worker)
+
+
+def process_pages(
+        image_paths: tp.List[pathlib.Path],
+        form_variant: grid_i.FormVariant,
+        debug_dir: tp.Optional[pathlib.Path] = None,
+        options: tp.Optional[PipelineOptions] = None,
+        on_page_start: tp.Optional[tp.Callable[[pathlib.Path], None]] = None,
+        reading_options: tp.Optional[ReadingOptions] = None,
+        cache: tp.Optional["page_cache.PageCache"] = None,
+        pool: tp.Optional[multiprocessing.pool.Pool] = None
+) -> tp.Iterator[PageResult]:
+    """Read every page, yielding the results in the same order as
+    `image_paths` no matter how the work was distributed.
+
+    Image files are read ahead by `options.io_workers` threads. If
+    `options.jobs` is 1, the threads also decode the images and the pages are
+    processed in the calling process. Otherwise, the still-encoded files are
+    sent to a pool of worker processes, which decode and read them. The largest
+    files are handed out first so that one slow page doesn't hold up the end of
+    the batch.
+
+    `on_page_start` is always called in the calling process: before each page is
+    processed when running serially, and as each page's result is collected when
+    running in parallel.
+
+    If `reading_options.use_corner_priors` is True, each worker (or the calling
+    process, when running serially) remembers where the corners were on the
+    pages it read to find them faster on the next one.
+
+    If a `cache` is given, pages found in it are taken from it instead of being
+    read, and every page that is read is stored in it. The I/O threads look the
+    pages up, so pages that are found are never decoded or sent to a worker.
+    The cache isn't used when debugging, as then every page's debugging data is
+    wanted.
+
+    If a `pool` from `create_pool` with the same settings is given, the pages
+    are read in it, however many there are, and it is left running afterwards.
+    Otherwise, a pool is started for this call if `options.jobs` is more than 1.
+    """
+    options = options if options is not None else PipelineOptions()
+    reading_options = (reading_options
+                       if reading_options is not None else ReadingOptions())
+    slots = threading.Semaphore(options.queue_size)
+    stopped = threading.Event()
+    if debug_dir is not None:
+        cache = None
+
+    def look_up(path: pathlib.Path, data: bytes
+                ) -> tp.Tuple[tp.Optional[str], tp.Optional[PageResult]]:
+        if cache is None:
+            return None, None
+        key = cache.get_key(data)
+        return key, cache.get(key, path.name)
+
+    def stop():
+        # Wake up the reading thread if it is waiting for a slot so it can exit.
+        stopped.set()
+        slots.release(len(image_paths) + 1)
+
+    if pool is None and (options.jobs <= 1 or len(image_paths) <= 1):
+        corner_priors = reading_options.make_corner_priors()
+
+        def load(
+            path: pathlib.Path
+        ) -> tp.Tuple[tp.Optional[str], tp.Optional[PageResult],
+                      tp.Optional[np.ndarray]]:
+            data = image_utils.read_image_bytes(path)
+            key, cached = look_up(path, data)
+            if cached is not None:
+                return key, cached, None
+            return key, None, image_utils.decode_image(
+                data, save_path=_get_debug_path(debug_dir, path))
+
+        try:
+            for _, image_path, (key, result, image) in _read_ahead(
+                    enumerate(image_paths), load, options.io_workers, slots,
+                    stopped):
+                if on_page_start:
+                    on_page_start(image_path)
+                if result is None:
+                    result = read_page(tp.cast(np.ndarray, image),
+                                       image_path.name, form_variant,
+                                       _get_debug_path(debug_dir, image_path),
+                                       reading_options, corner_priors)
+                    if cache is not None and key is not None:
+                        cache.put(key, result)
+                slots.release()
+                yield result
+        finally:
+            stop()
+        return
+
+    schedule = sorted(range(len(image_paths)),
+                      key=lambda i: _get_file_size(image_paths[i]),
+                      reverse=True)
+    # Pages found in the cache skip the workers. They are passed over from the
+    # thread that feeds the workers, as are the keys of the pages that weren't.
+    cached_pages: "queue.SimpleQueue[tp.Tuple[int, PageResult]]" = (
+        queue.SimpleQueue())
+    cache_keys: tp.Dict[int, str] = {}
+
+    def load_data(
+        path: pathlib.Path
+    ) -> tp.Tuple[bytes, tp.Optional[str], tp.Optional[PageResult]]:
+        data = image_utils.read_image_bytes(path)
+        key, cached = look_up(path, data)
+        return data if cached is None else b"", key, cached
+
+    def get_page_data() -> tp.Iterator[tp.Tuple[int, str, bytes]]:
+        for index, path, (data, key, cached) in _read_ahead(
+            ((i, image_paths[i]) for i in schedule), load_data,
+                options.io_workers, slots, stopped):
+            if cached is not None:
+                slots.release()
+                cached_pages.put((index, cached))
+                continue
+            if key is not None:
+                cache_keys[index] = key
+            yield index, path.name, data
+    try:
+        with contextlib.ExitStack() as stack:
+            if pool is None:
+                # A pool that was started for this call is terminated when it
+                # ends.
+                pool = stack.enter_context(
+                    create_pool(form_variant, debug_dir, options,
+                                reading_options,
+                                min(options.jobs, len(image_paths))))
+            # Results arrive in whatever order the workers finish them, so hold
+            # them here until every page before them has been yielded. These are
+            # small compared to the images, so they don't count against the
+            # queue size.
+            finished: tp.Dict[int, PageResult] = {}
+            next_index = 0
+
+            def take_finished() -> tp.Iterator[PageResult]:
+                nonlocal next_index
+                while not cached_pages.empty():
+                    index, result = cached_pages.get()
+                    finished[index] = result
+                while next_index in finished:
+                    if on_page_start:
+                        on_page_start(image_paths[next_index])
+                    yield finished.pop(next_index)
+                    next_index += 1
+
+            for index, result in pool.imap_unordered(_process_page_task,
+                                                     get_page_data()):
+                slots.release()
+                if cache is not None and index in cache_keys:
+                    cache.put(cache_keys.pop(index), result)
+                finished[index] = result
+                yield from take_finished()
+            # Every page has been handed to the workers or found in the cache
+            # by now, so this gets the cached pages after the last page read.
+            yield from take_finished()
+    finally:
+        stop()
+
+
+def read_page_data(pages: tp.Sequence[tp.Tuple[str, bytes]],
+                   form_variant: grid_i.FormVariant,
+                   reading_options: tp.Optional[ReadingOptions] = None,
+                   cache: tp.Optional["page_cache.PageCache"] = None,
+                   pool: tp.Optional[multiprocessing.pool.Pool] = None
+                   ) -> tp.List[PageResult]:
+    """Read pages whose image files are already in memory, each given as its
+    file name and contents, returning the results in the same order.
+
+    Unlike `process_pages`, pages that aren't images are rejected instead of
+    raising an error. If a `pool` from `create_pool` is given, the pages are
+    read in it, whatever form variant it was created for. Otherwise, they are
+    read one after another in the calling thread. A `cache` is used like in
+    `process_pages`.
+    """
+    reading_options = (reading_options
+                       if reading_options is not None else ReadingOptions())
+    results: tp.List[tp.Optional[PageResult]] = [None] * len(pages)
+    cache_keys: tp.Dict[int, str] = {}
+    tasks: tp.List[tp.Tuple[int, str, bytes, str]] = []
+    for index, (image_name, data) in enumerate(pages):
+        if cache is not None:
+            key = cache.get_key(data)
+            results[index] = cache.get(key, image_name)
+            if results[index] is not None:
+                continue
+            cache_keys[index] = key
+        tasks.append((index, image_name, data, form_variant.name))
+
+    if pool is not None:
+        read = pool.map(_read_page_data_task, tasks)
+    else:
+        read = [(index,
+                 _read_page_data(data, image_name, form_variant,
+                                 reading_options, None))
+                for index, image_name, data, _ in tasks]
+    for index, result in read:
+        if cache is not None:
+            cache.put(cache_keys[index], result)
+        results[index] = result
+    return tp.cast(tp.List[PageResult], results)
@@ -1,14 +1,17 @@
+import collections
 import textwrap
 import typing as tp
-from pathlib import Path
+from pathlib import Path, PurePath
 from datetime import datetime
 
-import data_exporting
-import image_utils
+import answer_masks
 import corner_finding
+import data_exporting
+import fill_store
+import page_cache
+import page_processing
 import scoring
 import grid_info as grid_i
-import grid_reading as grid_r
 from user_interface import ProgressTrackerWidget
 from mcta_processing import transform_and_save_mcta_output
 
@@ -25,127 +28,258 @@ def process_input(
         debug_mode_on: bool,
         form_variant: grid_i.FormVariant,
         progress_tracker: tp.Optional[ProgressTrackerWidget],
-        files_timestamp: tp.Optional[datetime]):
+        files_timestamp: tp.Optional[datetime],
+        pipeline_options: tp.Optional[page_processing.PipelineOptions] = None,
+        reading_options: tp.Optional[page_processing.ReadingOptions] = None,
+        weights_file: tp.Optional[Path] = None,
+        stream_scores: bool = False,
+        use_cache: bool = False,
+        fill_store_folder: tp.Optional[Path] = None):
     """Takes input as parameters and process it for either gui or cli.
     
     Parameter progress_tracker determines whith interface in use.
     If progress_tracker is given, function runs in gui mode.
     If progress_tracker parameter is None, prints all progress statuses to stdout.
-    """
 
-    answers_results = data_exporting.OutputSheet([x for x in grid_i.Field],
-                                                 form_variant.num_questions)
-    keys_results = data_exporting.OutputSheet([grid_i.Field.TEST_FORM_CODE, grid_i.Field.IMAGE_FILE],
-                                              form_variant.num_questions)
+    Parameter pipeline_options sets how many processes pages are read with. By
+    default, pages are read one after another in this process.
 
-    rejected_files = data_exporting.OutputSheet([grid_i.Field.IMAGE_FILE], 0)
+    Parameter reading_options changes how each page is read. By default, the
+    defaults of page_processing.ReadingOptions are used. If it has a
+    scanner_profile, the corner positions of this batch are saved to it at the
+    end.
+
+    Parameter weights_file is a CSV file with the points each question is worth
+    (see scoring.load_weights). By default, every question is worth 1 point.
+
+    Parameter stream_scores scores each exam as soon as it is read, if there is
+    a keys_file (see scoring.StreamingScorer). It stops, and the exams are
+    scored at the end instead, if any keys are read from the sheets or an exam
+    can't be rearranged. The exams are also scored again at the end if every
+    exam left blank questions that a key has, as the scores then depend on
+    how many questions the results have once they are cleaned up.
+
+    Parameter use_cache keeps what was read from each page in a cache on disk
+    (see page_cache), so pages read by an earlier run aren't read again. By
+    default, every page is read. The cache is never used in debug mode.
+
+    Parameter fill_store_folder saves the fill percent of every bubble to a
+    fill_store.FillStore in that folder, so the sheets can be read and scored
+    again with rescore without reading their images.
+    """
+    reading_options = (reading_options if reading_options is not None else
+                       page_processing.ReadingOptions())
 
     debug_dir = output_folder / (
             data_exporting.format_timestamp_for_file(files_timestamp) + "debug")
     if debug_mode_on:
         data_exporting.make_dir_if_not_exists(debug_dir)
 
-    try:
-        for image_path in image_paths:
-            if debug_mode_on:
-                debug_path = debug_dir / image_path.stem
-                data_exporting.make_dir_if_not_exists(debug_path)
-            else:
-                debug_path = None
+    # Every page's corners, to save the scanner profile from. Each worker
+    # process keeps its own, so they are gathered here as well.
+    corner_priors = corner_finding.CornerPriors()
+    corner_method_counts: tp.Counter[corner_finding.CornerSearchMethod] = (
+        collections.Counter())
 
-            if progress_tracker:
-                progress_tracker.set_status(f"Processing '{image_path.name}'.")
-            else:
-                print(f"Processing '{image_path.name}'.")
+    def report_page_start(image_path: Path):
+        if progress_tracker:
+            progress_tracker.set_status(f"Processing '{image_path.name}'.")
+        else:
+            print(f"Processing '{image_path.name}'.")
 
-            image = image_utils.get_image(image_path, save_path=debug_path)
-            prepared_image = image_utils.prepare_scan_for_processing(
-                image, save_path=debug_path)
+    cache = page_cache.PageCache(
+        page_cache.get_default_cache_dir(),
+        page_cache.get_options_key(form_variant, reading_options)) if (
+            use_cache and not debug_mode_on) else None
 
-            try:
-                corners = corner_finding.find_corner_marks(prepared_image,
-                                                       save_path=debug_path)
-            except corner_finding.CornerFindingError:
-                rejected_files.add({grid_i.Field.IMAGE_FILE: image_path.name}, [])
-                continue
+    def read_pages() -> tp.Iterator[page_processing.PageResult]:
+        fills = fill_store.FillStoreWriter(
+            fill_store_folder, form_variant,
+            [path.name for path in image_paths]) if fill_store_folder else None
+        for index, page in enumerate(
+                page_processing.process_pages(
+                    image_paths,
+                    form_variant,
+                    debug_dir=debug_dir if debug_mode_on else None,
+                    options=pipeline_options,
+                    on_page_start=report_page_start,
+                    reading_options=reading_options,
+                    cache=cache)):
+            if fills is not None:
+                fills.add(index, page)
+            if page.corner_layout is not None:
+                corner_priors.record(page.corner_layout)
+            if page.corner_method is not None and not page.from_cache:
+                corner_method_counts[page.corner_method] += 1
+            yield page
+        if fills is not None:
+            fills.finish()
 
-            # Dilates the image - removes black pixels from edges, which preserves
-            # solid shapes while destroying nonsolid ones. By doing this after noise
-            # removal and thresholding, it eliminates irregular things like W and M
-            morphed_image = image_utils.dilate(prepared_image,
-                                               save_path=debug_path)
-
-            # Establish a grid
-            grid = grid_r.Grid(corners,
-                               grid_i.GRID_HORIZONTAL_CELLS,
-                               grid_i.GRID_VERTICAL_CELLS,
-                               morphed_image,
-                               save_path=debug_path)
-
-            # Calculate fill percent for every bubble
-            field_fill_percents = {
-                key: grid_r.get_group_from_info(value,
-                                                grid).get_all_fill_percents()
-                for key, value in form_variant.fields.items() if value is not None
-            }
-            answer_fill_percents = [
-                grid_r.get_group_from_info(question, grid).get_all_fill_percents()
-                for question in form_variant.questions
-            ]
-
-            # Calculate the fill threshold
-            threshold = grid_r.calculate_bubble_fill_threshold(
-                field_fill_percents,
-                answer_fill_percents,
-                save_path=debug_path,
-                form_variant=form_variant)
-
-            # Get the answers for questions
-            answers = [
-                grid_r.read_answer_as_string(i, grid, multi_answers_as_f,
-                                             threshold, form_variant,
-                                             answer_fill_percents[i])
-                for i in range(form_variant.num_questions)
-            ]
-
-            field_data: tp.Dict[grid_i.RealOrVirtualField, str] = {
-                grid_i.Field.IMAGE_FILE: image_path.name,
-            }
-
-            # Read the Student ID. If it indicates this exam is a key, treat it as such
-            student_id = grid_r.read_field_as_string(
-                grid_i.Field.STUDENT_ID, grid, threshold, form_variant,
-                field_fill_percents[grid_i.Field.STUDENT_ID])
-            if student_id == grid_i.KEY_STUDENT_ID:
-                form_code_field = grid_i.Field.TEST_FORM_CODE
-                field_data[form_code_field] = grid_r.read_field_as_string(
-                    form_code_field, grid, threshold, form_variant,
-                    field_fill_percents[form_code_field]) or ""
-                keys_results.add(field_data, answers)
+    def summarize_reading() -> str:
+        success_string = ""
+        corner_layout = corner_priors.predict()
+        if reading_options.scanner_profile is not None and corner_layout is not None:
+            corner_finding.save_scanner_profile(reading_options.scanner_profile, corner_layout)
+        if reading_options.use_corner_priors:
+            found_pages = sum(corner_method_counts.values())
+            prior_hits = corner_method_counts[corner_finding.CornerSearchMethod.PRIOR]
+            if found_pages > 0:
+                success_string += f"Corners were found where expected on {prior_hits} of {found_pages} exams ({prior_hits / found_pages:.0%}).\n"
+        if fill_store_folder:
+            success_string += f"✔️ Fill percents saved to '{fill_store_folder}', so the sheets can be scored again without reading them.\n"
+        if cache is not None:
+            cache.evict()
+            if cache.hits > 0:
+                success_string += f"{cache.hits} of {len(image_paths)} files were read before, so they were taken from the cache.\n"
+        return success_string
 
+    save_pages(read_pages(), output_folder, multi_answers_as_f,
+               empty_answers_as_g, keys_file, arrangement_file, sort_results,
+               output_mcta, debug_mode_on, form_variant, progress_tracker,
+               files_timestamp, weights_file, stream_scores, summarize_reading)
+
+
+def save_pages(pages: tp.Iterable[page_processing.PageResult],
+               output_folder: Path,
+               multi_answers_as_f: bool,
+               empty_answers_as_g: bool,
+               keys_file: tp.Optional[Path],
+               arrangement_file: tp.Optional[Path],
+               sort_results: bool,
+               output_mcta: bool,
+               debug_mode_on: bool,
+               form_variant: grid_i.FormVariant,
+               progress_tracker: tp.Optional[ProgressTrackerWidget],
+               files_timestamp: tp.Optional[datetime],
+               weights_file: tp.Optional[Path] = None,
+               stream_scores: bool = False,
+               summarize_reading: tp.Optional[tp.Callable[[], str]] = None):
+    """Save the results, keys and scores of pages that have been read, as they
+    are read. The parameters are the same as for process_input.
+
+    Parameter summarize_reading is called once every page has been read, and
+    returns more messages about how they were read to show after the others.
+    """
+    # Results are written to their files as each page is read, so they are
+    # never all in memory. Keys are few, so they are kept until the end.
+    results_columns = [x for x in grid_i.Field]
+    scores_columns: tp.List[grid_i.RealOrVirtualField] = results_columns + [
+        grid_i.VirtualField.SCORE, grid_i.VirtualField.POINTS
+    ]
+    answers_results = data_exporting.SheetWriter(
+        data_exporting.get_output_path(output_folder, "results",
+                                       files_timestamp), results_columns,
+        form_variant.num_questions)
+    keys_results = data_exporting.OutputSheet([grid_i.Field.TEST_FORM_CODE, grid_i.Field.IMAGE_FILE],
+                                              form_variant.num_questions)
+
+    rejected_files = data_exporting.SheetWriter(
+        data_exporting.get_output_path(output_folder, "rejected_files",
+                                       files_timestamp),
+        [grid_i.Field.IMAGE_FILE], 0)
+
+    streaming_scorer: tp.Optional[scoring.StreamingScorer] = None
+    # Every file being written, so that none are left partly written if
+    # saving fails.
+    writers = [answers_results, rejected_files]
+
+    def discard_writers():
+        for writer in writers:
+            writer.discard()
+        if streaming_scorer is not None:
+            streaming_scorer.discard()
+
+    def save_scores(results_path: PurePath,
+                    keys: data_exporting.OutputSheet,
+                    weights: tp.Optional[tp.Dict[str, tp.List[float]]],
+                    filebasename: str):
+        nonlocal streaming_scorer
+        scores_path = data_exporting.get_output_path(output_folder,
+                                                     filebasename,
+                                                     files_timestamp)
+        if (streaming_scorer is not None
+                and streaming_scorer.scores is not None
+                and streaming_scorer.scores.path == scores_path):
+            num_answers = len(data_exporting.read_column_names(
+                results_path)) - len(results_columns)
+            if streaming_scorer.matches_results(num_answers):
+                # The scores were written as the exams were read, so they
+                # only need sorting like the results.
+                streaming_scorer.finish(sort_results)
+                streaming_scorer = None
+                return
+            streaming_scorer.discard()
+            streaming_scorer = None
+        scores = data_exporting.SheetWriter(scores_path, scores_columns,
+                                            form_variant.num_questions)
+        writers.append(scores)
+        for chunk in data_exporting.read_sheet_chunks(
+                results_path, results_columns, form_variant.num_questions):
+            scores.add_sheet(
+                scoring.score_results(chunk, keys, form_variant.num_questions,
+                                      weights))
+        scores.finish(sort=False)
+
+    try:
+        weights = scoring.load_weights(weights_file) if weights_file else None
+
+        if stream_scores and keys_file:
+            stream_keys = data_exporting.OutputSheet(
+                [grid_i.Field.TEST_FORM_CODE, grid_i.Field.IMAGE_FILE],
+                form_variant.num_questions)
+            stream_keys.add_file(keys_file)
+            scores_name: tp.Optional[str] = None
+            if arrangement_file:
+                # Rearranged exams are scored against the one key, like below.
+                if stream_keys.row_count == 1:
+                    stream_keys.delete_field_column(
+                        grid_i.Field.TEST_FORM_CODE)
+                    scores_name = "rearranged_scores"
+            elif stream_keys.row_count > 0:
+                scores_name = "scores"
+            if scores_name is not None:
+                streaming_scorer = scoring.StreamingScorer(
+                    stream_keys, results_columns, form_variant.num_questions,
+                    weights, arrangement_file,
+                    "G" if empty_answers_as_g else "",
+                    data_exporting.get_output_path(output_folder, scores_name,
+                                                   files_timestamp))
+
+        for page in pages:
+            if page.rejected:
+                rejected_files.add({grid_i.Field.IMAGE_FILE: page.image_name}, [])
+                continue
+            answers = answer_masks.format_answers(page.answer_masks,
+                                                  multi_answers_as_f)
+            if page.is_key:
+                keys_results.add(page.field_data, answers)
+                if streaming_scorer is not None:
+                    streaming_scorer.discard()
+                    streaming_scorer = None
             else:
-                for field in form_variant.fields.keys():
-                    field_value = grid_r.read_field_as_string(
-                        field, grid, threshold, form_variant,
-                        field_fill_percents[field])
-                    if field_value is not None:
-                        field_data[field] = field_value
-                answers_results.add(field_data, answers)
+                answers_results.add(page.field_data, answers)
+                if streaming_scorer is not None:
+                    try:
+                        streaming_scorer.add(page.field_data, answers)
+                    except (ValueError, IndexError):
+                        streaming_scorer.discard()
+                        streaming_scorer = None
             if progress_tracker:
                 progress_tracker.step_progress()
 
-        answers_results.clean_up(
+        results_path = answers_results.finish(
+            sort_results,
             replace_empty_with="G" if empty_answers_as_g else "")
-        answers_results.save(output_folder,
-                             "results",
-                             sort_results,
-                             timestamp=files_timestamp)
 
         if rejected_files.row_count == 0:
             success_string = "✔️ All exams processed and saved.\n"
+            rejected_files.discard()
         else:
             success_string = "❗ Some files could not be processed (see rejected_files output).\nAll other exams were processed and saved.\n"
-            rejected_files.save(output_folder, "rejected_files", sort=False, timestamp=files_timestamp)
+            rejected_files.finish(sort=False)
+
+        if summarize_reading is not None:
+            success_string += summarize_reading()
 
         if keys_file:
             keys_results.add_file(keys_file)
@@ -153,14 +287,22 @@ def process_input(
         if (keys_results.row_count == 0):
             success_string += "No exam keys were found, so no scoring was performed."
         elif (arrangement_file and keys_results.row_count == 1):
-            answers_results.reorder(arrangement_file)
-            keys_results.data[1][keys_results.field_columns.index(
-                grid_i.Field.TEST_FORM_CODE)] = ""
-
-            answers_results.save(output_folder,
-                                 "rearranged_results",
-                                 sort_results,
-                                 timestamp=files_timestamp)
+            keys_results.set_field(0, grid_i.Field.TEST_FORM_CODE, "")
+            # The results file is already sorted, and neither rearranging nor
+            # scoring changes the names, so their outputs don't need sorting.
+            rearranged_results = data_exporting.SheetWriter(
+                data_exporting.get_output_path(output_folder,
+                                               "rearranged_results",
+                                               files_timestamp),
+                results_columns, form_variant.num_questions,
+                data_exporting.read_column_names(results_path))
+            writers.append(rearranged_results)
+            for chunk in data_exporting.read_sheet_chunks(
+                    results_path, results_columns,
+                    form_variant.num_questions):
+                chunk.reorder(arrangement_file)
+                rearranged_results.add_sheet(chunk)
+            results_path = rearranged_results.finish(sort=False)
             success_string += "✔️ Results rearranged based on arrangement file.\n"
 
             keys_results.delete_field_column(grid_i.Field.TEST_FORM_CODE)
@@ -172,12 +314,7 @@ def process_input(
 
             success_string += "✔️ Key processed and saved.\n"
 
-            scores = scoring.score_results(answers_results, keys_results,
-                                           form_variant.num_questions)
-            scores.save(output_folder,
-                        "rearranged_scores",
-                        sort_results,
-                        timestamp=files_timestamp)
+            save_scores(results_path, keys_results, weights, "rearranged_scores")
             success_string += "✔️ Scored results processed and saved."
         elif (arrangement_file):
             success_string += "❌ Arrangement file and keys were ignored because more than one key was found."
@@ -187,22 +324,25 @@ def process_input(
                               sort_results,
                               timestamp=files_timestamp)
             success_string += "✔️ All keys processed and saved.\n"
-            scores = scoring.score_results(answers_results, keys_results,
-                                           form_variant.num_questions)
-            scores.save(output_folder,
-                        "scores",
-                        sort_results,
-                        timestamp=files_timestamp)
+            save_scores(results_path, keys_results, weights, "scores")
             success_string += "✔️ All scored results processed and saved."
 
+        if streaming_scorer is not None:
+            streaming_scorer.discard()
+            streaming_scorer = None
+
         if (output_mcta):
-            transform_and_save_mcta_output(answers_results, keys_results, files_timestamp, output_folder)
+            transform_and_save_mcta_output(
+                data_exporting.read_sheet(results_path, results_columns,
+                                          form_variant.num_questions),
+                keys_results, files_timestamp, output_folder)
 
         if progress_tracker:
             progress_tracker.set_status(success_string, False)
         else:
             print(success_string)
     except (RuntimeError, ValueError) as e:
+        discard_writers()
         wrapped_err = "\n".join(textwrap.wrap(str(e), 70))
         if progress_tracker:
             progress_tracker.set_status(f"Error: {wrapped_err}", False)
@@ -210,5 +350,8 @@ def process_input(
             print(f'Error: {wrapped_err}')
         if debug_mode_on:
             raise
+    except BaseException:
+        discard_writers()
+        raise
     if progress_tracker:
         progress_tracker.show_exit_button_and_wait()
@@ -0,0 +1,121 @@
+"""Score sheets again from the fill store saved when they were read (see
+`main.py --fill-store`), without reading their images. This is how to apply a
+corrected key, an arrangement map, weights or other output options to a batch
+that has already been read."""
+
+import argparse
+import sys
+import textwrap
+import typing as tp
+from datetime import datetime
+from pathlib import Path
+
+import fill_store
+from file_handling import parse_path_arg
+from process_input import save_pages
+
+
+def rescore_input(fill_store_folder: Path,
+                  output_folder: Path,
+                  multi_answers_as_f: bool,
+                  empty_answers_as_g: bool,
+                  keys_file: tp.Optional[Path],
+                  arrangement_file: tp.Optional[Path],
+                  sort_results: bool,
+                  output_mcta: bool,
+                  files_timestamp: tp.Optional[datetime],
+                  weights_file: tp.Optional[Path] = None,
+                  threshold: tp.Optional[float] = None):
+    """Read every sheet in the fill store again and save its results, keys and
+    scores like process_input does.
+
+    Parameter threshold is the fill percent above which every bubble counts as
+    filled in. By default, each sheet's threshold is calculated from its fill
+    percents like when it was first read.
+    """
+    try:
+        store = fill_store.open_fill_store(fill_store_folder)
+    except ValueError as e:
+        wrapped_err = "\n".join(textwrap.wrap(str(e), 70))
+        print(f'Error: {wrapped_err}')
+        return
+
+    def summarize_reading() -> str:
+        return f"Sheets were read from the fill store in '{fill_store_folder}'.\n"
+
+    save_pages(store.read_pages(threshold), output_folder, multi_answers_as_f,
+               empty_answers_as_g, keys_file, arrangement_file, sort_results,
+               output_mcta, False, store.form_variant, None, files_timestamp,
+               weights_file, summarize_reading=summarize_reading)
+
+
+def parse_threshold_arg(threshold_arg: str) -> float:
+    """Parse a `--threshold` argument, which is a fill percent from 0 to 1."""
+    try:
+        threshold = float(threshold_arg)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{threshold_arg}' is not a number.")
+    if not 0 <= threshold <= 1:
+        raise argparse.ArgumentTypeError("Must be between 0 and 1.")
+    return threshold
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='OpenMCR: Score sheets again from the fill store saved when they were read\n'
+                                                 'with --fill-store, without reading their images.',
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('fill_store',
+                        help='Path to the folder the sheets were saved to with --fill-store.',
+                        type=parse_path_arg)
+    parser.add_argument('output_folder',
+                        help='Path to a folder to save result to.',
+                        type=parse_path_arg)
+    parser.add_argument('--anskeys',
+                        help='Answer Keys CSV file path. If given, will be used over other keys.',
+                        type=parse_path_arg)
+    parser.add_argument('--formmap',
+                        help='Form Arrangement Map CSV file path. If given, only one answer key may be provided.',
+                        type=parse_path_arg)
+    parser.add_argument('--weights',
+                        help='CSV file path with the points each question is worth, with columns named Q1 to QN and\n'
+                             'optionally a Test Form Code column. By default, every question is worth 1 point.',
+                        type=parse_path_arg)
+    parser.add_argument('--threshold',
+                        type=parse_threshold_arg,
+                        help='Count every bubble filled in more than this fraction (from 0 to 1) as filled in.\n'
+                             'By default, it is calculated for each sheet like when the sheets were read.')
+    parser.add_argument('-ml', '--multiple',
+                        action='store_true',
+                        help='Convert multiple answers in a question to F, instead of [A|B].')
+    parser.add_argument('-e', '--empty',
+                        action='store_true',
+                        help='Save empty answers as G. By default, they will be saved as blank values.')
+    parser.add_argument('-s', '--sort',
+                        action='store_true',
+                        help="Sort output by students' name.")
+    parser.add_argument('--mcta',
+                        action='store_true',
+                        help='Output additional files for Multiple Choice Test Analysis.')
+    parser.add_argument('--disable-timestamps',
+                        action='store_true',
+                        help='Disable timestamps in file names. Useful when consistent file names are required. Existing files will be overwritten without warning!')
+
+    # prints help and exits when called w/o arguments
+    if len(sys.argv) == 1:
+        parser.print_help(sys.stderr)
+        sys.exit(1)
+
+    args = parser.parse_args()
+
+    files_timestamp = datetime.now().replace(microsecond=0) if not args.disable_timestamps else None
+    rescore_input(args.fill_store,
+                  args.output_folder,
+                  args.multiple,
+                  args.empty,
+                  args.anskeys,
+                  args.formmap,
+                  args.sort,
+                  args.mcta,
+                  files_timestamp,
+                  args.weights,
+                  args.threshold)
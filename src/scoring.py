@@ -2,10 +2,12 @@ import csv
 import pathlib
 import typing as tp
 
+import numpy as np
+
+import answer_masks
 import data_exporting
 import grid_info
 import list_utils
-import math_utils
 
 
 def get_key_form_code(answer_keys: data_exporting.OutputSheet,
@@ -52,51 +54,240 @@ def establish_key_dict(answer_keys: data_exporting.OutputSheet
     }
 
 
+def load_weights(path: pathlib.Path) -> tp.Dict[str, tp.List[float]]:
+    """Load the points each question is worth from a CSV file with answer
+    columns named "Q1" through "QN", like an answer keys file. Each row gives
+    the points of one test form code, if there is a test form code column, or
+    of every test form otherwise. Returns a dict of the form codes to the list
+    of points, where "*" is the points of every form.
+
+    Questions without a value in the file are worth 1 point."""
+    form_code_column_name = data_exporting.COLUMN_NAMES[
+        grid_info.Field.TEST_FORM_CODE]
+    weights: tp.Dict[str, tp.List[float]] = {}
+    with open(str(path), newline='') as file:
+        reader = csv.reader(file)
+        names = next(reader)
+        try:
+            answers_start_index = list_utils.find_index(names, "Q1")
+        except StopIteration:
+            raise ValueError(
+                "Invalid weights file. Answers columns must be named 'Q1' through 'QN'."
+            )
+        try:
+            form_code_index: tp.Optional[int] = list_utils.find_index(
+                names, form_code_column_name)
+        except StopIteration:
+            form_code_index = None
+        for row in reader:
+            form_code = "*" if form_code_index is None else row[
+                form_code_index].strip()
+            try:
+                weights[form_code] = [
+                    float(value) if value.strip() else 1.0
+                    for value in row[answers_start_index:]
+                ]
+            except ValueError:
+                raise ValueError(
+                    f"Weights file entry for '{form_code}' is invalid. All points must be numbers."
+                )
+    return weights
+
+
+def _format_points(points: float) -> str:
+    return str(int(points)) if float(points).is_integer() else str(points)
+
+
 def score_results(results: data_exporting.OutputSheet,
                   answer_keys: data_exporting.OutputSheet,
-                  num_questions: int) -> data_exporting.OutputSheet:
-    answers = results.data
+                  num_questions: int,
+                  weights: tp.Optional[tp.Dict[str, tp.List[float]]] = None
+                  ) -> data_exporting.OutputSheet:
+    """Score every exam in `results` against the key of its test form code.
+
+    The exams are grouped by form code and each group is compared with its key
+    at once. Each question is worth 1 point unless `weights` (see
+    `load_weights`) says otherwise. Answers past the end of the key, or keys
+    past the end of the answers, aren't scored."""
     keys = establish_key_dict(answer_keys)
-    form_code_column_name = data_exporting.COLUMN_NAMES[
-        grid_info.Field.TEST_FORM_CODE]
-    form_code_index = list_utils.find_index(answers[0], form_code_column_name)
-    answers_start_index = list_utils.find_index(
-        answers[0][form_code_index + 1:], "Q1") + form_code_index + 1
+    weights = weights if weights is not None else {}
+    fields, codes, lengths, vocabulary = results.to_numpy()
+    num_fields = len(results.field_columns)
+    form_code_index = results.field_columns.index(
+        grid_info.Field.TEST_FORM_CODE)
+    answer_counts = lengths - num_fields
+    masks = answer_masks.parse_answers(vocabulary)[codes]
+    codes_by_text = {text: code for code, text in enumerate(vocabulary)}
+
+    row_count = len(lengths)
+    earned = np.zeros(codes.shape, float)
+    points = np.zeros(row_count, float)
+    possible = np.zeros(row_count, float)
+    scored_counts = np.zeros(row_count, int)
+    has_key = np.zeros(row_count, bool)
+
+    if "*" in keys:
+        groups = [("*", np.arange(row_count))]
+    else:
+        form_codes, group_indexes = np.unique(
+            fields[:, form_code_index].astype(str), return_inverse=True)
+        groups = [(form_code, np.flatnonzero(group_indexes == i))
+                  for i, form_code in enumerate(form_codes.tolist())]
+    for form_code, rows in groups:
+        if form_code not in keys:
+            continue
+        key = keys[form_code]
+        width = min(len(key), codes.shape[1])
+        key = [answer.strip() for answer in key[:width]]
+        key_masks = answer_masks.parse_answers(key)
+        key_codes = np.array([codes_by_text.get(answer, -1) for answer in key],
+                             int)
+        question_weights = np.ones(width)
+        form_weights = weights.get(form_code, weights.get("*", []))[:width]
+        question_weights[:len(form_weights)] = form_weights
+
+        scored = np.arange(width) < np.minimum(answer_counts[rows],
+                                               width)[:, np.newaxis]
+        group_masks = masks[rows, :width]
+        # Answers that aren't formatted answers are compared by their text.
+        correct = (group_masks == key_masks) & (
+            (key_masks != answer_masks.OTHER) |
+            (codes[rows, :width] == key_codes)) & scored
+        earned[rows, :width] = correct * question_weights
+        points[rows] = earned[rows].sum(axis=1)
+        possible[rows] = (scored * question_weights).sum(axis=1)
+        scored_counts[rows] = scored.sum(axis=1)
+        has_key[rows] = True
+
+    percents = np.divide(points,
+                         possible,
+                         out=np.zeros(row_count),
+                         where=possible != 0) * 100
+    score_texts = np.full(row_count, data_exporting.KEY_NOT_FOUND_MESSAGE,
+                          object)
+    points_texts = score_texts.copy()
+    score_texts[has_key] = [
+        str(round(percent, 2)) for percent in percents[has_key].tolist()
+    ]
+    points_texts[has_key] = [
+        _format_points(value) for value in points[has_key].tolist()
+    ]
+    earned_values, earned_indexes = np.unique(earned, return_inverse=True)
+    earned_texts = [_format_points(value) for value in earned_values.tolist()]
+
     virtual_fields: tp.List[grid_info.RealOrVirtualField] = [
         grid_info.VirtualField.SCORE, grid_info.VirtualField.POINTS
     ]
     columns = results.field_columns + virtual_fields
     scored_results = data_exporting.OutputSheet(columns, num_questions)
+    scored_results.add_rows(
+        np.column_stack([fields, score_texts, points_texts]), earned_texts,
+        earned_indexes.reshape(earned.shape), scored_counts)
+    return scored_results
 
-    for exam in answers[1:]:  # Skip header row
-        fields = {
-            k: v
-            for k, v in zip(results.field_columns, exam[:answers_start_index])
-        }
-        form_code = exam[form_code_index]
-        try:
-            if "*" in keys:
-                key = keys["*"]
-            else:
-                key = keys[form_code]
-        except KeyError:
-            fields[grid_info.VirtualField.
-                   SCORE] = data_exporting.KEY_NOT_FOUND_MESSAGE
-            fields[grid_info.VirtualField.
-                   POINTS] = data_exporting.KEY_NOT_FOUND_MESSAGE
-            scored_answers = []
-        else:
-            scored_answers = [
-                int(actual == correct)
-                for actual, correct in zip(exam[answers_start_index:], key)
-            ]
-            fields[grid_info.VirtualField.SCORE] = str(
-                round(math_utils.mean(scored_answers) * 100, 2))
-            fields[grid_info.VirtualField.POINTS] = str(sum(scored_answers))
-        string_scored_answers = [str(s) for s in scored_answers]
-        scored_results.add(fields, string_scored_answers)
 
-    return scored_results
+class StreamingScorer():
+    """Scores each exam as soon as it is read, against answer keys that are
+    known before the first one, and writes the scores to a file as it goes.
+
+    `score_results` runs after the results are cleaned up, which removes the
+    questions that every exam left blank at the end. That isn't known until
+    the last exam is read, so here every exam is scored as if it had an answer
+    for every question, up to the end of each key. The scores are the same as
+    `score_results` gives when the cleaned up results are at least as wide as
+    the keys (see `matches_results`).
+
+    Members:
+        keys: The answer keys.
+        key_width: The number of answers of the widest key, including any
+            blank answers at its end.
+    """
+    keys: data_exporting.OutputSheet
+    key_width: int
+    columns: tp.List[grid_info.RealOrVirtualField]
+    num_questions: int
+    weights: tp.Optional[tp.Dict[str, tp.List[float]]]
+    arrangement_file: tp.Optional[pathlib.Path]
+    replace_empty_with: str
+    scores: tp.Optional[data_exporting.SheetWriter]
+
+    def __init__(self, keys: data_exporting.OutputSheet,
+                 columns: tp.List[grid_info.RealOrVirtualField],
+                 num_questions: int,
+                 weights: tp.Optional[tp.Dict[str, tp.List[float]]],
+                 arrangement_file: tp.Optional[pathlib.Path],
+                 replace_empty_with: str,
+                 path: tp.Optional[pathlib.PurePath],
+                 flush_interval: int = data_exporting.DEFAULT_FLUSH_INTERVAL,
+                 append: bool = False):
+        """Params:
+            keys: The answer keys. If there is an `arrangement_file`, this must
+                have one key and no test form code column.
+            columns: The field columns of the results.
+            path: The path of the scores file. If None, the scores are only
+                returned by `score`.
+            flush_interval, append: How the scores file is written (see
+                `data_exporting.SheetWriter`).
+        """
+        self.keys = keys
+        lengths = keys.to_numpy().row_lengths
+        self.key_width = min(
+            int(lengths.max()) - len(keys.field_columns),
+            num_questions) if keys.row_count > 0 else 0
+        self.columns = columns
+        self.num_questions = num_questions
+        self.weights = weights
+        self.arrangement_file = arrangement_file
+        self.replace_empty_with = replace_empty_with
+        self.scores = data_exporting.SheetWriter(
+            path,
+            columns +
+            [grid_info.VirtualField.SCORE, grid_info.VirtualField.POINTS],
+            num_questions,
+            flush_interval=flush_interval,
+            append=append) if path is not None else None
+        if arrangement_file is not None:
+            # Fail now rather than on the first exam if the file is invalid.
+            data_exporting.load_arrangement_map(arrangement_file,
+                                                num_questions)
+
+    def score(self, fields: tp.Dict[grid_info.RealOrVirtualField, str],
+              answers: tp.List[str]) -> data_exporting.OutputSheet:
+        """Score an exam, returning a sheet with its one row of scores.
+
+        Raises ValueError or IndexError, like `OutputSheet.reorder`, if the
+        exam can't be rearranged."""
+        exam = data_exporting.OutputSheet(list(self.columns),
+                                          self.num_questions)
+        exam.add(fields, answers)
+        exam.clean_up(self.replace_empty_with,
+                      len(self.columns) + self.num_questions)
+        if self.arrangement_file is not None:
+            exam.reorder(self.arrangement_file)
+        return score_results(exam, self.keys, self.num_questions, self.weights)
+
+    def matches_results(self, num_answers: int) -> bool:
+        """Whether the scores are the same as `score_results` gives for results
+        that were cleaned up to `num_answers` answers.
+
+        Rearranged exams have as many answers as their arrangement, however
+        many the results had, so their scores always match."""
+        return (self.arrangement_file is not None
+                or num_answers >= self.key_width)
+
+    def add(self, fields: tp.Dict[grid_info.RealOrVirtualField, str],
+            answers: tp.List[str]):
+        """Score an exam and write its scores, like `score`."""
+        assert self.scores is not None, "There is no scores file."
+        self.scores.add_sheet(self.score(fields, answers))
+
+    def finish(self, sort: bool) -> pathlib.PurePath:
+        assert self.scores is not None, "There is no scores file."
+        return self.scores.finish(sort)
+
+    def discard(self):
+        if self.scores is not None:
+            self.scores.discard()
 
 
 def verify_answer_key_sheet(file_path: pathlib.Path) -> bool:
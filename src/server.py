@@ -0,0 +1,449 @@
+"""A local HTTP service that reads sheets sent to it, for programs (like a
+learning management system) that submit sheets themselves.
+
+The worker processes are started, and the layouts of the form variants are
+compiled, once when the server starts, so a sheet only takes as long as reading
+it. The server only listens on 127.0.0.1.
+
+Endpoints:
+    POST /sheets?name=NAME&variant=75: The body is one image file. Responds
+        with the sheet that was read (see `GradingService.format_page`).
+    POST /batches?variant=75: The body is JSON like
+        `{"sheets": [{"name": "a.jpg", "data": "<base64>"}]}`. Responds with
+        `{"sheets": [...]}`, in the same order.
+    GET /stats: Counts and timings since the server started.
+
+At most `max_concurrent` requests are read at once. Up to `queue_size` more
+wait for their turn, and any others are answered with 503 straight away.
+"""
+
+import argparse
+import base64
+import binascii
+import collections
+import http.server
+import json
+import multiprocessing
+import multiprocessing.pool
+import signal
+import sys
+import threading
+import time
+import typing as tp
+import urllib.parse
+from pathlib import Path
+
+import numpy as np
+
+import answer_masks
+import data_exporting
+import grid_info as grid_i
+import page_cache
+import page_processing
+import scoring
+from file_handling import parse_path_arg
+
+DEFAULT_PORT = 8150
+# How many requests can wait for one of the `max_concurrent` places.
+DEFAULT_QUEUE_SIZE = 32
+# The largest request body accepted, in bytes.
+MAX_REQUEST_SIZE = 64 * 1024 * 1024
+# How many of the latest requests the timings in /stats are calculated from.
+LATENCY_WINDOW = 1000
+
+
+class ServiceStats():
+    """Counts and timings of the requests handled so far. Safe to use from
+    any thread.
+
+    Members:
+        started: When the server started, from `time.monotonic`.
+        requests: The number of reading requests that were answered.
+        sheets: The number of sheets read.
+        rejected_sheets: The number of sheets that couldn't be read.
+        busy_responses: The number of requests turned away because the queue
+            was full.
+        errors: The number of requests that failed.
+        active: The number of requests being read right now.
+        queued: The number of requests waiting to be read.
+        latencies: How long each of the latest requests took, in seconds.
+    """
+    started: float
+    requests: int
+    sheets: int
+    rejected_sheets: int
+    busy_responses: int
+    errors: int
+    active: int
+    queued: int
+    latencies: tp.Deque[float]
+    lock: threading.Lock
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.sheets = 0
+        self.rejected_sheets = 0
+        self.busy_responses = 0
+        self.errors = 0
+        self.active = 0
+        self.queued = 0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.lock = threading.Lock()
+
+    def to_json(self) -> tp.Dict[str, tp.Any]:
+        with self.lock:
+            latencies = np.array(self.latencies)
+            stats: tp.Dict[str, tp.Any] = {
+                "uptime_seconds": round(time.monotonic() - self.started, 3),
+                "requests": self.requests,
+                "sheets": self.sheets,
+                "rejected_sheets": self.rejected_sheets,
+                "busy_responses": self.busy_responses,
+                "errors": self.errors,
+                "active": self.active,
+                "queued": self.queued,
+            }
+        if latencies.size > 0:
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+            stats["latency_ms"] = {
+                "mean": round(float(latencies.mean()) * 1000, 1),
+                "p50": round(float(p50), 1),
+                "p95": round(float(p95), 1),
+                "p99": round(float(p99), 1),
+                "max": round(float(latencies.max()) * 1000, 1)
+            }
+        return stats
+
+
+class ServerBusyError(Exception):
+    """Raised when a request can't even wait its turn, as the queue is full."""
+    pass
+
+
+class GradingService():
+    """Reads the sheets sent to the server, with worker processes that are
+    kept for every request.
+
+    Members:
+        multi_answers_as_f, replace_empty_with: How answers are formatted, like
+            in process_input.
+        reading_options: How each sheet is read.
+        pool: The worker processes, or None to read sheets in the thread
+            handling the request.
+        scorers: For each form variant, scores the exams against the answer
+            keys given when the server started, if any were.
+        caches: For each form variant, the sheets read before by this server
+            or by a run of the program. Empty to always read them again.
+        max_concurrent: The most requests read at once.
+        queue_size: The most requests waiting to be read at once.
+        stats: Counts and timings of the requests so far.
+    """
+    multi_answers_as_f: bool
+    replace_empty_with: str
+    reading_options: page_processing.ReadingOptions
+    pool: tp.Optional[multiprocessing.pool.Pool]
+    scorers: tp.Dict[str, scoring.StreamingScorer]
+    caches: tp.Dict[str, page_cache.PageCache]
+    max_concurrent: int
+    queue_size: int
+    stats: ServiceStats
+    _places: threading.Semaphore
+
+    def __init__(self,
+                 multi_answers_as_f: bool,
+                 empty_answers_as_g: bool,
+                 keys_file: tp.Optional[Path],
+                 arrangement_file: tp.Optional[Path],
+                 weights_file: tp.Optional[Path],
+                 pipeline_options: page_processing.PipelineOptions,
+                 reading_options: page_processing.ReadingOptions,
+                 max_concurrent: tp.Optional[int] = None,
+                 queue_size: int = DEFAULT_QUEUE_SIZE,
+                 use_cache: bool = False):
+        if max_concurrent is not None and max_concurrent < 1:
+            raise ValueError("At least one request must be read at once.")
+        if queue_size < 0:
+            raise ValueError("The queue size can't be negative.")
+        self.multi_answers_as_f = multi_answers_as_f
+        self.replace_empty_with = "G" if empty_answers_as_g else ""
+        self.reading_options = reading_options
+        self.scorers = {}
+        if keys_file:
+            weights = scoring.load_weights(
+                weights_file) if weights_file else None
+            for form_variant in grid_i.FORM_VARIANTS.values():
+                keys = data_exporting.OutputSheet(
+                    [grid_i.Field.TEST_FORM_CODE, grid_i.Field.IMAGE_FILE],
+                    form_variant.num_questions)
+                keys.add_file(keys_file)
+                if arrangement_file:
+                    if keys.row_count != 1:
+                        raise ValueError(
+                            "Only one key may be given with an arrangement file."
+                        )
+                    keys.delete_field_column(grid_i.Field.TEST_FORM_CODE)
+                self.scorers[form_variant.name] = scoring.StreamingScorer(
+                    keys, [x for x in grid_i.Field],
+                    form_variant.num_questions, weights, arrangement_file,
+                    self.replace_empty_with, None)
+        self.caches = {
+            name: page_cache.PageCache(
+                page_cache.get_default_cache_dir(),
+                page_cache.get_options_key(form_variant, reading_options))
+            for name, form_variant in grid_i.FORM_VARIANTS.items()
+        } if use_cache else {}
+        self.pool = page_processing.create_pool(
+            grid_i.form_75q, None, pipeline_options,
+            reading_options) if pipeline_options.jobs > 1 else None
+        self.max_concurrent = (max_concurrent if max_concurrent is not None
+                               else pipeline_options.jobs)
+        self.queue_size = queue_size
+        self.stats = ServiceStats()
+        self._places = threading.Semaphore(self.max_concurrent)
+
+    def read(self, pages: tp.List[tp.Tuple[str, bytes]],
+             form_variant: grid_i.FormVariant) -> tp.List[tp.Dict[str, tp.Any]]:
+        """Read the given sheets, each given as its file name and contents,
+        once there is a place for them.
+
+        Raises ServerBusyError if too many requests are waiting already."""
+        with self.stats.lock:
+            if self.stats.active + self.stats.queued >= (self.max_concurrent +
+                                                         self.queue_size):
+                self.stats.busy_responses += 1
+                raise ServerBusyError()
+            self.stats.queued += 1
+        start = time.monotonic()
+        self._places.acquire()
+        with self.stats.lock:
+            self.stats.queued -= 1
+            self.stats.active += 1
+        try:
+            results = page_processing.read_page_data(pages, form_variant,
+                                                     self.reading_options,
+                                                     self.caches.get(
+                                                         form_variant.name),
+                                                     self.pool)
+            sheets = [
+                self.format_page(page, form_variant) for page in results
+            ]
+        finally:
+            self._places.release()
+            with self.stats.lock:
+                self.stats.active -= 1
+        with self.stats.lock:
+            self.stats.requests += 1
+            self.stats.sheets += len(results)
+            self.stats.rejected_sheets += sum(page.rejected
+                                              for page in results)
+            self.stats.latencies.append(time.monotonic() - start)
+        return sheets
+
+    def format_page(self, page: page_processing.PageResult,
+                    form_variant: grid_i.FormVariant) -> tp.Dict[str, tp.Any]:
+        """Format a sheet that was read as JSON: its `name`, whether it was
+        `rejected` and whether it `is_key`, and if it wasn't rejected, its
+        `fields` (by column name) and `answers`. If there are answer keys and
+        the sheet isn't one, also its `score` and `points`, or null if it
+        couldn't be scored."""
+        sheet: tp.Dict[str, tp.Any] = {
+            "name": page.image_name,
+            "rejected": page.rejected,
+            "is_key": page.is_key
+        }
+        if page.rejected:
+            return sheet
+        answers = answer_masks.format_answers(page.answer_masks,
+                                              self.multi_answers_as_f)
+        sheet["fields"] = {
+            data_exporting.COLUMN_NAMES[field]: value
+            for field, value in page.field_data.items()
+        }
+        sheet["answers"] = [
+            answer if answer else self.replace_empty_with
+            for answer in answers
+        ]
+        scorer = self.scorers.get(form_variant.name)
+        if scorer is not None and not page.is_key:
+            try:
+                score_row = scorer.score(page.field_data, answers).data[1]
+                num_fields = len(scorer.columns)
+                sheet["score"] = score_row[num_fields]
+                sheet["points"] = score_row[num_fields + 1]
+            except (ValueError, IndexError):
+                sheet["score"] = sheet["points"] = None
+        return sheet
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+        for cache in self.caches.values():
+            cache.evict()
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    server: "GradingServer"
+    protocol_version = "HTTP/1.1"
+
+    def send_json(self, status: int, body: tp.Any,
+                  headers: tp.Optional[tp.Dict[str, str]] = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, status: int, message: str):
+        self.send_json(status, {"error": message})
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == "/stats":
+            self.send_json(200, self.server.service.stats.to_json())
+        else:
+            self.send_error_json(404, f"There is no '{url.path}'.")
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # The body can't be told apart from the next request.
+            self.close_connection = True
+            self.send_error_json(400, "The Content-Length is invalid.")
+            return
+        if length > MAX_REQUEST_SIZE:
+            self.close_connection = True
+            self.send_error_json(413, "The request is too large.")
+            return
+        body = self.rfile.read(length)
+        if url.path not in ("/sheets", "/batches"):
+            self.send_error_json(404, f"There is no '{url.path}'.")
+            return
+
+        variant_name = query.get("variant", "75")
+        form_variant = grid_i.FORM_VARIANTS.get(variant_name + "q")
+        if form_variant is None:
+            self.send_error_json(400, f"There is no variant '{variant_name}'.")
+            return
+        try:
+            if url.path == "/sheets":
+                pages = [(query.get("name", "sheet"), body)]
+            else:
+                pages = [(str(sheet["name"]), base64.b64decode(sheet["data"]))
+                         for sheet in json.loads(body)["sheets"]]
+        except (ValueError, KeyError, TypeError, binascii.Error):
+            self.send_error_json(
+                400, 'The body must be JSON like {"sheets": [{"name": ..., '
+                '"data": <base64>}]}.')
+            return
+
+        service = self.server.service
+        try:
+            sheets = service.read(pages, form_variant)
+        except ServerBusyError:
+            self.send_error_json(503, "Too many requests are waiting.")
+            return
+        except Exception as e:
+            with service.stats.lock:
+                service.stats.errors += 1
+            self.send_error_json(500, str(e))
+            return
+        if url.path == "/sheets":
+            self.send_json(200, sheets[0])
+        else:
+            self.send_json(200, {"sheets": sheets})
+
+    def log_message(self, format: str, *args: tp.Any):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class GradingServer(http.server.ThreadingHTTPServer):
+    """An HTTP server on 127.0.0.1 that handles each request in its own thread
+    with a shared `GradingService`."""
+    service: GradingService
+    quiet: bool
+    daemon_threads = True
+
+    def __init__(self, port: int, service: GradingService,
+                 quiet: bool = False):
+        self.service = service
+        self.quiet = quiet
+        super().__init__(("127.0.0.1", port), RequestHandler)
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description='OpenMCR: Serve sheet reading over HTTP on 127.0.0.1.\n'
+                                                 'POST an image to /sheets?name=NAME&variant=75, or JSON with base64 images to\n'
+                                                 '/batches?variant=75, to get the fields, answers and scores of the sheets as JSON.\n'
+                                                 'GET /stats for counts and timings.',
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--port',
+                        default=DEFAULT_PORT,
+                        type=int,
+                        help=f'Port to listen on. Default is {DEFAULT_PORT}.')
+    parser.add_argument('--anskeys',
+                        help='Answer Keys CSV file path. If given, sheets are scored against it.',
+                        type=parse_path_arg)
+    parser.add_argument('--formmap',
+                        help='Form Arrangement Map CSV file path. If given, only one answer key may be provided.',
+                        type=parse_path_arg)
+    parser.add_argument('--weights',
+                        help='CSV file path with the points each question is worth, with columns named Q1 to QN and\n'
+                             'optionally a Test Form Code column. By default, every question is worth 1 point.',
+                        type=parse_path_arg)
+    parser.add_argument('-ml', '--multiple',
+                        action='store_true',
+                        help='Convert multiple answers in a question to F, instead of [A|B].')
+    parser.add_argument('-e', '--empty',
+                        action='store_true',
+                        help='Return empty answers as G. By default, they are empty strings.')
+    parser.add_argument('-j', '--jobs',
+                        default='auto',
+                        type=page_processing.parse_jobs_arg,
+                        help='Number of processes to read sheets with, or "auto" (default) for one per CPU.')
+    parser.add_argument('--max-concurrent',
+                        type=page_processing.parse_positive_int_arg,
+                        help='Most requests read at once. Default is the number of jobs.')
+    parser.add_argument('--queue-size',
+                        default=DEFAULT_QUEUE_SIZE,
+                        type=page_processing.parse_non_negative_int_arg,
+                        help='Most requests waiting to be read at once. Any more are answered with 503.\n'
+                             f'Default is {DEFAULT_QUEUE_SIZE}.')
+    parser.add_argument('--cache',
+                        action='store_true',
+                        help='Take sheets that were read before from the cache, instead of reading them again (see main.py --cache).')
+    parser.add_argument('--quiet',
+                        action='store_true',
+                        help='Do not log each request.')
+
+    args = parser.parse_args()
+
+    service = GradingService(args.multiple, args.empty, args.anskeys,
+                             args.formmap, args.weights,
+                             page_processing.PipelineOptions(args.jobs),
+                             page_processing.ReadingOptions(),
+                             args.max_concurrent, args.queue_size,
+                             args.cache)
+    server = GradingServer(args.port, service, args.quiet)
+    # Stop the same way when terminated as when interrupted.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f"Serving on http://127.0.0.1:{server.server_port}. Press Ctrl+C to stop.")
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
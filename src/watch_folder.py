@@ -0,0 +1,352 @@
+"""Watching a folder for new scans and reading them as they are added, for scan
+stations that save sheets to a folder all day.
+
+The folder is listed every `DEFAULT_POLL_INTERVAL` seconds. A new image file is
+read once its size and modification time haven't changed for the settle time,
+so files that are still being copied aren't read part way. Files that are added
+in a burst are read together, once no new file has been added for
+`DEFAULT_DEBOUNCE_TIME` or `DEFAULT_MAX_BATCH_SIZE` are ready. The worker
+processes are started once and kept for every batch.
+
+Each sheet read is added to the end of the results (or rejected files) in the
+output folder, which keep growing across runs, and then recorded in a journal
+there. Files in the journal aren't read again when watching is restarted.
+"""
+
+import argparse
+import json
+import multiprocessing.pool
+import os
+import pathlib
+import signal
+import threading
+import time
+import typing as tp
+
+import answer_masks
+import data_exporting
+import file_handling
+import grid_info as grid_i
+import page_cache
+import page_processing
+import scoring
+
+# Seconds between listings of the folder.
+DEFAULT_POLL_INTERVAL = 0.5
+# Seconds a file's size and modification time must stay the same before it is
+# read. Scanners and network copies write files in parts.
+DEFAULT_SETTLE_TIME = 1.0
+# Seconds without any new files before the files that are ready are read.
+DEFAULT_DEBOUNCE_TIME = 0.5
+# The most files read at once, so a long burst doesn't hold up the first ones.
+DEFAULT_MAX_BATCH_SIZE = 64
+JOURNAL_FILE = "processed_files.jsonl"
+
+# What a file is recognized by: its name, size and modification time. A file
+# that is replaced by another with the same name is read again.
+FileKey = tp.Tuple[str, int, int]
+
+
+def parse_settle_time_arg(settle_time_arg: str) -> float:
+    """Parse a `--settle-time` argument, which is a number of seconds that
+    isn't negative."""
+    try:
+        settle_time = float(settle_time_arg)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"'{settle_time_arg}' is not a number.")
+    if not settle_time >= 0:
+        raise argparse.ArgumentTypeError("Must be at least 0 seconds.")
+    return settle_time
+
+
+def get_file_key(path: pathlib.Path) -> FileKey:
+    stat = path.stat()
+    return (path.name, stat.st_size, stat.st_mtime_ns)
+
+
+class Journal():
+    """The files that have already been read, saved to a file with one JSON
+    list per line so that they survive restarts.
+
+    Members:
+        path: The journal file.
+        keys: The keys of the files in the journal.
+    """
+    path: pathlib.Path
+    keys: tp.Set[FileKey]
+    _file: tp.TextIO
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.keys = set()
+        if path.exists():
+            with open(str(path), encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        name, size, mtime_ns = json.loads(line)
+                    except ValueError:
+                        # The last line is cut off if writing it was
+                        # interrupted, so that file is read again.
+                        continue
+                    self.keys.add((name, size, mtime_ns))
+        self._file = open(str(path), "a", encoding="utf-8")
+
+    def __contains__(self, key: FileKey) -> bool:
+        return key in self.keys
+
+    def add(self, key: FileKey):
+        """Record a file as read. It is on disk when this returns."""
+        self._file.write(json.dumps(list(key)) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.keys.add(key)
+
+    def close(self):
+        self._file.close()
+
+
+class FolderWatcher():
+    """Finds the image files in a folder that are ready to be read.
+
+    Members:
+        folder: The folder to watch.
+        journal: The files that have already been read, which are skipped.
+        settle_time: Seconds a file must stay the same before it is ready.
+        debounce_time: Seconds without changes to the folder before ready files
+            are returned.
+        max_batch_size: The most files returned at once. If this many are
+            ready, they are returned without waiting for the folder to settle.
+    """
+    folder: pathlib.Path
+    journal: Journal
+    settle_time: float
+    debounce_time: float
+    max_batch_size: int
+    # The key of each file seen so far and when it was first seen with it.
+    _seen: tp.Dict[pathlib.Path, tp.Tuple[FileKey, float]]
+    _last_change: float
+
+    def __init__(self,
+                 folder: pathlib.Path,
+                 journal: Journal,
+                 settle_time: float = DEFAULT_SETTLE_TIME,
+                 debounce_time: float = DEFAULT_DEBOUNCE_TIME,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE):
+        if not settle_time >= 0:
+            raise ValueError("The settle time can't be negative.")
+        self.folder = folder
+        self.journal = journal
+        self.settle_time = settle_time
+        self.debounce_time = debounce_time
+        self.max_batch_size = max_batch_size
+        self._seen = {}
+        self._last_change = 0.0
+
+    def poll(self, now: tp.Optional[float] = None) -> tp.List[pathlib.Path]:
+        """List the folder, and return the files that are ready to be read in
+        the order they were added, if the folder has settled."""
+        now = now if now is not None else time.monotonic()
+        seen: tp.Dict[pathlib.Path, tp.Tuple[FileKey, float]] = {}
+        for path in file_handling.filter_images(
+                file_handling.list_file_paths(self.folder)):
+            try:
+                key = get_file_key(path)
+            except FileNotFoundError:
+                continue
+            if key in self.journal:
+                continue
+            previous = self._seen.get(path)
+            if previous is not None and previous[0] == key:
+                seen[path] = previous
+            else:
+                seen[path] = (key, now)
+                self._last_change = now
+        self._seen = seen
+
+        ready = sorted((since, path) for path, (_, since) in seen.items()
+                       if now - since >= self.settle_time)
+        if not ready or (now - self._last_change < self.debounce_time
+                         and len(ready) < self.max_batch_size):
+            return []
+        return [path for _, path in ready[:self.max_batch_size]]
+
+    def get_key(self, path: pathlib.Path) -> tp.Optional[FileKey]:
+        """Get the key a ready file had when it was returned by `poll`."""
+        seen = self._seen.get(path)
+        return seen[0] if seen is not None else None
+
+
+def watch_folder(input_folder: pathlib.Path,
+                 output_folder: pathlib.Path,
+                 multi_answers_as_f: bool,
+                 empty_answers_as_g: bool,
+                 keys_file: tp.Optional[pathlib.Path],
+                 arrangement_file: tp.Optional[pathlib.Path],
+                 form_variant: grid_i.FormVariant,
+                 pipeline_options: tp.Optional[
+                     page_processing.PipelineOptions] = None,
+                 reading_options: tp.Optional[
+                     page_processing.ReadingOptions] = None,
+                 weights_file: tp.Optional[pathlib.Path] = None,
+                 use_cache: bool = False,
+                 settle_time: float = DEFAULT_SETTLE_TIME,
+                 stop: tp.Optional[threading.Event] = None):
+    """Read the sheets in `input_folder` as they are added until `stop` is set,
+    or until the program is interrupted (Ctrl+C) or terminated.
+
+    The results, rejected files and keys read are added to the end of the
+    `results`, `rejected_files` and `keys` files in `output_folder`. Unlike
+    process_input, every question has a column and the rows aren't sorted. If
+    there is a `keys_file`, each exam is also scored as it is read, like with
+    `process_input(stream_scores=True)`; keys read from the sheets are saved
+    but not used.
+
+    When stopping, the sheet being saved is finished first. Sheets that were
+    still being read aren't in the journal, so they are read when watching is
+    restarted.
+    """
+    pipeline_options = (pipeline_options if pipeline_options is not None else
+                        page_processing.PipelineOptions())
+    reading_options = (reading_options if reading_options is not None else
+                       page_processing.ReadingOptions())
+    stop = stop if stop is not None else threading.Event()
+    data_exporting.make_dir_if_not_exists(output_folder)
+    replace_empty_with = "G" if empty_answers_as_g else ""
+
+    def request_stop(signal_number: int, frame: tp.Any):
+        print("Stopping after the sheet being saved...")
+        stop.set()
+
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGTERM, request_stop)
+
+    results_columns = [x for x in grid_i.Field]
+    keys_columns: tp.List[grid_i.RealOrVirtualField] = [
+        grid_i.Field.TEST_FORM_CODE, grid_i.Field.IMAGE_FILE
+    ]
+
+    def open_sheet(name: str, columns: tp.List[grid_i.RealOrVirtualField],
+                   num_questions: int) -> data_exporting.SheetWriter:
+        return data_exporting.SheetWriter(data_exporting.get_output_path(
+            output_folder, name, None),
+                                          columns,
+                                          num_questions,
+                                          flush_interval=1,
+                                          append=True)
+
+    results = open_sheet("results", results_columns,
+                         form_variant.num_questions)
+    rejected_files = open_sheet("rejected_files", [grid_i.Field.IMAGE_FILE],
+                                0)
+    keys_results = open_sheet("keys", keys_columns, form_variant.num_questions)
+    scorer: tp.Optional[scoring.StreamingScorer] = None
+    if keys_file:
+        keys = data_exporting.OutputSheet(keys_columns,
+                                          form_variant.num_questions)
+        keys.add_file(keys_file)
+        scores_name = "scores"
+        if arrangement_file:
+            if keys.row_count != 1:
+                raise ValueError(
+                    "Only one key may be given with an arrangement file.")
+            keys.delete_field_column(grid_i.Field.TEST_FORM_CODE)
+            scores_name = "rearranged_scores"
+        scorer = scoring.StreamingScorer(
+            keys, results_columns, form_variant.num_questions,
+            scoring.load_weights(weights_file) if weights_file else None,
+            arrangement_file, replace_empty_with,
+            data_exporting.get_output_path(output_folder, scores_name, None),
+            flush_interval=1,
+            append=True)
+
+    def save_page(page: page_processing.PageResult):
+        if page.rejected:
+            rejected_files.add({grid_i.Field.IMAGE_FILE: page.image_name}, [])
+            return
+        answers = answer_masks.format_answers(page.answer_masks,
+                                              multi_answers_as_f)
+        if page.is_key:
+            keys_results.add(page.field_data, answers)
+            return
+        # Empty answers are filled in for every question, as later rows can't
+        # change how many columns there are.
+        exam = data_exporting.OutputSheet(list(results_columns),
+                                          form_variant.num_questions)
+        exam.add(page.field_data, answers)
+        exam.clean_up(replace_empty_with,
+                      len(results_columns) + form_variant.num_questions)
+        results.add_sheet(exam)
+        if scorer is not None:
+            try:
+                scorer.add(page.field_data, answers)
+            except (ValueError, IndexError) as e:
+                print(f"'{page.image_name}' could not be scored: {e}")
+
+    journal = Journal(output_folder / JOURNAL_FILE)
+    watcher = FolderWatcher(input_folder, journal, settle_time)
+    cache = page_cache.PageCache(
+        page_cache.get_default_cache_dir(),
+        page_cache.get_options_key(form_variant,
+                                   reading_options)) if use_cache else None
+    pool = page_processing.create_pool(
+        form_variant, None, pipeline_options,
+        reading_options) if pipeline_options.jobs > 1 else None
+    read_count = 0
+
+    def read_files(paths: tp.List[pathlib.Path],
+                   pool: tp.Optional[multiprocessing.pool.Pool]):
+        nonlocal read_count
+        for path, page in zip(
+                paths,
+                page_processing.process_pages(paths,
+                                              form_variant,
+                                              options=pipeline_options,
+                                              reading_options=reading_options,
+                                              cache=cache,
+                                              pool=pool)):
+            save_page(page)
+            journal.add(tp.cast(FileKey, watcher.get_key(path)))
+            read_count += 1
+            print(f"Read '{path.name}'.")
+            if stop.is_set():
+                return
+
+    print(f"Watching '{input_folder}' for new sheets. Press Ctrl+C to stop.")
+    try:
+        while not stop.is_set():
+            paths = watcher.poll()
+            if not paths:
+                stop.wait(DEFAULT_POLL_INTERVAL)
+                continue
+            try:
+                read_files(paths, pool)
+            except Exception as e:
+                # A file that can't be read shouldn't stop the station, so the
+                # files that are left are read one at a time to find it.
+                print(f"Reading the new sheets failed ({e}), so they are read "
+                      "one at a time.")
+                for path in paths:
+                    key = watcher.get_key(path)
+                    if stop.is_set() or key is None or key in journal:
+                        continue
+                    try:
+                        read_files([path], None)
+                    except Exception as e:
+                        print(f"'{path.name}' could not be read: {e}")
+                        rejected_files.add(
+                            {grid_i.Field.IMAGE_FILE: path.name}, [])
+                        journal.add(key)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        for sheet in (results, rejected_files, keys_results):
+            sheet.finish(sort=False)
+        if scorer is not None:
+            scorer.finish(sort=False)
+        journal.close()
+        if cache is not None:
+            cache.evict()
+        print(f"Stopped watching after reading {read_count} sheets.")
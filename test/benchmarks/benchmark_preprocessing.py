@@ -0,0 +1,56 @@
+"""Compare the old color preprocessing path to the grayscale-native one.
+
+The old path decoded every page as 3-channel BGR, blurred all three channels,
+and only converted to grayscale when thresholding. The current path decodes
+straight to grayscale, so the blur only touches one channel.
+
+Usage: python test/benchmarks/benchmark_preprocessing.py [REPEATS]
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+current_dir = Path(__file__).parent
+sys.path.insert(0, str(current_dir.parent.parent / "src"))
+
+import file_handling  # noqa: E402
+import image_utils  # noqa: E402
+
+
+def color_path(data: bytes) -> np.ndarray:
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    without_noise = image_utils.remove_hf_noise(image)
+    return image_utils.threshold(without_noise)
+
+
+def grayscale_path(data: bytes) -> np.ndarray:
+    image = image_utils.decode_image(data)
+    return image_utils.prepare_scan_for_processing(image)
+
+
+def time_per_page(fn, pages, repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for page in pages:
+            fn(page)
+    return (time.perf_counter() - start) * 1000 / (repeats * len(pages))
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    corpora_dir = current_dir.parent / "end-to-end"
+    print(f"{'corpus':<20}{'pages':>6}{'color ms':>10}{'gray ms':>10}{'saved':>8}")
+    for corpus in sorted(corpora_dir.iterdir()):
+        input_dir = corpus / "input"
+        if not input_dir.is_dir():
+            continue
+        paths = file_handling.filter_images(file_handling.list_file_paths(input_dir))
+        pages = [image_utils.read_image_bytes(path) for path in paths]
+        color_ms = time_per_page(color_path, pages, repeats)
+        gray_ms = time_per_page(grayscale_path, pages, repeats)
+        saved = 1 - gray_ms / color_ms
+        print(f"{corpus.name:<20}{len(pages):>6}{color_ms:>10.1f}{gray_ms:>10.1f}{saved:>8.0%}")
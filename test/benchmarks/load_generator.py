@@ -0,0 +1,157 @@
+"""Send sheets to the grading server (`src/server.py`) from many clients at
+once, and report the throughput and latencies seen by the clients along with
+the server's own /stats.
+
+By default the sheets are the 75 question images in the end-to-end corpora, and
+a server is started for the run on a free port and stopped afterwards. Pass
+--url to load a server that is already running instead.
+
+Usage: python test/benchmarks/load_generator.py [--requests 200]
+    [--concurrency 8] [--batch-size 1] [--jobs 2] [--url URL]
+"""
+
+import argparse
+import base64
+import concurrent.futures
+import json
+import socket
+import subprocess
+import sys
+import time
+import typing as tp
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+
+current_dir = Path(__file__).parent
+src_dir = current_dir.parent.parent / "src"
+sys.path.insert(0, str(src_dir))
+
+import file_handling  # noqa: E402
+import image_utils  # noqa: E402
+
+
+def load_sheets(variant: str) -> tp.List[tp.Tuple[str, bytes]]:
+    sheets = []
+    for corpus in sorted((current_dir.parent / "end-to-end").iterdir()):
+        args_path = corpus / "args.txt"
+        args = args_path.read_text() if args_path.exists() else ""
+        if ("--variant 150" in args) != (variant == "150"):
+            continue
+        input_dir = corpus / "input"
+        if not input_dir.is_dir():
+            continue
+        for path in file_handling.filter_images(
+                file_handling.list_file_paths(input_dir)):
+            sheets.append((path.name, image_utils.read_image_bytes(path)))
+    return sheets
+
+
+def send(url: str, sheets: tp.List[tp.Tuple[str, bytes]],
+         variant: str) -> tp.Tuple[int, float]:
+    """Send one request, returning its status and how long it took."""
+    if len(sheets) == 1:
+        name, data = sheets[0]
+        query = urllib.parse.urlencode({"name": name, "variant": variant})
+        request = urllib.request.Request(f"{url}/sheets?{query}", data=data)
+    else:
+        body = {
+            "sheets": [{
+                "name": name,
+                "data": base64.b64encode(data).decode("ascii")
+            } for name, data in sheets]
+        }
+        request = urllib.request.Request(f"{url}/batches?variant={variant}",
+                                         data=json.dumps(body).encode(),
+                                         headers={
+                                             "Content-Type": "application/json"
+                                         })
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - start
+
+
+def get_stats(url: str) -> tp.Dict[str, tp.Any]:
+    with urllib.request.urlopen(f"{url}/stats") as response:
+        return json.loads(response.read())
+
+
+def start_server(jobs: int, extra_args: tp.List[str]
+                 ) -> tp.Tuple[subprocess.Popen, str]:
+    with socket.socket() as free_socket:
+        free_socket.bind(("127.0.0.1", 0))
+        port = free_socket.getsockname()[1]
+    process = subprocess.Popen([
+        sys.executable,
+        str(src_dir / "server.py"), "--port",
+        str(port), "--jobs",
+        str(jobs), "--quiet"
+    ] + extra_args)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(600):
+        try:
+            get_stats(url)
+            return process, url
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("The server didn't start.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="URL of a server that is already running.")
+    parser.add_argument("--jobs", default=2, type=int,
+                        help="Jobs for the server started for the run.")
+    parser.add_argument("--cache", action="store_true",
+                        help="Start the server with --cache, so sheets sent before are taken from it.")
+    parser.add_argument("--requests", default=200, type=int)
+    parser.add_argument("--concurrency", default=8, type=int)
+    parser.add_argument("--batch-size", default=1, type=int)
+    parser.add_argument("--variant", default="75", choices=["75", "150"])
+    args = parser.parse_args()
+
+    sheets = load_sheets(args.variant)
+    process = None
+    if args.url:
+        url = args.url.rstrip("/")
+    else:
+        process, url = start_server(
+            args.jobs, ["--cache"] if args.cache else [])
+    try:
+        batches = [[
+            sheets[(i * args.batch_size + j) % len(sheets)]
+            for j in range(args.batch_size)
+        ] for i in range(args.requests)]
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(args.concurrency) as pool:
+            outcomes = list(
+                pool.map(lambda batch: send(url, batch, args.variant),
+                         batches))
+        elapsed = time.perf_counter() - start
+
+        statuses: tp.Dict[int, int] = {}
+        for status, _ in outcomes:
+            statuses[status] = statuses.get(status, 0) + 1
+        latencies = np.array([latency for _, latency in outcomes]) * 1000
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        sent = args.requests * args.batch_size
+        print(f"{args.requests} requests of {args.batch_size} sheets with "
+              f"{args.concurrency} clients in {elapsed:.2f}s "
+              f"({sent / elapsed:.1f} sheets/s)")
+        print(f"statuses: {statuses}")
+        print(f"latency ms: p50 {p50:.1f}  p95 {p95:.1f}  p99 {p99:.1f}  "
+              f"max {latencies.max():.1f}")
+        print(f"server stats: {json.dumps(get_stats(url))}")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
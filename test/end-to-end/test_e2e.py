@@ -1,3 +1,4 @@
+import shutil
 import subprocess
 from pathlib import Path
 import sys
@@ -32,3 +33,23 @@ def test_e2e(path: Path):
         expected_output_file = expected_output_path / actual_output_file.name
         expected_output = expected_output_file.read_text()
         assert actual_output == expected_output
+
+
+def test_failed_run_leaves_no_partial_files(tmp_path: Path):
+    # Every sheet is rejected, so there are no results to save.
+    input_path = tmp_path / "input"
+    input_path.mkdir()
+    shutil.copy(str(current_dir / "rejected-file" / "input" / "reject.png"), str(input_path))
+    output_path = tmp_path / "output"
+    output_path.mkdir()
+
+    output = subprocess.check_output([
+      sys.executable or 'python',
+      str(open_mcr_path),
+      str(input_path),
+      str(output_path),
+      "--disable-timestamp"
+    ], text=True)
+
+    assert "Error:" in output
+    assert list(output_path.iterdir()) == []
@@ -0,0 +1,155 @@
+import os
+import shutil
+import subprocess
+from pathlib import Path
+import sys
+import typing as tp
+
+current_dir = Path(__file__).parent
+src_dir = current_dir.parent.parent / "src"
+open_mcr_path = src_dir / "main.py"
+sys.path.insert(0, str(src_dir))
+
+import grid_info  # noqa: E402
+import page_cache  # noqa: E402
+import page_processing  # noqa: E402
+
+dataset_path = current_dir / "75q-core-3"
+
+
+def copy_images(destination: Path, count: int) -> tp.List[Path]:
+    destination.mkdir()
+    paths = []
+    for image_path in sorted((dataset_path / "input").iterdir())[:count]:
+        shutil.copy(str(image_path), str(destination))
+        paths.append(destination / image_path.name)
+    return paths
+
+
+def create_cache(directory: Path,
+                 reading_options: tp.Optional[page_processing.ReadingOptions] = None
+                 ) -> page_cache.PageCache:
+    reading_options = reading_options if reading_options is not None else page_processing.ReadingOptions()
+    return page_cache.PageCache(directory, page_cache.get_options_key(grid_info.form_75q, reading_options))
+
+
+def read_pages(paths: tp.List[Path], cache: page_cache.PageCache,
+               reading_options: tp.Optional[page_processing.ReadingOptions] = None
+               ) -> tp.List[page_processing.PageResult]:
+    return list(page_processing.process_pages(paths, grid_info.form_75q, reading_options=reading_options, cache=cache))
+
+
+def test_cache_hit(tmp_path: Path):
+    paths = copy_images(tmp_path / "input", 3)
+    cache = create_cache(tmp_path / "cache")
+    read = read_pages(paths, cache)
+    assert cache.hits == 0
+    assert not any(page.from_cache for page in read)
+
+    cache = create_cache(tmp_path / "cache")
+    cached = read_pages(paths, cache)
+    assert cache.hits == 3
+    for read_page, cached_page in zip(read, cached):
+        assert cached_page.from_cache
+        assert cached_page.image_name == read_page.image_name
+        assert cached_page.field_data == read_page.field_data
+        assert cached_page.contours_dropped == read_page.contours_dropped
+        assert (cached_page.answer_masks == read_page.answer_masks).all()
+
+
+def test_cache_hit_after_rename(tmp_path: Path):
+    paths = copy_images(tmp_path / "input", 1)
+    read_pages(paths, create_cache(tmp_path / "cache"))
+    renamed_path = paths[0].with_name("renamed.jpg")
+    paths[0].rename(renamed_path)
+
+    cache = create_cache(tmp_path / "cache")
+    cached = read_pages([renamed_path], cache)
+    assert cache.hits == 1
+    assert cached[0].image_name == "renamed.jpg"
+    assert cached[0].field_data[grid_info.Field.IMAGE_FILE] == "renamed.jpg"
+
+
+def test_cache_miss_on_changed_file(tmp_path: Path):
+    paths = copy_images(tmp_path / "input", 2)
+    read_pages(paths, create_cache(tmp_path / "cache"))
+    with open(str(paths[0]), "ab") as file:
+        file.write(b"\0")
+
+    cache = create_cache(tmp_path / "cache")
+    read_pages(paths, cache)
+    assert cache.hits == 1
+
+
+def test_cache_miss_on_other_options(tmp_path: Path):
+    paths = copy_images(tmp_path / "input", 1)
+    read_pages(paths, create_cache(tmp_path / "cache"))
+
+    reading_options = page_processing.ReadingOptions(working_size=2000)
+    cache = create_cache(tmp_path / "cache", reading_options)
+    read_pages(paths, cache, reading_options)
+    assert cache.hits == 0
+
+
+def test_cache_miss_on_other_code(tmp_path: Path, monkeypatch: tp.Any):
+    paths = copy_images(tmp_path / "input", 1)
+    read_pages(paths, create_cache(tmp_path / "cache"))
+
+    monkeypatch.setattr(page_cache, "get_code_version", lambda: "changed")
+    cache = create_cache(tmp_path / "cache")
+    read_pages(paths, cache)
+    assert cache.hits == 0
+
+
+def test_damaged_entry_is_read_again(tmp_path: Path):
+    paths = copy_images(tmp_path / "input", 1)
+    read_pages(paths, create_cache(tmp_path / "cache"))
+    entry_paths = list((tmp_path / "cache").glob("*/*.npz"))
+    assert len(entry_paths) == 1
+    entry_paths[0].write_bytes(b"damaged")
+
+    cache = create_cache(tmp_path / "cache")
+    read_pages(paths, cache)
+    assert cache.hits == 0
+    cache = create_cache(tmp_path / "cache")
+    read_pages(paths, cache)
+    assert cache.hits == 1
+
+
+def test_evict(tmp_path: Path):
+    paths = copy_images(tmp_path / "input", 3)
+    cache = create_cache(tmp_path / "cache")
+    read_pages(paths, cache)
+    entry_paths = sorted((tmp_path / "cache").glob("*/*.npz"))
+    for age, entry_path in enumerate(entry_paths):
+        os.utime(str(entry_path), (1000 + age, 1000 + age))
+    cache.max_size = entry_paths[-1].stat().st_size
+    cache.evict()
+    assert list((tmp_path / "cache").glob("*/*.npz")) == [entry_paths[-1]]
+
+
+def test_cache_is_opt_in(tmp_path: Path):
+    copy_images(tmp_path / "input", 3)
+    environment = dict(os.environ, XDG_CACHE_HOME=str(tmp_path / "user-cache"))
+    environment.pop("LOCALAPPDATA", None)
+
+    def run(name: str, cache_args: tp.List[str]) -> str:
+        output_path = tmp_path / name
+        output_path.mkdir()
+        return subprocess.check_output([
+          sys.executable or 'python',
+          str(open_mcr_path),
+          str(tmp_path / "input"),
+          str(output_path),
+          "--disable-timestamp",
+          "--sort"
+        ] + cache_args, env=environment, text=True)
+
+    run("uncached", [])
+    assert not (tmp_path / "user-cache").exists()
+    run("first", ["--cache"])
+    assert "from the cache" not in run("without-cache", [])
+    assert "3 of 3 files were read before" in run("cached", ["--cache"])
+    expected_results = (tmp_path / "uncached" / "results.csv").read_text()
+    for name in ["first", "without-cache", "cached"]:
+        assert (tmp_path / name / "results.csv").read_text() == expected_results
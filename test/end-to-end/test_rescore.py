@@ -0,0 +1,75 @@
+import subprocess
+from pathlib import Path
+import sys
+import typing as tp
+import pytest
+
+current_dir = Path(__file__).parent
+src_dir = current_dir.parent.parent / "src"
+open_mcr_path = src_dir / "main.py"
+rescore_path = src_dir / "rescore.py"
+sys.path.insert(0, str(src_dir))
+
+import fill_store  # noqa: E402
+import grid_info  # noqa: E402
+
+# The arguments of main.py that rescore.py also takes, and how many values
+# each one has. The others only change how the sheets are read.
+RESCORE_ARGS = {"--anskeys": 1, "--formmap": 1, "--weights": 1, "--multiple": 0, "-ml": 0, "--empty": 0, "-e": 0}
+
+
+def get_rescore_args(args: tp.List[str]) -> tp.List[str]:
+    rescore_args = []
+    i = 0
+    while i < len(args):
+        value_count = RESCORE_ARGS.get(args[i])
+        if value_count is None:
+            i += 1
+            continue
+        rescore_args += args[i:i + value_count + 1]
+        i += value_count + 1
+    return rescore_args
+
+
+@pytest.mark.parametrize("path", [path for path in current_dir.iterdir() if path.is_dir() and path.name != "__pycache__"])
+def test_rescore(path: Path, tmp_path: Path):
+    input_path = str(path / "input")
+    additional_args_path = path / "args.txt"
+    additional_raw_args = additional_args_path.read_text().split() if additional_args_path.exists() else []
+    additional_args = [arg.replace("$$INPUT_DIR$$", f"{input_path}/") for arg in additional_raw_args]
+
+    read_output_path = tmp_path / "read"
+    read_output_path.mkdir()
+    store_path = tmp_path / "store"
+    subprocess.check_call([
+      sys.executable or 'python',
+      str(open_mcr_path),
+      input_path,
+      str(read_output_path),
+      "--disable-timestamp",
+      "--sort",
+      "--fill-store",
+      str(store_path)
+    ] + additional_args)
+
+    rescored_output_path = tmp_path / "rescored"
+    rescored_output_path.mkdir()
+    subprocess.check_call([
+      sys.executable or 'python',
+      str(rescore_path),
+      str(store_path),
+      str(rescored_output_path),
+      "--disable-timestamp",
+      "--sort"
+    ] + get_rescore_args(additional_args))
+
+    read_files = sorted(file.name for file in read_output_path.iterdir())
+    assert sorted(file.name for file in rescored_output_path.iterdir()) == read_files
+    for name in read_files:
+        assert (rescored_output_path / name).read_text() == (read_output_path / name).read_text()
+
+
+def test_unfinished_store_is_not_opened(tmp_path: Path):
+    fill_store.FillStoreWriter(tmp_path, grid_info.form_75q, ["a.jpg"])
+    with pytest.raises(ValueError):
+        fill_store.open_fill_store(tmp_path)
@@ -0,0 +1,190 @@
+import base64
+import csv
+import http.client
+import json
+import threading
+import time
+from pathlib import Path
+import sys
+import typing as tp
+import pytest
+
+current_dir = Path(__file__).parent
+src_dir = current_dir.parent.parent / "src"
+sys.path.insert(0, str(src_dir))
+
+import page_processing  # noqa: E402
+import server  # noqa: E402
+
+dataset_path = current_dir / "75q-core-3"
+
+
+def read_rows(path: Path) -> tp.Dict[str, tp.Dict[str, str]]:
+    with open(str(path), newline='') as file:
+        return {row["Source File"]: row for row in csv.DictReader(file)}
+
+
+def read_image(name: str) -> bytes:
+    return (dataset_path / "input" / name).read_bytes()
+
+
+class RunningServer():
+    """A server handling requests in another thread, and how to send them."""
+    service: server.GradingService
+    server: server.GradingServer
+    thread: threading.Thread
+
+    def __init__(self, service: server.GradingService):
+        self.service = service
+        self.server = server.GradingServer(0, service, quiet=True)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def request(self, method: str, path: str, body: bytes = b"",
+                headers: tp.Optional[tp.Dict[str, str]] = None) -> tp.Tuple[int, tp.Any]:
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.server_port, timeout=60)
+        try:
+            if headers is None:
+                connection.request(method, path, body)
+            else:
+                # Send the headers as given, without a Content-Length for the
+                # body.
+                connection.putrequest(method, path, skip_accept_encoding=True)
+                for name, value in headers.items():
+                    connection.putheader(name, value)
+                connection.endheaders(body)
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.service.close()
+
+
+def start_server(keys_file: tp.Optional[Path] = None, **kwargs: tp.Any) -> RunningServer:
+    return RunningServer(server.GradingService(False, False, keys_file, None, None,
+                                               page_processing.PipelineOptions(1),
+                                               page_processing.ReadingOptions(), **kwargs))
+
+
+@pytest.fixture
+def running_server() -> tp.Iterator[RunningServer]:
+    running = start_server(dataset_path / "output" / "keys.csv")
+    yield running
+    running.stop()
+
+
+def assert_matches_results(sheet: tp.Dict[str, tp.Any], name: str):
+    """Check that a sheet was read like the dataset's results, or keys if it
+    is a key."""
+    results_name = "keys.csv" if sheet["is_key"] else "results.csv"
+    expected_row = read_rows(dataset_path / "output" / results_name)[name]
+    assert sheet["name"] == name
+    assert not sheet["rejected"]
+    for column, value in sheet["fields"].items():
+        assert expected_row[column] == value
+    for question, answer in enumerate(sheet["answers"]):
+        assert expected_row.get(f"Q{question + 1}", "") == answer
+
+
+def test_sheets(running_server: RunningServer):
+    status, sheet = running_server.request("POST", "/sheets?name=7.jpg&variant=75", read_image("7.jpg"))
+    assert status == 200
+    assert_matches_results(sheet, "7.jpg")
+    assert not sheet["is_key"]
+    expected_scores = read_rows(dataset_path / "output" / "scores.csv")["7.jpg"]
+    assert sheet["score"] == expected_scores["Total Score (%)"]
+    assert sheet["points"] == expected_scores["Total Points"]
+
+
+def test_batches(running_server: RunningServer):
+    names = ["7.jpg", "1.jpg", "11.jpg"]
+    body = json.dumps({
+        "sheets": [{"name": name, "data": base64.b64encode(read_image(name)).decode("ascii")} for name in names]
+    }).encode("utf-8")
+    status, response = running_server.request("POST", "/batches", body)
+    assert status == 200
+    assert [sheet["name"] for sheet in response["sheets"]] == names
+    for sheet in response["sheets"]:
+        assert_matches_results(sheet, sheet["name"])
+    assert [sheet["is_key"] for sheet in response["sheets"]] == [False, False, True]
+    assert response["sheets"][0]["score"] == read_rows(dataset_path / "output" / "scores.csv")["7.jpg"]["Total Score (%)"]
+    assert "score" not in response["sheets"][2]
+
+    status, stats = running_server.request("GET", "/stats")
+    assert status == 200
+    assert stats["requests"] == 1
+    assert stats["sheets"] == 3
+
+
+def test_sheet_that_is_not_an_image(running_server: RunningServer):
+    status, sheet = running_server.request("POST", "/sheets?name=a.txt", b"not an image")
+    assert status == 200
+    assert sheet == {"name": "a.txt", "rejected": True, "is_key": False}
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/sheets?variant=99", b""),
+    ("/batches", b"not json"),
+    ("/batches", b'{"sheets": 5}'),
+    ("/batches", b'{"sheets": [{"name": "a.jpg"}]}'),
+    ("/batches", b'{"sheets": [{"name": "a.jpg", "data": "a"}]}'),
+])
+def test_bad_request(running_server: RunningServer, path: str, body: bytes):
+    status, response = running_server.request("POST", path, body)
+    assert status == 400
+    assert "error" in response
+
+
+@pytest.mark.parametrize("content_length", ["-1", "abc"])
+def test_bad_content_length(running_server: RunningServer, content_length: str):
+    status, response = running_server.request("POST", "/sheets", b"", {"Content-Length": content_length})
+    assert status == 400
+    assert "error" in response
+
+
+def test_too_large(running_server: RunningServer):
+    status, _ = running_server.request("POST", "/sheets", b"",
+                                       {"Content-Length": str(server.MAX_REQUEST_SIZE + 1)})
+    assert status == 413
+
+
+@pytest.mark.parametrize("method, path", [("GET", "/sheets"), ("POST", "/stats"), ("POST", "/other")])
+def test_not_found(running_server: RunningServer, method: str, path: str):
+    status, _ = running_server.request(method, path)
+    assert status == 404
+
+
+def test_busy():
+    running = start_server(max_concurrent=1, queue_size=0)
+    try:
+        # Take the only place, so the first request waits for it.
+        running.service._places.acquire()
+        waiting: tp.List[tp.Tuple[int, tp.Any]] = []
+        thread = threading.Thread(
+            target=lambda: waiting.append(running.request("POST", "/sheets?name=7.jpg", read_image("7.jpg"))))
+        thread.start()
+        deadline = time.monotonic() + 10
+        while running.service.stats.queued == 0:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+        status, _ = running.request("POST", "/sheets?name=1.jpg", read_image("1.jpg"))
+        assert status == 503
+        running.service._places.release()
+        thread.join()
+        assert waiting[0][0] == 200
+        assert running.service.stats.busy_responses == 1
+    finally:
+        running.stop()
+
+
+@pytest.mark.parametrize("kwargs", [{"max_concurrent": 0}, {"max_concurrent": -1}, {"queue_size": -1}])
+def test_invalid_limits(kwargs: tp.Dict[str, int]):
+    with pytest.raises(ValueError):
+        server.GradingService(False, False, None, None, None, page_processing.PipelineOptions(1),
+                              page_processing.ReadingOptions(), **kwargs)
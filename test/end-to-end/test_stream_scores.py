@@ -0,0 +1,47 @@
+import csv
+import shutil
+import subprocess
+from pathlib import Path
+import sys
+import pytest
+
+current_dir = Path(__file__).parent
+open_mcr_path = current_dir.parent.parent / "src" / "main.py"
+
+
+def read_key_image_names(keys_path: Path) -> set:
+    with open(str(keys_path), newline='') as file:
+        return {row["Source File"] for row in csv.DictReader(file)}
+
+
+# The datasets with keys. Their keys are given with --anskeys and their key
+# sheets are left out, as reading a key sheet stops scores being streamed.
+@pytest.mark.parametrize("path", [path for path in current_dir.iterdir() if (path / "output" / "keys.csv").exists()])
+def test_stream_scores(path: Path, tmp_path: Path):
+    keys_path = path / "output" / "keys.csv"
+    key_image_names = read_key_image_names(keys_path)
+    input_path = tmp_path / "input"
+    input_path.mkdir()
+    for image_path in (path / "input").iterdir():
+        if image_path.name not in key_image_names:
+            shutil.copy(str(image_path), str(input_path))
+    additional_args_path = path / "args.txt"
+    additional_args = additional_args_path.read_text().split() if additional_args_path.exists() else []
+
+    for name, stream_args in [("batch", []), ("streamed", ["--stream-scores"])]:
+        output_path = tmp_path / name
+        output_path.mkdir()
+        subprocess.check_call([
+          sys.executable or 'python',
+          str(open_mcr_path),
+          str(input_path),
+          str(output_path),
+          "--disable-timestamp",
+          "--sort",
+          "--anskeys",
+          str(keys_path)
+        ] + additional_args + stream_args)
+
+    batch_scores = (tmp_path / "batch" / "scores.csv").read_text()
+    streamed_scores = (tmp_path / "streamed" / "scores.csv").read_text()
+    assert streamed_scores == batch_scores
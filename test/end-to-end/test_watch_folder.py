@@ -0,0 +1,172 @@
+import csv
+import shutil
+import subprocess
+import threading
+import time
+from pathlib import Path
+import sys
+import typing as tp
+import pytest
+
+current_dir = Path(__file__).parent
+src_dir = current_dir.parent.parent / "src"
+open_mcr_path = src_dir / "main.py"
+sys.path.insert(0, str(src_dir))
+
+import grid_info  # noqa: E402
+import watch_folder  # noqa: E402
+
+dataset_path = current_dir / "75q-core-3"
+
+# Seconds to wait for the watched sheets to be read before giving up.
+READ_TIMEOUT = 60
+
+
+def create_watcher(folder: Path, journal: watch_folder.Journal, **kwargs: tp.Any) -> watch_folder.FolderWatcher:
+    folder.mkdir(exist_ok=True)
+    return watch_folder.FolderWatcher(folder, journal, **kwargs)
+
+
+def add_image(folder: Path, name: str) -> Path:
+    folder.mkdir(exist_ok=True)
+    shutil.copy(str(dataset_path / "input" / name), str(folder / name))
+    return folder / name
+
+
+def read_rows(path: Path) -> tp.List[tp.List[str]]:
+    if not path.exists():
+        return []
+    with open(str(path), newline='') as file:
+        return list(csv.reader(file))[1:]
+
+
+def test_watcher_waits_for_files_to_settle(tmp_path: Path):
+    journal = watch_folder.Journal(tmp_path / "journal.jsonl")
+    watcher = create_watcher(tmp_path / "input", journal, settle_time=1, debounce_time=0)
+    path = add_image(tmp_path / "input", "1.jpg")
+    assert watcher.poll(0) == []
+    assert watcher.poll(0.5) == []
+    # Still being written.
+    with open(str(path), "ab") as file:
+        file.write(b"\0")
+    assert watcher.poll(1) == []
+    assert watcher.poll(1.5) == []
+    assert watcher.poll(2) == [path]
+    journal.close()
+
+
+def test_watcher_rejects_negative_settle_time(tmp_path: Path):
+    journal = watch_folder.Journal(tmp_path / "journal.jsonl")
+    with pytest.raises(ValueError):
+        create_watcher(tmp_path / "input", journal, settle_time=-1)
+    journal.close()
+
+
+def test_watcher_waits_for_bursts_to_end(tmp_path: Path):
+    journal = watch_folder.Journal(tmp_path / "journal.jsonl")
+    watcher = create_watcher(tmp_path / "input", journal, settle_time=0.5, debounce_time=0.5)
+    first_path = add_image(tmp_path / "input", "1.jpg")
+    assert watcher.poll(0) == []
+    second_path = add_image(tmp_path / "input", "2.jpg")
+    assert watcher.poll(0.8) == []
+    assert watcher.poll(1.3) == [first_path, second_path]
+    journal.close()
+
+
+def test_watcher_limits_batch_size(tmp_path: Path):
+    journal = watch_folder.Journal(tmp_path / "journal.jsonl")
+    watcher = create_watcher(tmp_path / "input", journal, settle_time=0, debounce_time=10, max_batch_size=2)
+    assert watcher.poll(0) == []
+    paths = [add_image(tmp_path / "input", name) for name in ["1.jpg", "2.jpg", "3.jpg"]]
+    assert watcher.poll(1) == paths[:2]
+    journal.close()
+
+
+def test_watcher_skips_journaled_files(tmp_path: Path):
+    journal = watch_folder.Journal(tmp_path / "journal.jsonl")
+    first_path = add_image(tmp_path / "input", "1.jpg")
+    second_path = add_image(tmp_path / "input", "2.jpg")
+    journal.add(watch_folder.get_file_key(first_path))
+    journal.close()
+
+    journal = watch_folder.Journal(tmp_path / "journal.jsonl")
+    assert watch_folder.get_file_key(first_path) in journal
+    watcher = create_watcher(tmp_path / "input", journal, settle_time=0, debounce_time=0)
+    assert watcher.poll(0) == [second_path]
+    journal.close()
+
+
+def test_journal_ignores_cut_off_line(tmp_path: Path):
+    journal_path = tmp_path / "journal.jsonl"
+    journal = watch_folder.Journal(journal_path)
+    journal.add(("1.jpg", 1, 2))
+    journal.close()
+    with open(str(journal_path), "a") as file:
+        file.write('["2.jpg", 3')
+
+    journal = watch_folder.Journal(journal_path)
+    assert journal.keys == {("1.jpg", 1, 2)}
+    journal.close()
+
+
+def watch_until_read(input_path: Path, output_path: Path, count: int):
+    """Watch the folder in another thread until `count` results have been
+    saved, then stop."""
+    stop = threading.Event()
+    thread = threading.Thread(target=watch_folder.watch_folder,
+                              args=(input_path, output_path, False, False, None, None, grid_info.form_75q),
+                              kwargs={"settle_time": 0.1, "stop": stop})
+    thread.start()
+    try:
+        deadline = time.monotonic() + READ_TIMEOUT
+        while len(read_rows(output_path / "results.csv")) < count:
+            assert time.monotonic() < deadline, "The sheets were not read in time."
+            time.sleep(0.1)
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_watch_folder(tmp_path: Path):
+    input_path = tmp_path / "input"
+    output_path = tmp_path / "output"
+    for name in ["1.jpg", "2.jpg"]:
+        add_image(input_path, name)
+    watch_until_read(input_path, output_path, 2)
+
+    # Restarting only reads the sheet that was added since.
+    add_image(input_path, "3.jpg")
+    watch_until_read(input_path, output_path, 3)
+
+    expected_rows = {row[6]: row for row in read_rows(dataset_path / "output" / "results.csv")}
+    rows = read_rows(output_path / "results.csv")
+    assert sorted(row[6] for row in rows) == ["1.jpg", "2.jpg", "3.jpg"]
+    for row in rows:
+        expected_row = expected_rows[row[6]]
+        # Every question has a column, while the batch results drop the ones
+        # that every exam left blank at the end.
+        assert row[:len(expected_row)] == expected_row
+        assert not any(row[len(expected_row):])
+    assert len((output_path / watch_folder.JOURNAL_FILE).read_text().splitlines()) == 3
+
+
+@pytest.mark.parametrize("args", [
+    ["--sort"],
+    ["--mcta"],
+    ["--debug"],
+    ["--disable-timestamps"],
+    ["--stream-scores"],
+    ["--fill-store", "store"],
+    ["--settle-time", "-1"],
+])
+def test_watch_arguments_are_checked(tmp_path: Path, args: tp.List[str]):
+    result = subprocess.run([
+      sys.executable or 'python',
+      str(open_mcr_path),
+      str(tmp_path / "input"),
+      str(tmp_path / "output"),
+      "--watch"
+    ] + args, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 2
+    assert args[0] in result.stderr
+    assert not (tmp_path / "output").exists()